@@ -11,7 +11,8 @@ const Cell = ({
 	value: CellContent
 	is_game_finished: boolean
 }) => {
-	const { handleCellClick, handleFlipFlag } = useContext(GameContext) || {}
+	const { handleCellClick, handleFlipFlag, handleChord } =
+		useContext(GameContext) || {}
 
 	const getValueToDisplay = (value: CellContent) => {
 		const { is_revealed, is_flagged, is_mine } = value
@@ -44,9 +45,12 @@ const Cell = ({
 
 	const handleClick = () => {
 		const { row, column, is_revealed, is_flagged } = value
-		if (is_game_finished || !handleCellClick || is_revealed || is_flagged)
+		if (is_game_finished || is_flagged) return
+		if (is_revealed) {
+			if (handleChord && value.adjacent_mines > 0) handleChord(row, column)
 			return
-		handleCellClick(row, column)
+		}
+		if (handleCellClick) handleCellClick(row, column)
 	}
 
 	const handleRightClick = (event: React.MouseEvent) => {
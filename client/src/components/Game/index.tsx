@@ -6,6 +6,9 @@ import { GameMapState } from "../../types"
 import "./style.css"
 import GameContext, { GameContextType } from "../../contexts/GameContext"
 
+// Well within the presence expiry of the server (GAME_PRESENCE_TTL_SECONDS)
+const HEARTBEAT_INTERVAL_MS = 10000
+
 const Game = () => {
 	const { code } = useParams()
 	const [gameData, setGameData] = useState<GameMapState | null>(null)
@@ -33,7 +36,16 @@ const Game = () => {
 				const gameMap = data["map"]
 				setGameData(gameMap)
 			} else if (messageType === "user.list") {
-				setUsersConnected(data["users"])
+				// The whole list on connect, then the users that joined or left
+				if (data["users"]) {
+					setUsersConnected(data["users"])
+				} else {
+					const changed = [...data["joined"], ...data["left"]]
+					setUsersConnected((users) => [
+						...users.filter((user) => !changed.includes(user)),
+						...data["joined"],
+					])
+				}
 			}
 		}
 
@@ -42,8 +54,16 @@ const Game = () => {
 			setIsWsConnected(true)
 		}
 
+		// Keep the connection listed as connected, it expires without heartbeats
+		const heartbeat = setInterval(() => {
+			if (ws.current?.readyState === WebSocket.OPEN) {
+				ws.current.send(JSON.stringify({ type: "heartbeat" }))
+			}
+		}, HEARTBEAT_INTERVAL_MS)
+
 		// Clean up the WebSocket connection when the component unmounts
 		return () => {
+			clearInterval(heartbeat)
 			ws.current?.close()
 		}
 	}, [code, username])
@@ -111,9 +131,17 @@ const Game = () => {
 		// }
 	}
 
+	const handleChord = (row: number, col: number) => {
+		if (!ws.current) return
+		// Reveals every unflagged neighbour of a number in a single move
+		const payload = { row, column: col, user: username, type: "chord" }
+		ws.current.send(JSON.stringify(payload))
+	}
+
 	const contextValue: GameContextType = {
 		handleCellClick,
 		handleFlipFlag,
+		handleChord,
 	}
 
 	return (
@@ -3,6 +3,7 @@ import React from "react"
 export interface GameContextType {
 	handleCellClick: (row: number, col: number) => void
 	handleFlipFlag: (row: number, col: number) => void
+	handleChord: (row: number, col: number) => void
 }
 
 const GameContext = React.createContext<GameContextType | null>(null)
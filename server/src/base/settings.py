@@ -81,27 +81,134 @@ TEMPLATES = [
 WSGI_APPLICATION = "base.wsgi.application"
 
 
+# Channel layer, selected with the CHANNEL_LAYERS_BACKEND environment variable:
+# - memory: single process only, for development.
+# - redis-pubsub: Redis pub/sub, every message is published once per group and
+#   delivered to the subscribed processes right away, with no per-channel queue
+#   to poll. Recommended to run several Daphne processes, it avoids the latency
+#   and the closed connections seen with the core Redis layer under the map
+#   broadcasts of busy games.
+# - redis: core Redis layer, each channel has a queue in Redis. The capacity and
+#   expiry below are tuned for bursts of broadcasts: queues hold more messages,
+#   and messages for clients that went away are dropped sooner.
+# Both Redis layers keep a pool of connections per process, see
+# benchmark_channel_layer to compare the fan-out latency of the layers.
+#
+# With a Redis layer the server can run as several processes, so the presence
+# and the game map cache default to Redis to be shared by them. Two features
+# keep their state in the memory of a process and are single process only:
+# - the game engine (GAME_ENGINE_ENABLED) holds the authoritative board of its
+#   games, every move of a game must reach the same process,
+# - the move queues of the async consumer only order and batch the moves
+#   received by their own process. Moves of a game received by different
+#   processes are still applied safely, but not in order nor in one batch.
+CHANNEL_LAYERS_BACKEND = os.getenv("CHANNEL_LAYERS_BACKEND", "memory")
+CHANNEL_LAYERS_REDIS_URL = os.getenv("CHANNEL_LAYERS_REDIS_URL", "redis://redis:6379/1")
+CHANNEL_LAYERS_REDIS_HOST = {
+    "address": CHANNEL_LAYERS_REDIS_URL,
+    "max_connections": int(os.getenv("CHANNEL_LAYERS_REDIS_MAX_CONNECTIONS", 100)),
+}
+
 CHANNEL_LAYERS = {
-    "default": {
+    "memory": {
         "BACKEND": "channels.layers.InMemoryChannelLayer",
-        # TODO: investigating issues related to slowness and connection closing with channels_redis
-        # For now, we are using channels in memory
-        # "BACKEND": "channels_redis.core.RedisChannelLayer",
-        # "CONFIG": {
-        #     "hosts": [("redis", 6379)],
-        # },
+    },
+    "redis-pubsub": {
+        "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+        "CONFIG": {"hosts": [CHANNEL_LAYERS_REDIS_HOST]},
+    },
+    "redis": {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {
+            "hosts": [CHANNEL_LAYERS_REDIS_HOST],
+            "capacity": 1000,  # messages per channel, 100 by default
+            "expiry": 10,  # seconds, 60 by default
+            "group_expiry": 86400,
+        },
     },
 }
+# Layer of the consumers, the others are only created by benchmark_channel_layer
+CHANNEL_LAYERS["default"] = CHANNEL_LAYERS[CHANNEL_LAYERS_BACKEND]
 
 ASGI_APPLICATION = "base.asgi.application"
 
+# Serve the websocket with game.consumers.AsyncGameConsumer instead of GameConsumer
+GAME_ASYNC_CONSUMER = False
+# Seconds without moves before the move queue of a game is dropped
+GAME_MOVE_QUEUE_IDLE_SECONDS = 30
+# Moves of a game received within this many seconds of each other are applied in
+# one transaction and broadcast as one update (async consumer only, 0 disables it)
+# Only the moves received by the same process are batched together
+GAME_MOVE_TICK_SECONDS = 0
+
 CELERY_BROKER_URL = "redis://redis:6379/0"
+CELERY_BEAT_SCHEDULE = {
+    "drain-game-event-outbox": {
+        "task": "game.tasks.drain_game_event_outbox",
+        "schedule": 1.0,  # seconds
+    },
+    "fill-game-pool": {
+        "task": "game.tasks.fill_game_pool",
+        "schedule": 2.0,  # seconds
+    },
+    "compact-finished-games": {
+        "task": "game.tasks.compact_finished_games",
+        "schedule": 60.0,  # seconds
+    },
+}
+
+# Events moved from game.models.GameEventOutbox to GameEvents per insert
+GAME_EVENT_OUTBOX_BATCH_SIZE = 1000
+
+# Users connected to each game, see game.presence
+# Shared between the server processes in Redis with a Redis channel layer
+GAME_PRESENCE_REDIS_URL = os.getenv("GAME_PRESENCE_REDIS_URL", "redis://redis:6379/1")
+if CHANNEL_LAYERS_BACKEND == "memory":
+    GAME_PRESENCE: dict = {"BACKEND": "game.presence.LocMemPresence"}
+else:
+    GAME_PRESENCE = {
+        "BACKEND": "game.presence.RedisPresence",
+        "OPTIONS": {"url": GAME_PRESENCE_REDIS_URL},
+    }
+# Connections without a heartbeat for this long are disconnected
+GAME_PRESENCE_TTL_SECONDS = 30
+
+# Rendered game maps, see game.map_cache
+# Shared between the server processes in Redis with a Redis channel layer
+GAME_MAP_CACHE_REDIS_URL = os.getenv("GAME_MAP_CACHE_REDIS_URL", "redis://redis:6379/2")
+if CHANNEL_LAYERS_BACKEND == "memory":
+    GAME_MAP_CACHE_BACKEND = {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "game_maps",
+        "OPTIONS": {
+            "MAX_ENTRIES": 1000,
+            "CULL_FREQUENCY": 4,  # evicts 1/4 of the entries once full
+        },
+    }
+else:
+    GAME_MAP_CACHE_BACKEND = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": GAME_MAP_CACHE_REDIS_URL,
+    }
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Kept apart so large maps don't evict other entries
+    "game_maps": GAME_MAP_CACHE_BACKEND,
+}
+
+GAME_MAP_CACHE = "game_maps"
+GAME_MAP_CACHE_TTL_SECONDS = 60 * 60
+# Versions of ongoing games cached next to their maps, see game.map_cache
+GAME_MAP_CACHE_VERSION_TTL_SECONDS = 5
 
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
+DATABASES: dict[str, dict] = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
         "NAME": os.getenv("DATABASE_NAME"),
@@ -112,6 +219,17 @@ DATABASES = {
     }
 }
 
+# Local SQLite database instead, e.g. to run load_test without Postgres
+if os.getenv("DATABASE_SQLITE_PATH"):
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("DATABASE_SQLITE_PATH"),
+            # Seconds a write waits for the database lock held by another one
+            "OPTIONS": {"timeout": 20},
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -153,3 +271,47 @@ STATIC_URL = "static/"
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Storage used for the board of new games, see game.models.Game.Storage. With
+# "lazy", creating a game only writes its row and the mines are placed on the
+# first reveal, away from the revealed cell.
+GAME_BOARD_STORAGE = "packed"
+# Boards with at least this many squares are stored and served in tiles of
+# GAME_BOARD_TILE_SIZE x GAME_BOARD_TILE_SIZE squares, see game.models.BoardTile
+GAME_TILED_BOARD_MIN_CELLS = 1_000_000
+GAME_BOARD_TILE_SIZE = 64
+# Tiles a websocket client can subscribe to at once, see game.consumers
+GAME_VIEWPORT_MAX_TILES = 64
+
+# Games generated ahead of time for each (rows, columns, mines) preset of the
+# client, so creating one doesn't wait for its board, see
+# game.use_cases.fill_game_pool. Games of other sizes are generated on demand.
+GAME_POOL_PRESETS = [(9, 9, 10), (16, 16, 40), (24, 24, 99)]
+GAME_POOL_SIZE = 20
+# Pooled games a new game tries to claim before generating its own
+GAME_POOL_CLAIM_CANDIDATES = 5
+
+# Finished games archived per run of game.tasks.compact_finished_games, and
+# Cell rows deleted per statement, see game.compaction
+GAME_COMPACTION_GAMES_PER_RUN = 100
+GAME_COMPACTION_BATCH_SIZE = 5000
+
+# Events of a page of the replay API, see game.views.game_events
+GAME_REPLAY_MAX_PAGE_SIZE = 1000
+
+# Times a move is applied again after losing a race against another move on the
+# same game, see game.use_cases._run_move
+GAME_MOVE_MAX_RETRIES = 10
+
+# Latency, query count and payload size metrics of the game operations, served
+# in the Prometheus text format at /metrics, see game.metrics
+GAME_METRICS_ENABLED = False
+
+# In-process game engine, see game.engine
+# Moves are applied in memory and written to the database in batches
+# Single process only, see CHANNEL_LAYERS_BACKEND
+GAME_ENGINE_ENABLED = False
+GAME_ENGINE_FLUSH_INTERVAL_SECONDS = 0.5
+GAME_ENGINE_FLUSH_IDLE_SECONDS = 2
+GAME_ENGINE_FLUSH_MAX_DELAY_SECONDS = 10
+GAME_ENGINE_EVICT_IDLE_SECONDS = 300
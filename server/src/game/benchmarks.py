@@ -0,0 +1,11 @@
+"""
+Helpers shared by the benchmark and load test management commands.
+"""
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Nearest-rank percentile of the values, 0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
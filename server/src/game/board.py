@@ -0,0 +1,323 @@
+import zlib
+from typing import Iterable, Iterator
+
+import numpy as np
+from django.db.models import Q, prefetch_related_objects
+
+from game.models import BoardTile, Cell, Game
+
+# Tiles read by a single query of TiledCells.load_tiles
+TILES_PER_QUERY = 200
+
+# Each square of a packed board is a single byte:
+# bits 0-3 hold the adjacent mines count, the higher bits hold the cell flags.
+ADJACENT_MINES_MASK = 0x0F
+MINE = 0x10
+REVEALED = 0x20
+FLAGGED = 0x40
+
+
+class GameVersionConflict(Exception):
+    """The game was updated by another move since it was loaded."""
+
+
+class Board:
+    """
+    In-memory representation of a game board, one byte per square.
+
+    The board keeps track of the squares changed since it was loaded, so it can
+    be written back either as a single packed field or as the changed Cell rows.
+    """
+
+    __slots__ = ("rows", "columns", "cells", "changed")
+
+    def __init__(self, rows: int, columns: int, cells: bytes | bytearray | None = None):
+        self.rows = rows
+        self.columns = columns
+        self.cells = (
+            bytearray(cells) if cells is not None else bytearray(rows * columns)
+        )
+        self.changed: set[int] = set()
+
+    @classmethod
+    def from_cells(cls, rows: int, columns: int, cells: Iterable[Cell]) -> "Board":
+        board = cls(rows, columns)
+        for cell in cells:
+            board.cells[cell.row * columns + cell.column] = _pack(
+                cell.is_mine, cell.is_revealed, cell.is_flagged, cell.adjacent_mines
+            )
+        return board
+
+    def index(self, row: int, column: int) -> int | None:
+        if 0 <= row < self.rows and 0 <= column < self.columns:
+            return row * self.columns + column
+        return None
+
+    def position(self, index: int) -> tuple[int, int]:
+        return divmod(index, self.columns)
+
+    def neighbours(self, index: int) -> Iterator[int]:
+        row, column = self.position(index)
+        for r in range(max(row - 1, 0), min(row + 2, self.rows)):
+            for c in range(max(column - 1, 0), min(column + 2, self.columns)):
+                yield r * self.columns + c
+
+    def is_mine(self, index: int) -> bool:
+        return bool(self.cells[index] & MINE)
+
+    def is_revealed(self, index: int) -> bool:
+        return bool(self.cells[index] & REVEALED)
+
+    def is_flagged(self, index: int) -> bool:
+        return bool(self.cells[index] & FLAGGED)
+
+    def adjacent_mines(self, index: int) -> int:
+        return self.cells[index] & ADJACENT_MINES_MASK
+
+    def values(self, indexes: list[int]) -> list[int]:
+        """Packed squares at the given indexes, read at once from tiled boards."""
+        if isinstance(self.cells, TiledCells):
+            return self.cells.values(indexes)
+        cells = self.cells
+        return [cells[index] for index in indexes]
+
+    def reveal(self, index: int):
+        self.cells[index] |= REVEALED
+        self.changed.add(index)
+
+    def toggle_flag(self, index: int):
+        self.cells[index] ^= FLAGGED
+        self.changed.add(index)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.cells)
+
+    def copy(self) -> "Board":
+        board = Board(self.rows, self.columns, b"")
+        board.cells = self.cells.copy()
+        return board
+
+
+class TiledCells:
+    """
+    Flat view over the squares of a tiled game, so a Board can be used the same
+    way whether the whole board is in memory or not.
+
+    Tiles are read from the database the first time one of their squares is
+    accessed, and kept to be written back by save_board.
+    """
+
+    def __init__(
+        self, game: Game, tiles: dict[tuple[int, int], BoardTile] | None = None
+    ):
+        self.game = game
+        self.tiles = tiles if tiles is not None else {}
+
+    def __len__(self) -> int:
+        return self.game.rows * self.game.columns
+
+    def __getitem__(self, index: int) -> int:
+        tile, offset = self._locate(index)
+        return tile.cells[offset]
+
+    def __setitem__(self, index: int, value: int):
+        tile, offset = self._locate(index)
+        tile.cells[offset] = value
+
+    def copy(self) -> "TiledCells":
+        return TiledCells(
+            self.game,
+            {
+                key: BoardTile(
+                    id=tile.id,
+                    game_id=tile.game_id,
+                    tile_row=tile.tile_row,
+                    tile_column=tile.tile_column,
+                    cells=bytearray(tile.cells),
+                )
+                for key, tile in self.tiles.items()
+            },
+        )
+
+    def get_tile(self, tile_row: int, tile_column: int) -> BoardTile:
+        tile = self.tiles.get((tile_row, tile_column))
+        if tile is None:
+            tile = BoardTile.objects.get(
+                game=self.game, tile_row=tile_row, tile_column=tile_column
+            )
+            tile.cells = bytearray(tile.cells)
+            self.tiles[(tile_row, tile_column)] = tile
+        return tile
+
+    def load_tiles(self, keys: Iterable[tuple[int, int]]):
+        """Read the given (tile_row, tile_column) tiles that weren't read yet."""
+        missing = [key for key in keys if key not in self.tiles]
+        for start in range(0, len(missing), TILES_PER_QUERY):
+            condition = Q()
+            for tile_row, tile_column in missing[start : start + TILES_PER_QUERY]:
+                condition |= Q(tile_row=tile_row, tile_column=tile_column)
+            for tile in BoardTile.objects.filter(condition, game=self.game):
+                tile.cells = bytearray(tile.cells)
+                self.tiles[(tile.tile_row, tile.tile_column)] = tile
+
+    def values(self, indexes: list[int]) -> list[int]:
+        if not indexes:
+            return []
+        game = self.game
+        rows, columns = np.divmod(np.array(indexes), game.columns)
+        tile_rows, tile_columns = rows // game.tile_size, columns // game.tile_size
+        tiles = sorted(set(zip(tile_rows.tolist(), tile_columns.tolist())))
+        self.load_tiles(tiles)
+
+        # Gathered tile by tile, from the squares of each tile
+        keys = tile_rows * (game.columns // game.tile_size + 1) + tile_columns
+        order = np.argsort(keys, kind="stable")
+        groups = np.split(order, np.flatnonzero(np.diff(keys[order])) + 1)
+        values = np.empty(len(indexes), dtype=np.uint8)
+        for group in groups:
+            tile_row, tile_column = int(tile_rows[group[0]]), int(
+                tile_columns[group[0]]
+            )
+            offsets = (rows[group] - tile_row * game.tile_size) * tile_width(
+                game, tile_column
+            ) + (columns[group] - tile_column * game.tile_size)
+            cells = np.frombuffer(self.get_tile(tile_row, tile_column).cells, np.uint8)
+            values[group] = cells[offsets]
+        return values.tolist()
+
+    def _locate(self, index: int) -> tuple[BoardTile, int]:
+        tile_size = self.game.tile_size
+        row, column = divmod(index, self.game.columns)
+        tile_row, tile_column = row // tile_size, column // tile_size
+        width = tile_width(self.game, tile_column)
+        offset = (row - tile_row * tile_size) * width + column - tile_column * tile_size
+        return self.get_tile(tile_row, tile_column), offset
+
+
+def split_into_tiles(
+    game: Game, tile_row: int, band: np.ndarray
+) -> Iterator[BoardTile]:
+    """Tiles of a row of tiles, from the packed squares of its rows."""
+    for tile_column in range(-(-game.columns // game.tile_size)):
+        first_column = tile_column * game.tile_size
+        yield BoardTile(
+            game=game,
+            tile_row=tile_row,
+            tile_column=tile_column,
+            cells=band[:, first_column : first_column + game.tile_size].tobytes(),
+        )
+
+
+def tile_width(game: Game, tile_column: int) -> int:
+    return min(game.tile_size, game.columns - tile_column * game.tile_size)
+
+
+def tile_height(game: Game, tile_row: int) -> int:
+    return min(game.tile_size, game.rows - tile_row * game.tile_size)
+
+
+def tile_of(game: Game, index: int) -> tuple[int, int]:
+    row, column = divmod(index, game.columns)
+    return row // game.tile_size, column // game.tile_size
+
+
+def _pack(is_mine: bool, is_revealed: bool, is_flagged: bool, adjacent_mines: int):
+    return (
+        (adjacent_mines & ADJACENT_MINES_MASK)
+        | (MINE if is_mine else 0)
+        | (REVEALED if is_revealed else 0)
+        | (FLAGGED if is_flagged else 0)
+    )
+
+
+def load_board(game: Game) -> Board:
+    if game.storage in (Game.Storage.PACKED, Game.Storage.LAZY):
+        # Boards of lazy games only hold flags until their mines are placed
+        return Board(game.rows, game.columns, game.board)
+    if game.storage == Game.Storage.ARCHIVED:
+        return Board(game.rows, game.columns, zlib.decompress(game.board))
+    if game.storage == Game.Storage.TILED:
+        board = Board(game.rows, game.columns, b"")
+        # Squares are read through the tiles, see TiledCells
+        board.cells = TiledCells(game)  # type: ignore[assignment]
+        return board
+    if game.storage == Game.Storage.EVENTS:
+        # Imported here, game.replay depends on this module
+        from game.replay import replay_board
+
+        return replay_board(game)
+    # Keep the cells cached on the game so saving the board doesn't query them again
+    prefetch_related_objects([game], "cells")
+    return Board.from_cells(game.rows, game.columns, game.cells.all())
+
+
+def save_board(
+    game: Game,
+    board: Board,
+    update_fields: list[str] | None = None,
+    expected_version: int | None = None,
+):
+    """
+    Persist the squares changed on the board, together with the given game fields.
+
+    Packed games are written with a single UPDATE on the game row, while games
+    stored as Cell rows only update the rows that changed, and tiled games the
+    tiles that changed. Games rebuilt from their events are stored packed again
+    once they change, as are lazy games once their mines are placed.
+
+    With an expected version, the game row is only updated if its version is
+    still the expected one, otherwise GameVersionConflict is raised and the
+    caller's transaction must be rolled back.
+    """
+    update_fields = list(update_fields or [])
+
+    if board.changed and game.storage == Game.Storage.EVENTS:
+        game.storage = Game.Storage.PACKED
+        update_fields.append("storage")
+
+    if (
+        board.changed
+        and game.storage == Game.Storage.LAZY
+        and game.safe_cell is not None
+    ):
+        game.storage = Game.Storage.PACKED
+        update_fields.extend(["storage", "safe_cell", "regions"])
+
+    if board.changed and game.storage in (Game.Storage.PACKED, Game.Storage.LAZY):
+        game.board = board.to_bytes()
+        update_fields.append("board")
+    elif board.changed and game.storage == Game.Storage.TILED:
+        rows, columns = np.divmod(np.array(list(board.changed)), game.columns)
+        keys = set(
+            zip((rows // game.tile_size).tolist(), (columns // game.tile_size).tolist())
+        )
+        tiles = [
+            board.cells.get_tile(*key) for key in keys  # type: ignore[attr-defined]
+        ]
+        BoardTile.objects.bulk_update(
+            [BoardTile(id=tile.id, cells=bytes(tile.cells)) for tile in tiles],
+            ["cells"],
+        )
+    elif board.changed:
+        changed = {board.position(index): index for index in board.changed}
+        cells = [
+            cell for cell in game.cells.all() if (cell.row, cell.column) in changed
+        ]
+        for cell in cells:
+            index = changed[(cell.row, cell.column)]
+            cell.is_revealed = board.is_revealed(index)
+            cell.is_flagged = board.is_flagged(index)
+        Cell.objects.bulk_update(cells, ["is_revealed", "is_flagged"])
+
+    if update_fields and expected_version is not None:
+        updated = Game.objects.filter(id=game.id, version=expected_version).update(
+            **{field: getattr(game, field) for field in update_fields}
+        )
+        if not updated:
+            raise GameVersionConflict(
+                f"Game {game.id} is no longer at version {expected_version}"
+            )
+    elif update_fields:
+        game.save(update_fields=update_fields)
+
+    board.changed.clear()
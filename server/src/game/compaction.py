@@ -0,0 +1,90 @@
+"""
+Compaction of finished games.
+
+Finished games never change again, so their board is archived as a single
+zlib-compressed packed board on the game row (see Game.Storage.ARCHIVED) and
+their Cell rows are deleted, in batches of GAME_COMPACTION_BATCH_SIZE rows so
+no single statement holds the cell table for long. Archived games are still
+read through load_board like any other game.
+"""
+
+import zlib
+from typing import TypedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from game.board import load_board
+from game.models import Cell, Game
+
+
+class CompactionReport(TypedDict):
+    games: int  # games archived
+    cell_rows: int  # Cell rows deleted
+    # Size of the Game.board and Game.regions columns of the games, before and
+    # after. The Cell rows of the games aren't included, see cell_rows
+    board_bytes_before: int
+    board_bytes_after: int
+
+
+def compact_finished_games(limit: int | None = None) -> CompactionReport:
+    """
+    Archive up to `limit` finished games (GAME_COMPACTION_GAMES_PER_RUN by
+    default), and delete the Cell rows left by the archived games.
+    """
+    limit = limit or settings.GAME_COMPACTION_GAMES_PER_RUN
+    report = CompactionReport(
+        games=0, cell_rows=0, board_bytes_before=0, board_bytes_after=0
+    )
+
+    games = Game.objects.exclude(state="ongoing").filter(
+        storage__in=[Game.Storage.CELLS, Game.Storage.PACKED]
+    )
+    for game in list(games[:limit]):
+        archived = _archive_game(game)
+        if archived is not None:
+            report["games"] += 1
+            report["board_bytes_before"] += archived[0]
+            report["board_bytes_after"] += archived[1]
+
+    # Includes the games of previous runs that stopped before deleting them all
+    with_cells = Game.objects.filter(
+        Exists(Cell.objects.filter(game=OuterRef("pk"))),
+        storage=Game.Storage.ARCHIVED,
+    )
+    for game_id in list(with_cells.values_list("id", flat=True)):
+        report["cell_rows"] += _delete_cells(game_id)
+
+    return report
+
+
+def _archive_game(game: Game) -> tuple[int, int] | None:
+    """
+    Returns the size of the board columns before and after, None if skipped.
+    Games stored as Cell rows have no board column, only their region index.
+    """
+    archive = zlib.compress(load_board(game).to_bytes(), level=9)
+    size_before = len(game.board or b"") + len(game.regions or b"")
+
+    # Skipped if the game changed since it was loaded, e.g. drop_cold_boards ran
+    updated = Game.objects.filter(
+        id=game.id, version=game.version, storage=game.storage
+    ).update(storage=Game.Storage.ARCHIVED, board=archive, regions=None)
+    if not updated:
+        return None
+    return size_before, len(archive)
+
+
+def _delete_cells(game_id: int) -> int:
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Cell.objects.filter(game_id=game_id).values_list("id", flat=True)[
+                    : settings.GAME_COMPACTION_BATCH_SIZE
+                ]
+            )
+            if not ids:
+                return deleted
+            deleted += Cell.objects.filter(id__in=ids).delete()[0]
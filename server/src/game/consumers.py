@@ -1,91 +1,537 @@
 from datetime import datetime
 from urllib.parse import parse_qs
+import asyncio
 import json
+import logging
+from typing import Any
 
-from asgiref.sync import async_to_sync
-from channels.generic.websocket import WebsocketConsumer
-from django.core.cache import cache
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer, WebsocketConsumer
+from channels.layers import get_channel_layer
+from django.conf import settings
 
-from game.use_cases import change_flag, play_move
+from game import engine, metrics, use_cases
+from game.board import GameVersionConflict
+from game.encoding import encode_game_map_state, get_encoding
+from game.models import GameMapState, GameMove
+from game.presence import PresenceUpdate, get_presence
 
+logger = logging.getLogger(__name__)
 
-class GameConsumer(WebsocketConsumer):
-    def connect(self):
+# Map update protocols a client can ask for with the "protocol" query parameter:
+# - full: the whole map is sent after every move (default). Moves only broadcast
+#   the changed cells, and the consumer of each full protocol client applies
+#   them to the copy of the map it keeps, read on the first update.
+# - delta: only the changed cells are sent after every move, with the game
+#   version. The whole map is sent on connect and when the client sends a
+#   "sync" message, e.g. after noticing a gap in the versions it received.
+# - tiles: for tiled games, only the changed cells of the tiles in the client
+#   viewport are sent. The client sets its viewport with a "viewport" message
+#   listing the [tile_row, tile_column] of the tiles it shows, and reads the
+#   tiles themselves from the REST API.
+# Independently, the "encoding" query parameter selects how cells are encoded,
+# see game.encoding.
+MAP_PROTOCOLS = ("full", "delta", "tiles")
+MOVE_TYPES = ("reveal", "flag", "chord")
+# Sent back when a move lost the race for the game version on every retry
+GAME_BUSY_ERROR = {"error": "Game is busy, try again"}
+
+
+class GameConsumerMixin:
+    """
+    Connection state and message handling shared by GameConsumer and
+    AsyncGameConsumer, which only differ in how they run the resulting I/O.
+    """
+
+    scope: dict  # set by the consumer
+
+    def init_connection(self):
         self.game_code = self.scope["url_route"]["kwargs"]["room_name"]
         self.group_name = f"game_{self.game_code}"
+        self.user, self.protocol, self.encoding = _parse_query_string(self.scope)
+        # Full protocol clients get the changed cells too, see expand_cells
+        map_protocol = "delta" if self.protocol == "full" else self.protocol
+        self.map_group_name = f"{self.group_name}_{map_protocol}"
+        self.tile_group_names: set[str] = set()
+        # Map last sent to a full protocol client
+        self.game_map: dict | None = None
+
+    @property
+    def group_names(self) -> list[str]:
+        return [self.group_name, self.map_group_name]
+
+    @property
+    def sends_snapshot_on_connect(self) -> bool:
+        return self.protocol != "full"
 
-        async_to_sync(self.channel_layer.group_add)(self.group_name, self.channel_name)
+    def route_message(self, text_data: str) -> tuple[str, Any]:
+        """
+        The action a client message asks for, with its argument:
+        - ("sync", None): send the whole map,
+        - ("heartbeat", None): refresh the presence of the connection,
+        - ("viewport", group names): subscribe to the tiles of the viewport,
+        - ("reply", message): send the message back to the client,
+        - ("move", move): apply the move.
+
+        Moves are validated here, so an invalid move is only reported to its
+        sender and never reaches the moves batched with it.
+        """
+        data, error_message = _parse_message(text_data)
+        if error_message:
+            return "reply", error_message
+        type = data.get("type")
+
+        if type in ("sync", "heartbeat"):
+            return type, None
+
+        if type == "viewport":
+            tile_group_names = _parse_viewport(self.group_name, data)
+            if tile_group_names is None:
+                return "reply", {"error": "Invalid viewport"}
+            return "viewport", tile_group_names
+
+        move, error_message = _parse_move(data)
+        if error_message:
+            return "reply", error_message
+        return "move", move
+
+    def change_viewport(self, tile_group_names: set[str]) -> tuple[set[str], set[str]]:
+        """Groups to leave and to join for the new viewport."""
+        leave = self.tile_group_names - tile_group_names
+        join = tile_group_names - self.tile_group_names
+        self.tile_group_names = tile_group_names
+        return leave, join
+
+    def keep_snapshot(self, message: dict):
+        if self.protocol == "full":
+            self.game_map = message["map"]
+
+    def needs_snapshot(self, event: dict) -> bool:
+        """
+        Whether the update.cells message doesn't follow the map kept for a full
+        protocol client, which must read the whole map again.
+        """
+        return (
+            self.game_map is None
+            or event["map"]["version"] > self.game_map["version"] + 1
+        )
+
+    def expand_cells(self, event: dict) -> dict | None:
+        """
+        Apply an update.cells message to the map kept for a full protocol client,
+        and return the update.map message to send, None if the map is newer.
+        """
+        assert self.game_map is not None
+        message = dict(event["map"])
+        cells = message.pop("cells")
+        if message["version"] <= self.game_map["version"]:
+            return None
+
+        # Tiled games have no map, only their tiles
+        squares = self.game_map["map"]
+        if squares:
+            for cell in cells:
+                squares[cell["row"]][cell["column"]] = cell
+        self.game_map = {**message, "map": squares}
+        return {"type": "update.map", "map": self.game_map}
+
+    def dump_map(self, event: dict) -> str:
+        return _dump_map_message(event, self.encoding)
+
+
+class GameConsumer(GameConsumerMixin, WebsocketConsumer):
+    def connect(self):
+        self.init_connection()
+        for group in self.group_names:
+            async_to_sync(self.channel_layer.group_add)(group, self.channel_name)
 
         self.accept()
 
-        query_string = self.scope["query_string"].decode()
-        self.user = parse_qs(query_string).get("user", [None])[0]
-        connected_users = cache.get(self.game_code, [])
-        if self.user not in connected_users:
-            connected_users.append(self.user)
-        cache.set(self.game_code, connected_users)
+        if self.sends_snapshot_on_connect:
+            self.send_snapshot()
 
-        async_to_sync(self.channel_layer.group_send)(
-            self.group_name, {"type": "user.list", "users": connected_users}
+        update = get_presence().touch(
+            self.game_code, self.channel_name, self.user or ""
         )
+        # The client gets every connected user, the others only the changes
+        self.send(text_data=json.dumps({"type": "user.list", "users": update["users"]}))
+        self.send_presence(update)
 
     def disconnect(self, close_code):
-        user = self.user
-        connected_users = cache.get(self.game_code, [])
-        if user in connected_users:
-            connected_users.remove(user)
-        cache.set(self.game_code, connected_users)
-
-        async_to_sync(self.channel_layer.group_send)(
-            self.group_name, {"type": "user.list", "users": connected_users}
+        self.send_presence(get_presence().leave(self.game_code, self.channel_name))
+
+        for group in self.group_names:
+            async_to_sync(self.channel_layer.group_discard)(group, self.channel_name)
+        self.set_viewport(set())
+
+    def receive(self, text_data):
+        action, argument = self.route_message(text_data)
+
+        if action == "sync":
+            self.send_snapshot()
+        elif action == "heartbeat":
+            self.send_presence(
+                get_presence().touch(self.game_code, self.channel_name, self.user or "")
+            )
+        elif action == "viewport":
+            self.set_viewport(argument)
+        elif action == "reply":
+            self.send(text_data=json.dumps(argument))
+        else:
+            try:
+                game_map_state = _apply_move_message(self.game_code, argument)
+            except GameVersionConflict:
+                self.send(text_data=json.dumps(GAME_BUSY_ERROR))
+                return
+            self.broadcast_map(game_map_state)
+
+    def broadcast_map(self, game_map_state: GameMapState | None):
+        for group, message in _get_broadcast_messages(self.game_code, game_map_state):
+            with metrics.track("group_send", _board_cells(message)):
+                async_to_sync(self.channel_layer.group_send)(group, message)
+
+    def send_presence(self, update: PresenceUpdate):
+        message = _get_presence_message(update)
+        if message is not None:
+            async_to_sync(self.channel_layer.group_send)(self.group_name, message)
+
+    def set_viewport(self, tile_group_names: set[str]):
+        leave, join = self.change_viewport(tile_group_names)
+        for group in leave:
+            async_to_sync(self.channel_layer.group_discard)(group, self.channel_name)
+        for group in join:
+            async_to_sync(self.channel_layer.group_add)(group, self.channel_name)
+
+    def send_snapshot(self):
+        message = _get_snapshot_message(self.game_code)
+        self.keep_snapshot(message)
+        self.send_map(message)
+
+    def update_map(self, event):
+        self.send_map(event)
+
+    def update_cells(self, event):
+        if self.protocol != "full":
+            self.send_map(event)
+        elif self.needs_snapshot(event):
+            self.send_snapshot()
+        else:
+            message = self.expand_cells(event)
+            if message is not None:
+                self.send_map(message)
+
+    def send_map(self, event):
+        self.send(text_data=self.dump_map(event))
+
+    def user_list(self, event):
+        self.send(text_data=json.dumps(event))
+
+
+class AsyncGameConsumer(GameConsumerMixin, AsyncWebsocketConsumer):
+    """
+    Async variant of GameConsumer, used when GAME_ASYNC_CONSUMER is enabled.
+
+    Moves are applied off the event loop, through a queue per game: the moves of
+    a game are applied one at a time and in order, while different games are
+    played in parallel.
+    """
+
+    async def connect(self):
+        self.init_connection()
+        for group in self.group_names:
+            await self.channel_layer.group_add(group, self.channel_name)
+
+        await self.accept()
+
+        if self.sends_snapshot_on_connect:
+            await self.send_snapshot()
+
+        update = await sync_to_async(get_presence().touch)(
+            self.game_code, self.channel_name, self.user or ""
+        )
+        # The client gets every connected user, the others only the changes
+        await self.send(
+            text_data=json.dumps({"type": "user.list", "users": update["users"]})
         )
+        await self.send_presence(update)
 
-        async_to_sync(self.channel_layer.group_discard)(
-            self.group_name, self.channel_name
+    async def disconnect(self, close_code):
+        await self.send_presence(
+            await sync_to_async(get_presence().leave)(self.game_code, self.channel_name)
         )
 
-    def receive(self, text_data):
-        error_message = None
+        for group in self.group_names:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        await self.set_viewport(set())
 
-        try:
-            data = json.loads(text_data)
-        except json.JSONDecodeError:
-            error_message = {"error": "Invalid JSON"}
+    async def receive(self, text_data):
+        action, argument = self.route_message(text_data)
 
-        if not all(key in data for key in ("row", "column", "user", "type")):
-            error_message = {"error": "Missing required parameters"}
+        if action == "sync":
+            await self.send_snapshot()
+        elif action == "heartbeat":
+            await self.send_presence(
+                await sync_to_async(get_presence().touch)(
+                    self.game_code, self.channel_name, self.user or ""
+                )
+            )
+        elif action == "viewport":
+            await self.set_viewport(argument)
+        elif action == "reply":
+            await self.send(text_data=json.dumps(argument))
+        else:
+            _get_move_queue(self.game_code).put_nowait(argument)
 
-        if error_message:
-            async_to_sync(self.channel_layer.group_send)(self.group_name, error_message)
-            return
+    async def send_presence(self, update: PresenceUpdate):
+        message = _get_presence_message(update)
+        if message is not None:
+            await self.channel_layer.group_send(self.group_name, message)
 
-        row = int(data["row"])
-        column = int(data["column"])
-        user = data["user"]
-        type = data["type"]
+    async def set_viewport(self, tile_group_names: set[str]):
+        leave, join = self.change_viewport(tile_group_names)
+        for group in leave:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        for group in join:
+            await self.channel_layer.group_add(group, self.channel_name)
 
-        game_map_state = None
-        if type == "flag":
-            game_map_state = change_flag(self.game_code, row, column, user)
-        elif type == "reveal":
-            game_map_state = play_move(self.game_code, row, column, user)
+    async def send_snapshot(self):
+        message = await database_sync_to_async(
+            _get_snapshot_message, thread_sensitive=False
+        )(self.game_code)
+        self.keep_snapshot(message)
+        await self.send_map(message)
 
-        if game_map_state is None:
+    async def update_map(self, event):
+        await self.send_map(event)
+
+    async def update_cells(self, event):
+        if self.protocol != "full":
+            await self.send_map(event)
+        elif self.needs_snapshot(event):
+            await self.send_snapshot()
+        else:
+            message = self.expand_cells(event)
+            if message is not None:
+                await self.send_map(message)
+
+    async def send_map(self, event):
+        await self.send(text_data=self.dump_map(event))
+
+    async def user_list(self, event):
+        await self.send(text_data=json.dumps(event))
+
+
+# Pending moves of the games played through AsyncGameConsumer in this process
+_move_queues: dict[str, asyncio.Queue] = {}
+_move_workers: set[asyncio.Task] = set()
+
+
+def _get_move_queue(game_code: str) -> asyncio.Queue:
+    queue = _move_queues.get(game_code)
+    if queue is None:
+        queue = _move_queues[game_code] = asyncio.Queue()
+        worker = asyncio.create_task(_process_moves(game_code, queue))
+        # The event loop only keeps weak references to its tasks
+        _move_workers.add(worker)
+        worker.add_done_callback(_move_workers.discard)
+    return queue
+
+
+async def _process_moves(game_code: str, queue: asyncio.Queue):
+    """
+    Apply the moves of a game one at a time, in the order they were received.
+    With GAME_MOVE_TICK_SECONDS set, the moves received within a tick of the
+    first one are applied together and broadcast as a single update.
+    The worker stops once the game has been idle for a while.
+    """
+    channel_layer = get_channel_layer()
+    # Not thread sensitive, so the moves of different games run in parallel
+    apply_move = database_sync_to_async(_apply_move_message, thread_sensitive=False)
+    apply_moves = database_sync_to_async(_apply_move_messages, thread_sensitive=False)
+
+    while True:
+        try:
+            data = await asyncio.wait_for(
+                queue.get(), timeout=settings.GAME_MOVE_QUEUE_IDLE_SECONDS
+            )
+        except asyncio.TimeoutError:
+            # A move can be queued as the wait times out, it's applied before
+            # stopping. Nothing can be queued between the check and the pop,
+            # this runs on the event loop
+            if not queue.empty():
+                continue
+            _move_queues.pop(game_code, None)
             return
 
-        # Convert datetime.datetime objects to strings
-        # This is necessary to avoid breaking on the channel
-        game_map_state = {
-            k: v.isoformat() if isinstance(v, datetime) else v
-            for k, v in game_map_state.items()
+        try:
+            if settings.GAME_MOVE_TICK_SECONDS:
+                await asyncio.sleep(settings.GAME_MOVE_TICK_SECONDS)
+                batch = [data]
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+                game_map_state = await apply_moves(game_code, batch)
+            else:
+                game_map_state = await apply_move(game_code, data)
+            for group, message in _get_broadcast_messages(game_code, game_map_state):
+                with metrics.track("group_send", _board_cells(message)):
+                    await channel_layer.group_send(group, message)
+        except Exception:
+            logger.exception(f"Failed to apply move {data} to game {game_code}")
+
+
+def _parse_query_string(scope) -> tuple[str | None, str, str]:
+    query_string = parse_qs(scope["query_string"].decode())
+    user = query_string.get("user", [None])[0]
+    protocol = query_string.get("protocol", ["full"])[0]
+    if protocol not in MAP_PROTOCOLS:
+        protocol = "full"
+    encoding = get_encoding(query_string.get("encoding", [None])[0])
+    return user, protocol, encoding
+
+
+def _parse_message(text_data: str) -> tuple[dict, dict | None]:
+    try:
+        data = json.loads(text_data)
+    except json.JSONDecodeError:
+        return {}, {"error": "Invalid JSON"}
+
+    if not isinstance(data, dict):
+        return {}, {"error": "Invalid JSON"}
+    return data, None
+
+
+def _parse_move(data: dict) -> tuple[GameMove | None, dict | None]:
+    if not all(key in data for key in ("row", "column", "user", "type")):
+        return None, {"error": "Missing required parameters"}
+
+    try:
+        move = GameMove(
+            type=data["type"],
+            row=int(data["row"]),
+            column=int(data["column"]),
+            user=str(data["user"]),
+        )
+    except (TypeError, ValueError):
+        return None, {"error": "Invalid move"}
+    if move["type"] not in MOVE_TYPES:
+        return None, {"error": "Invalid move"}
+    return move, None
+
+
+def _get_presence_message(update: PresenceUpdate) -> dict | None:
+    if not update["joined"] and not update["left"]:
+        return None
+    return {"type": "user.list", "joined": update["joined"], "left": update["left"]}
+
+
+def _parse_viewport(group_name: str, data: dict) -> set[str] | None:
+    # Names of the groups of the tiles in the viewport, None if it's invalid
+    tiles = data.get("tiles")
+    if not isinstance(tiles, list) or len(tiles) > settings.GAME_VIEWPORT_MAX_TILES:
+        return None
+    try:
+        return {
+            _tile_group_name(group_name, int(tile_row), int(tile_column))
+            for tile_row, tile_column in tiles
         }
+    except (TypeError, ValueError):
+        return None
 
-        async_to_sync(self.channel_layer.group_send)(
-            self.group_name, {"type": "update.map", "map": game_map_state}
+
+def _tile_group_name(group_name: str, tile_row: int, tile_column: int) -> str:
+    return f"{group_name}_tile_{tile_row}_{tile_column}"
+
+
+def _apply_move_message(game_code: str, move: GameMove) -> GameMapState | None:
+    # Only the changed cells are broadcast, the whole map isn't rendered
+    row, column, user = move["row"], move["column"], move["user"]
+
+    moves = engine if settings.GAME_ENGINE_ENABLED else use_cases
+
+    game_map_state = None
+    if move["type"] == "flag":
+        game_map_state = moves.change_flag(game_code, row, column, user, False)
+    elif move["type"] == "reveal":
+        game_map_state = moves.play_move(game_code, row, column, user, False)
+    elif move["type"] == "chord":
+        game_map_state = moves.chord(game_code, row, column, user, False)
+
+    return game_map_state
+
+
+def _apply_move_messages(game_code: str, moves: list[GameMove]) -> GameMapState | None:
+    moves_module = engine if settings.GAME_ENGINE_ENABLED else use_cases
+    return moves_module.play_moves(game_code, moves, with_map=False)
+
+
+def _get_snapshot_message(game_code: str) -> dict:
+    moves = engine if settings.GAME_ENGINE_ENABLED else use_cases
+    message = _serialize(moves.get_game_map_by_code(game_code))
+    message.pop("changes")
+    return {"type": "update.map", "map": message}
+
+
+def _get_broadcast_messages(
+    game_code: str, game_map_state: GameMapState | None
+) -> list[tuple[str, dict]]:
+    # Messages sent to the groups of the game once a move was applied
+    if game_map_state is None:
+        return []
+    return _get_map_messages(f"game_{game_code}", game_map_state)
+
+
+def _get_map_messages(
+    group_name: str, game_map_state: GameMapState
+) -> list[tuple[str, dict]]:
+    message = _serialize(game_map_state)
+    changes = message.pop("changes")
+    message.pop("map")
+
+    messages = [
+        (
+            f"{group_name}_delta",
+            {"type": "update.cells", "map": {**message, "cells": changes}},
         )
+    ]
 
-    def update_map(self, event):
-        self.send(text_data=json.dumps(event))
+    tile_size = message.get("tile_size")
+    if tile_size:
+        tile_changes: dict[str, list] = {}
+        for cell in changes:
+            tile_group_name = _tile_group_name(
+                group_name, cell["row"] // tile_size, cell["column"] // tile_size
+            )
+            tile_changes.setdefault(tile_group_name, []).append(cell)
+        messages.extend(
+            (
+                tile_group_name,
+                {"type": "update.cells", "map": {**message, "cells": cells}},
+            )
+            for tile_group_name, cells in tile_changes.items()
+        )
+    return messages
 
-    def user_list(self, event):
-        self.send(text_data=json.dumps(event))
+
+def _dump_map_message(event: dict, encoding: str) -> str:
+    map_state = event["map"]
+    with metrics.track("serialize", _board_cells(event)) as tracked:
+        if encoding == "compact":
+            event = {**event, "map": encode_game_map_state(map_state)}
+        text_data = json.dumps(event)
+        tracked.payload = len(text_data)
+    return text_data
+
+
+def _board_cells(message: dict) -> int:
+    # Size of the board of a map message, whether it holds the map or its changes
+    return message["map"]["rows"] * message["map"]["columns"]
+
+
+def _serialize(game_map_state: GameMapState) -> dict:
+    # Convert datetime.datetime objects to strings
+    # This is necessary to avoid breaking on the channel
+    return {
+        k: v.isoformat() if isinstance(v, datetime) else v
+        for k, v in game_map_state.items()
+    }
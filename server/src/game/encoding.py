@@ -0,0 +1,83 @@
+"""
+Compact encoding of the game map.
+
+Clients can ask for it with the "encoding=compact" query parameter, on the game
+endpoint and on the websocket. Every cell is encoded as one character, so each
+row of the map becomes a string and each changed cell a [row, column, character]
+triple. The character of a cell is COMPACT_ALPHABET[code], where
+
+    code = adjacent_mines + 9 * (is_mine + 2 * is_revealed + 4 * is_flagged)
+
+e.g. "0" is a hidden cell, "i" to "q" are revealed cells with 0 to 8 adjacent
+mines and "A" is a flagged cell.
+"""
+
+from itertools import product
+
+from game.models import CellContent
+
+ENCODINGS = ("json", "compact")
+
+# 72 characters that JSON doesn't need to escape, one per possible cell content
+COMPACT_ALPHABET = (
+    "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ-_.~!*()+,"
+)
+
+_CODES = {
+    (is_mine, is_revealed, is_flagged, adjacent_mines): COMPACT_ALPHABET[
+        adjacent_mines + 9 * (is_mine + 2 * is_revealed + 4 * is_flagged)
+    ]
+    for is_flagged, is_revealed, is_mine, adjacent_mines in product(
+        (False, True), (False, True), (False, True), range(9)
+    )
+}
+
+
+def get_encoding(encoding: str | None) -> str:
+    return encoding if encoding in ENCODINGS else "json"
+
+
+def encode_cell(cell: CellContent) -> str:
+    return _CODES[
+        (
+            cell["is_mine"],
+            cell["is_revealed"],
+            cell["is_flagged"],
+            cell["adjacent_mines"],
+        )
+    ]
+
+
+def decode_cell(row: int, column: int, character: str) -> CellContent:
+    code = COMPACT_ALPHABET.index(character)
+    adjacent_mines, flags = code % 9, code // 9
+    return CellContent(
+        row=row,
+        column=column,
+        is_mine=bool(flags & 1),
+        is_revealed=bool(flags & 2),
+        is_flagged=bool(flags & 4),
+        adjacent_mines=adjacent_mines,
+    )
+
+
+def encode_game_map_state(game_map_state: dict) -> dict:
+    """
+    Encode the map, the changed cells ("changes") and the updated cells ("cells")
+    of a serialized game map state, leaving the other keys untouched.
+    """
+    encoded = {**game_map_state, "encoding": "compact"}
+
+    if "map" in game_map_state:
+        encoded["map"] = [
+            "".join(encode_cell(cell) for cell in row) for row in game_map_state["map"]
+        ]
+
+    for key in ("changes", "cells"):
+        if key in game_map_state:
+            encoded[key] = [
+                [cell["row"], cell["column"], encode_cell(cell)]
+                for cell in game_map_state[key]
+            ]
+
+    return encoded
@@ -0,0 +1,291 @@
+"""
+In-process authoritative game engine.
+
+Every active game gets a GameEngine holding its board in memory. Moves are
+applied to the in-memory board, so they don't read from the database, and the
+changes are written behind in batches by a background flusher thread:
+
+- a game is flushed once it has been idle for GAME_ENGINE_FLUSH_IDLE_SECONDS,
+- a busy game is flushed at least every GAME_ENGINE_FLUSH_MAX_DELAY_SECONDS,
+- a game is flushed right away when it ends, and every game is flushed on exit.
+
+The engine is the source of truth for the games it holds, so all the moves of a
+game must reach the same process (e.g. a single Daphne instance).
+"""
+
+import atexit
+import copy
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from game import stats, use_cases
+from game.board import Board, load_board, save_board
+from game.map_cache import cache_game_version
+from game.models import Game, GameEvents, GameMapState, GameMove
+
+logger = logging.getLogger(__name__)
+
+
+class EngineEvicted(Exception):
+    """The engine was dropped from the registry, the game must be loaded again."""
+
+
+class GameEngine:
+    def __init__(self, game: Game, board: Board):
+        self.game = game
+        self.board = board
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending_events: list[GameEvents] = []
+        self.last_move_at = time.monotonic()
+        self.last_flush_at = self.last_move_at
+        self.evicted = False
+        # State of the game last written to the database
+        self.flushed_state = game.state
+
+    @classmethod
+    def load(cls, code: str) -> "GameEngine":
+        game = use_cases._get_game_by_code(code)
+        return cls(game, load_board(game))
+
+    @property
+    def is_dirty(self) -> bool:
+        return bool(self.board.changed or self.pending_events)
+
+    def get_game_map(self) -> GameMapState:
+        with self.lock:
+            return use_cases._get_game_map(self.game, self.board)
+
+    def play_move(
+        self, row: int, column: int, user: str, with_map: bool = True
+    ) -> GameMapState | None:
+        with self.lock:
+            if self.evicted:
+                raise EngineEvicted()
+            changed = use_cases._apply_move(self.game, self.board, row, column)
+            if changed is None:
+                return None
+            self._record_event(row, column, user)
+            game_map_state = use_cases._get_game_map(
+                self.game, self.board, changed, with_map
+            )
+
+        if self.game.state != "ongoing":
+            try:
+                self.flush()
+            except Exception:
+                # The flusher thread retries it, the game is still dirty
+                logger.exception(f"Failed to flush finished game {self.game.code}")
+        return game_map_state
+
+    def change_flag(
+        self, row: int, column: int, user: str, with_map: bool = True
+    ) -> GameMapState | None:
+        with self.lock:
+            if self.evicted:
+                raise EngineEvicted()
+            changed = use_cases._apply_flag(self.game, self.board, row, column)
+            if changed is None:
+                return None
+            self._record_event(row, column, user)
+            return use_cases._get_game_map(self.game, self.board, changed, with_map)
+
+    def play_moves(
+        self, moves: list[GameMove], with_map: bool = True
+    ) -> GameMapState | None:
+        with self.lock:
+            if self.evicted:
+                raise EngineEvicted()
+            changed, events = use_cases._apply_moves(self.game, self.board, moves)
+            if not events:
+                return None
+            self.pending_events.extend(
+                GameEvents(game=self.game, **event) for event in events
+            )
+            self.last_move_at = time.monotonic()
+            game_map_state = use_cases._get_game_map(
+                self.game, self.board, changed, with_map
+            )
+
+        if self.game.state != "ongoing":
+            try:
+                self.flush()
+            except Exception:
+                logger.exception(f"Failed to flush finished game {self.game.code}")
+        return game_map_state
+
+    def _record_event(self, row: int, column: int, user: str):
+        event = use_cases._get_move_event(self.game, self.board, row, column)
+        self.pending_events.append(
+            GameEvents(game=self.game, row=row, column=column, event=event, user=user)
+        )
+        self.last_move_at = time.monotonic()
+
+    def flush(self):
+        """
+        Write the board changes and the pending events to the database.
+
+        The in-memory state is snapshotted under the game lock, so moves keep
+        being applied while the snapshot is written.
+        """
+        with self.flush_lock:
+            with self.lock:
+                if not self.is_dirty:
+                    return
+                game = copy.copy(self.game)
+                board = self.board.copy()
+                board.changed, self.board.changed = self.board.changed, set()
+                events, self.pending_events = self.pending_events, []
+
+            try:
+                with transaction.atomic():
+                    save_board(game, board, use_cases.GAME_MOVE_FIELDS)
+                    GameEvents.objects.bulk_create(events)
+                    if game.state != self.flushed_state:
+                        stats.record_finished_game(game)
+            except Exception:
+                # Keep the changes around so the next flush retries them
+                with self.lock:
+                    self.board.changed |= board.changed
+                    self.pending_events = events + self.pending_events
+                raise
+
+            cache_game_version(game.code, game.version, game.state == "ongoing")
+            self.flushed_state = game.state
+            self.last_flush_at = time.monotonic()
+
+
+_engines: dict[str, GameEngine] = {}
+_engines_lock = threading.Lock()
+# Number of engines evicted so far, see get_engine
+_evictions = 0
+_flusher: threading.Thread | None = None
+
+
+def get_engine(code: str) -> GameEngine:
+    while True:
+        with _engines_lock:
+            engine = _engines.get(code)
+            evictions = _evictions
+            _start_flusher()
+        if engine is not None:
+            return engine
+
+        # Loaded without the lock, so a slow load doesn't hold the moves of the
+        # other games nor the flusher
+        loaded = GameEngine.load(code)
+        with _engines_lock:
+            # The engine another thread loaded in the meantime wins. A load that
+            # overlapped an eviction may have read the game before the evicted
+            # engine was flushed, it's loaded again
+            if code in _engines or _evictions == evictions:
+                return _engines.setdefault(code, loaded)
+
+
+def flush_all():
+    for code, engine in list(_engines.items()):
+        try:
+            engine.flush()
+        except Exception:
+            logger.exception(f"Failed to flush game {code}")
+
+
+def _should_flush(engine: GameEngine, now: float) -> bool:
+    if not engine.is_dirty:
+        return False
+    return (
+        engine.game.state != "ongoing"
+        or now - engine.last_move_at >= settings.GAME_ENGINE_FLUSH_IDLE_SECONDS
+        or now - engine.last_flush_at >= settings.GAME_ENGINE_FLUSH_MAX_DELAY_SECONDS
+    )
+
+
+def _should_evict(engine: GameEngine, now: float) -> bool:
+    if engine.is_dirty:
+        return False
+    return (
+        engine.game.state != "ongoing"
+        or now - engine.last_move_at >= settings.GAME_ENGINE_EVICT_IDLE_SECONDS
+    )
+
+
+def _run_flusher():
+    while True:
+        time.sleep(settings.GAME_ENGINE_FLUSH_INTERVAL_SECONDS)
+        close_old_connections()
+        _flush_and_evict(time.monotonic())
+
+
+def _flush_and_evict(now: float):
+    global _evictions
+    for code, engine in list(_engines.items()):
+        try:
+            if _should_flush(engine, now):
+                engine.flush()
+        except Exception:
+            logger.exception(f"Failed to flush game {code}")
+
+        with _engines_lock, engine.lock:
+            if _should_evict(engine, now):
+                engine.evicted = True
+                _engines.pop(code, None)
+                _evictions += 1
+
+
+def _start_flusher():
+    global _flusher
+    if _flusher is None:
+        _flusher = threading.Thread(
+            target=_run_flusher, name="game-engine-flusher", daemon=True
+        )
+        _flusher.start()
+        atexit.register(flush_all)
+
+
+def get_game_map_by_code(code: str) -> GameMapState:
+    engine = _engines.get(code)
+    if engine is None:
+        return use_cases.get_game_map_by_code(code)
+    return engine.get_game_map()
+
+
+def play_move(
+    code: str, row: int, column: int, user: str, with_map: bool = True
+) -> GameMapState | None:
+    while True:
+        try:
+            return get_engine(code).play_move(row, column, user, with_map)
+        except EngineEvicted:
+            continue
+
+
+def change_flag(
+    code: str, row: int, column: int, user: str, with_map: bool = True
+) -> GameMapState | None:
+    while True:
+        try:
+            return get_engine(code).change_flag(row, column, user, with_map)
+        except EngineEvicted:
+            continue
+
+
+def play_moves(
+    code: str, moves: list[GameMove], with_map: bool = True
+) -> GameMapState | None:
+    while True:
+        try:
+            return get_engine(code).play_moves(moves, with_map)
+        except EngineEvicted:
+            continue
+
+
+def chord(
+    code: str, row: int, column: int, user: str, with_map: bool = True
+) -> GameMapState | None:
+    # A batch of a single chord is applied and flushed like any other batch
+    move = GameMove(type="chord", row=row, column=column, user=user)
+    return play_moves(code, [move], with_map)
@@ -0,0 +1,120 @@
+"""
+Board generation.
+
+Mines are sampled without replacement and the adjacent mines counts come from a
+single 3x3 neighbourhood convolution over the mines, so generating a board is a
+handful of vectorized operations regardless of its size or density.
+
+Boards too large to be held in memory at once are generated in bands of rows,
+see generate_board_bands.
+"""
+
+from typing import Iterator
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from game.board import MINE, Board
+
+
+def generate_mines(
+    rows: int,
+    columns: int,
+    mines: int,
+    seed: int | None = None,
+    safe: int | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the mines mask and the adjacent mines count of every cell.
+    The same seed always generates the same board.
+
+    With a safe cell, no mine is placed on it nor, if the board has room for
+    the mines elsewhere, on its neighbours, so revealing it opens an area.
+    """
+    rng = np.random.default_rng(seed)
+    if safe is None:
+        positions = rng.choice(rows * columns, size=mines, replace=False)
+    else:
+        candidates = np.setdiff1d(
+            np.arange(rows * columns), _safe_area(rows, columns, mines, safe)
+        )
+        positions = candidates[rng.choice(candidates.size, size=mines, replace=False)]
+
+    flat_mines = np.zeros(rows * columns, dtype=np.uint8)
+    flat_mines[positions] = 1
+    is_mine = flat_mines.reshape(rows, columns)
+
+    padded = np.pad(is_mine, 1)
+    neighbourhood = sliding_window_view(padded, (3, 3)).sum(axis=(2, 3), dtype=np.uint8)
+    # The neighbourhood of a mine includes the mine itself
+    adjacent_mines = neighbourhood - is_mine
+
+    return is_mine.astype(bool), adjacent_mines
+
+
+def generate_board(
+    rows: int,
+    columns: int,
+    mines: int,
+    seed: int | None = None,
+    safe: int | None = None,
+) -> Board:
+    is_mine, adjacent_mines = generate_mines(rows, columns, mines, seed, safe)
+    cells = adjacent_mines | (is_mine.astype(np.uint8) * MINE)
+    return Board(rows, columns, cells.tobytes())
+
+
+def generate_board_bands(
+    rows: int, columns: int, mines: int, band_rows: int, seed: int | None = None
+) -> Iterator[np.ndarray]:
+    """
+    Generate a board `band_rows` rows at a time, yielding the packed squares of
+    each band as a 2D array, so only three bands are in memory at once.
+
+    The mines are first split between the bands as if they were sampled from
+    the whole board, then sampled within each band. The same seed always
+    generates the same board, but not the one generate_board generates.
+    """
+    rng = np.random.default_rng(seed)
+    heights = [min(band_rows, rows - first) for first in range(0, rows, band_rows)]
+    band_mines = rng.multivariate_hypergeometric(
+        [height * columns for height in heights], mines
+    )
+
+    def sample_band(band: int) -> np.ndarray:
+        is_mine = np.zeros(heights[band] * columns, dtype=np.uint8)
+        is_mine[
+            rng.choice(heights[band] * columns, size=band_mines[band], replace=False)
+        ] = 1
+        return is_mine.reshape(heights[band], columns)
+
+    previous: np.ndarray | None = None
+    current = sample_band(0)
+    for band in range(len(heights)):
+        following = sample_band(band + 1) if band + 1 < len(heights) else None
+
+        # The band with the rows of its neighbours on each side, if any
+        padded = np.zeros((heights[band] + 2, columns + 2), dtype=np.uint8)
+        padded[1:-1, 1:-1] = current
+        if previous is not None:
+            padded[0, 1:-1] = previous[-1]
+        if following is not None:
+            padded[-1, 1:-1] = following[0]
+        neighbourhood = sliding_window_view(padded, (3, 3)).sum(
+            axis=(2, 3), dtype=np.uint8
+        )
+
+        yield (neighbourhood - current) | (current * MINE)
+        previous = current
+        if following is not None:
+            current = following
+
+
+def _safe_area(rows: int, columns: int, mines: int, safe: int) -> list[int]:
+    row, column = divmod(safe, columns)
+    area = [
+        r * columns + c
+        for r in range(max(row - 1, 0), min(row + 2, rows))
+        for c in range(max(column - 1, 0), min(column + 2, columns))
+    ]
+    return area if rows * columns - len(area) >= mines else [safe]
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from game import stats
+from game.models import DifficultyStats, Game, LeaderboardEntry, UserStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the statistics and the leaderboard from the finished games and "
+        "their events, e.g. for the games finished before they were recorded"
+    )
+
+    def handle(self, *args, **options):
+        games = Game.objects.exclude(state="ongoing").filter(ended_at__isnull=False)
+
+        with transaction.atomic():
+            DifficultyStats.objects.all().delete()
+            UserStats.objects.all().delete()
+            LeaderboardEntry.objects.all().delete()
+
+            recorded = 0
+            for game in games.defer("board", "regions").iterator():
+                stats.record_finished_game(game)
+                recorded += 1
+
+        self.stdout.write(f"{recorded} finished games recorded")
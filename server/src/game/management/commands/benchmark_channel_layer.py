@@ -0,0 +1,98 @@
+import asyncio
+import copy
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from game.benchmarks import percentile
+
+LAYERS = ("memory", "redis", "redis-pubsub")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the group fan-out latency of the channel layers: the time from a "
+        "group_send until every channel of the group received the message"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--layers", nargs="+", choices=LAYERS, default=LAYERS)
+        parser.add_argument(
+            "--redis-url",
+            default="redis://localhost:6379/15",
+            help="Redis used by the Redis layers, e.g. the redis service of "
+            "docker-compose. The database is flushed by the core layer.",
+        )
+        parser.add_argument("--receivers", type=int, nargs="+", default=[1, 10, 100])
+        parser.add_argument("--messages", type=int, default=200)
+        parser.add_argument(
+            "--payload",
+            type=int,
+            default=1000,
+            help="Size of the messages in bytes, a 100x100 full map is about 1MB",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'layer':>13} {'receivers':>9} {'p50':>9} {'p95':>9} {'p99':>9} "
+            f"{'msgs/s':>8}"
+        )
+
+        for name in options["layers"]:
+            for receivers in options["receivers"]:
+                try:
+                    layer = _create_layer(name, options["redis_url"])
+                    latencies = asyncio.run(
+                        _measure_fan_out(
+                            layer, receivers, options["messages"], options["payload"]
+                        )
+                    )
+                except Exception as error:
+                    self.stderr.write(f"{name} skipped: {error!r}")
+                    break
+
+                self.stdout.write(
+                    f"{name:>13} {receivers:>9} "
+                    f"{percentile(latencies, 50):>7.2f}ms "
+                    f"{percentile(latencies, 95):>7.2f}ms "
+                    f"{percentile(latencies, 99):>7.2f}ms "
+                    f"{1000 / statistics.mean(latencies):>8.0f}"
+                )
+
+
+def _create_layer(name: str, redis_url: str):
+    # Configured like the server, see base.settings.CHANNEL_LAYERS, but on the
+    # Redis given to the benchmark
+    config = copy.deepcopy(settings.CHANNEL_LAYERS[name]).get("CONFIG", {})
+    if "hosts" in config:
+        config["hosts"] = [{**host, "address": redis_url} for host in config["hosts"]]
+    return import_string(settings.CHANNEL_LAYERS[name]["BACKEND"])(**config)
+
+
+async def _measure_fan_out(
+    layer, receivers: int, messages: int, payload: int
+) -> list[float]:
+    group = "benchmark"
+    channels = [await layer.new_channel() for _ in range(receivers)]
+    for channel in channels:
+        await layer.group_add(group, channel)
+
+    latencies = []
+    try:
+        for index in range(messages):
+            start = time.perf_counter()
+            await layer.group_send(
+                group, {"type": "benchmark", "index": index, "payload": "x" * payload}
+            )
+            await asyncio.gather(*(layer.receive(channel) for channel in channels))
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        for channel in channels:
+            await layer.group_discard(group, channel)
+        if hasattr(layer, "flush"):
+            await layer.flush()
+
+    return latencies
@@ -0,0 +1,74 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from game.board import Board
+from game.generation import generate_board
+from game.regions import RegionIndex, flood_reveal
+
+
+class Command(BaseCommand):
+    help = "Measure the latency of revealing the largest empty region of a board"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[16, 100, 250, 500, 1000],
+            help="Board sizes to measure, every board is square",
+        )
+        parser.add_argument(
+            "--density",
+            type=float,
+            default=0.05,
+            help="Ratio of mines on the board, sparse boards have larger regions",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'board':>11} {'region':>9} {'labelling':>11} "
+            f"{'indexed reveal':>15} {'flood reveal':>13}"
+        )
+
+        for size in options["sizes"]:
+            mines = int(size * size * options["density"])
+            board = generate_board(size, size, mines)
+
+            labelling = _measure(lambda: RegionIndex.build(board), options["repeat"])
+            regions = RegionIndex.build(board)
+
+            # Click on the largest empty region, the worst case of a cascade
+            labels = regions.labels.ravel()
+            counts = labels[labels > 0]
+            if counts.size == 0:
+                self.stdout.write(f"{size:>5}x{size:<5} has no empty region")
+                continue
+            largest = int(statistics.mode(counts.tolist()))
+            cell = int((labels == largest).argmax())
+            region_size = int((labels == largest).sum())
+
+            indexed = _measure(
+                lambda: regions.reveal(Board(size, size, board.cells), cell),
+                options["repeat"],
+            )
+            flood = _measure(
+                lambda: flood_reveal(Board(size, size, board.cells), cell),
+                options["repeat"],
+            )
+
+            self.stdout.write(
+                f"{size:>5}x{size:<5} {region_size:>9} {labelling:>9.2f}ms "
+                f"{indexed:>13.2f}ms {flood:>11.2f}ms"
+            )
+
+
+def _measure(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
@@ -0,0 +1,267 @@
+import json
+import platform
+import statistics
+import time
+from datetime import datetime, timezone
+
+import django
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from game import use_cases
+from game.benchmarks import percentile
+from game.board import Board
+from game.generation import generate_board
+from game.models import Game
+from game.regions import RegionIndex
+
+# Named boards, with their number of mines
+PRESETS = {
+    "beginner": (9, 9, 10),
+    "intermediate": (16, 16, 40),
+    "expert": (16, 30, 99),
+}
+SQUARE_SIZES = ("100", "250", "500", "1000")
+
+Position = tuple[int, int]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the hot paths of game.use_cases across board sizes and mine "
+        "densities, write the results as JSON and compare them with a baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--boards",
+            nargs="+",
+            choices=[*PRESETS, *SQUARE_SIZES],
+            default=[*PRESETS, *SQUARE_SIZES],
+            help="Named boards, or the size of square boards",
+        )
+        parser.add_argument(
+            "--densities",
+            type=float,
+            nargs="+",
+            default=[0.1, 0.2],
+            help="Ratios of mines of the square boards",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="File to write the results to")
+        parser.add_argument(
+            "--compare",
+            nargs="+",
+            metavar="RESULTS",
+            help="Compare with the results of a previous run. With two files, "
+            "compare them without running the benchmarks.",
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=1.2,
+            help="Ratio of the median over the baseline reported as a regression",
+        )
+
+    def handle(self, *args, **options):
+        compare = options["compare"] or []
+        if len(compare) > 2:
+            raise CommandError("--compare takes one or two result files")
+
+        if len(compare) == 2:
+            results = _load(compare[1])
+        else:
+            results = self.run(options)
+            if options["output"]:
+                with open(options["output"], "w") as file:
+                    json.dump(results, file, indent=2)
+                self.stdout.write(f"Results written to {options['output']}")
+
+        if compare:
+            regressions = self.compare(_load(compare[0]), results, options["threshold"])
+            if regressions:
+                raise CommandError(f"{regressions} cases regressed")
+
+    def run(self, options) -> dict:
+        boards = []
+        for board in options["boards"]:
+            if board in PRESETS:
+                boards.append((board, *PRESETS[board]))
+            else:
+                size = int(board)
+                for density in options["densities"]:
+                    boards.append(
+                        (
+                            f"{size}x{size}@{density}",
+                            size,
+                            size,
+                            int(size * size * density),
+                        )
+                    )
+
+        # Large boards are stored tiled, the storage tells which results compare
+        self.stdout.write(
+            f"{'board':>16} {'storage':>8} {'case':>28} {'median':>10} {'p95':>10}"
+        )
+        results = []
+        for name, rows, columns, mines in boards:
+            storage, timings = _measure_board(rows, columns, mines, options)
+            for case, runs in timings.items():
+                result = {
+                    "case": case,
+                    "board": name,
+                    "storage": storage,
+                    "rows": rows,
+                    "columns": columns,
+                    "mines": mines,
+                    "median_ms": statistics.median(runs),
+                    "p95_ms": percentile(runs, 95),
+                    "min_ms": min(runs),
+                    "runs_ms": runs,
+                }
+                results.append(result)
+                self.stdout.write(
+                    f"{name:>16} {storage:>8} {case:>28} "
+                    f"{result['median_ms']:>8.2f}ms {result['p95_ms']:>8.2f}ms"
+                )
+
+        return {
+            "meta": {
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "numpy": np.__version__,
+                "database": connection.vendor,
+                "repeat": options["repeat"],
+                "seed": options["seed"],
+            },
+            "results": results,
+        }
+
+    def compare(self, baseline: dict, results: dict, threshold: float) -> int:
+        baseline_results = {
+            (result["board"], result["case"]): result for result in baseline["results"]
+        }
+
+        self.stdout.write(
+            f"{'board':>16} {'case':>28} {'baseline':>10} {'median':>10} {'ratio':>6}"
+        )
+        regressions = 0
+        for result in results["results"]:
+            key = (result["board"], result["case"])
+            if key not in baseline_results:
+                continue
+            # Results of older runs don't record their storage
+            storages = baseline_results[key].get("storage"), result.get("storage")
+            if None not in storages and storages[0] != storages[1]:
+                self.stdout.write(
+                    f"{key[0]:>16} {key[1]:>28} not compared, stored "
+                    f"{storages[0]} in the baseline and {storages[1]} now"
+                )
+                continue
+            before, after = baseline_results[key]["median_ms"], result["median_ms"]
+            ratio = after / before if before else float("inf")
+            regressed = ratio > threshold
+            regressions += regressed
+            self.stdout.write(
+                f"{key[0]:>16} {key[1]:>28} {before:>8.2f}ms {after:>8.2f}ms "
+                f"{ratio:>5.2f}x{'  REGRESSION' if regressed else ''}"
+            )
+        return regressions
+
+
+def _measure_board(
+    rows: int, columns: int, mines: int, options
+) -> tuple[str, dict[str, list[float]]]:
+    """
+    Timings of each case on the board, with the storage of its games. The games
+    are deleted once measured.
+    """
+    timings: dict[str, list[float]] = {}
+    game_ids: list[int] = []
+    storage = ""
+
+    def measure(case: str, function):
+        start = time.perf_counter()
+        result = function()
+        timings.setdefault(case, []).append((time.perf_counter() - start) * 1000)
+        return result
+
+    try:
+        for repeat in range(options["repeat"]):
+            seed = options["seed"] + repeat
+            board = generate_board(rows, columns, mines, seed)
+            number, mine, flood = _pick_cells(board)
+
+            measure(
+                "_create_initial_game_map",
+                lambda: use_cases._create_initial_game_map(rows, columns, mines, seed),
+            )
+            code = measure(
+                "create_new_game",
+                lambda: use_cases.create_new_game(rows, columns, mines, seed),
+            )
+            game_ids.append(use_cases._convert_code_to_id(code))
+            storage = Game.objects.values_list("storage", flat=True).get(
+                id=game_ids[-1]
+            )
+
+            # A new game, whose map isn't cached yet
+            measure(
+                "get_game_map_by_code", lambda: use_cases.get_game_map_by_code(code)
+            )
+            measure(
+                "get_game_map_by_code_cached",
+                lambda: use_cases.get_game_map_by_code(code),
+            )
+
+            if mine is not None:
+                measure(
+                    "change_flag", lambda: use_cases.change_flag(code, *mine, "bench")
+                )
+            if number is not None:
+                measure(
+                    "play_move", lambda: use_cases.play_move(code, *number, "bench")
+                )
+            if flood is not None:
+                measure(
+                    "play_move_flood",
+                    lambda: use_cases.play_move(code, *flood, "bench"),
+                )
+    finally:
+        Game.objects.filter(id__in=game_ids).delete()
+
+    return storage, timings
+
+
+def _pick_cells(
+    board: Board,
+) -> tuple[Position | None, Position | None, Position | None]:
+    """
+    A numbered cell, a mine and a cell of the largest empty region of the board,
+    None for the ones the board doesn't have.
+    """
+    number = mine = flood = None
+    for index in range(board.rows * board.columns):
+        if number is None and not board.is_mine(index) and board.adjacent_mines(index):
+            number = board.position(index)
+        if mine is None and board.is_mine(index):
+            mine = board.position(index)
+        if number is not None and mine is not None:
+            break
+
+    labels = RegionIndex.build(board).labels.ravel()
+    if labels.any():
+        largest = int(np.bincount(labels)[1:].argmax()) + 1
+        flood = board.position(int((labels == largest).argmax()))
+    return number, mine, flood
+
+
+def _load(path: str) -> dict:
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError) as error:
+        raise CommandError(f"Can't read the results of {path}: {error}")
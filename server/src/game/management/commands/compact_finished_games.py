@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from game.compaction import compact_finished_games
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive finished games as a compressed board and delete their Cell rows, "
+        "see game.compaction"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            help="Games to archive, GAME_COMPACTION_GAMES_PER_RUN by default",
+        )
+
+    def handle(self, *args, **options):
+        report = compact_finished_games(options["limit"])
+        self.stdout.write(f"games archived:    {report['games']}")
+        self.stdout.write(f"cell rows deleted: {report['cell_rows']}")
+        before, after = report["board_bytes_before"], report["board_bytes_after"]
+        self.stdout.write(
+            f"board bytes:       {before} -> {after} ({before - after} reclaimed)"
+        )
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from game.board import load_board
+from game.models import Cell, Game
+from game.replay import replay_board
+
+
+class Command(BaseCommand):
+    help = (
+        "Drop the stored board of cold games that can be rebuilt from their seed "
+        "and events, see game.replay"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--idle-hours",
+            type=float,
+            default=24,
+            help="Ongoing games without moves for this long are cold, "
+            "finished games always are",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options["idle_hours"])
+        games = (
+            Game.objects.filter(seed__isnull=False, pooled=False)
+            # Tiled boards are too large to be rebuilt on every load, lazy ones
+            # have no mines to rebuild yet, archived ones are already compacted
+            .exclude(
+                storage__in=[
+                    Game.Storage.EVENTS,
+                    Game.Storage.TILED,
+                    Game.Storage.LAZY,
+                    Game.Storage.ARCHIVED,
+                ]
+            )
+            .annotate(last_event_at=Max("event__created_at"))
+            .filter(
+                ~Q(state="ongoing")
+                | Q(last_event_at__lt=cutoff)
+                | Q(last_event_at__isnull=True, created_at__lt=cutoff)
+            )
+        )
+
+        dropped = mismatched = 0
+        for game in games.iterator():
+            # Only drop boards the events rebuild exactly
+            if replay_board(game).cells != load_board(game).cells:
+                mismatched += 1
+                self.stderr.write(f"Game {game.code} doesn't match its events, kept")
+                continue
+
+            if not options["dry_run"] and not _drop_board(game):
+                continue
+            dropped += 1
+
+        self.stdout.write(
+            f"{'Would drop' if options['dry_run'] else 'Dropped'} {dropped} boards, "
+            f"{mismatched} games didn't match their events"
+        )
+
+
+def _drop_board(game: Game) -> bool:
+    with transaction.atomic():
+        # Skipped if a move changed the game since it was checked, or if it was
+        # archived in the meantime, see game.compaction
+        updated = Game.objects.filter(
+            id=game.id, version=game.version, storage=game.storage
+        ).update(storage=Game.Storage.EVENTS, board=None)
+        if updated and game.storage == Game.Storage.CELLS:
+            Cell.objects.filter(game=game).delete()
+    return bool(updated)
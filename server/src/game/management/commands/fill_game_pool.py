@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from game import use_cases
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the games missing from the pool of each preset of "
+        "GAME_POOL_PRESETS, e.g. without a Celery beat running"
+    )
+
+    def handle(self, *args, **options):
+        generated = use_cases.fill_game_pool()
+        self.stdout.write(f"{generated} games generated")
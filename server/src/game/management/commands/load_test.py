@@ -0,0 +1,229 @@
+import asyncio
+import json
+import random
+import statistics
+import threading
+import time
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.db.backends.signals import connection_created
+from django.db import connections
+from django.urls import re_path
+
+from game import consumers, engine, use_cases
+from game.benchmarks import percentile
+from game.board import load_board
+from game.models import Game
+
+
+class Command(BaseCommand):
+    help = (
+        "Play games end to end through the game websocket consumer, with several "
+        "rooms of several players, and report the move to broadcast latency, the "
+        "throughput and the database queries"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=10)
+        parser.add_argument("--players", type=int, default=4, help="Per room")
+        parser.add_argument("--moves", type=int, default=20, help="Per player")
+        parser.add_argument("--size", type=int, default=30, help="Board size")
+        parser.add_argument("--flags", type=float, default=0.3, help="Ratio of flags")
+        parser.add_argument("--consumer", choices=["sync", "async"], default="sync")
+        parser.add_argument(
+            "--protocol", choices=consumers.MAP_PROTOCOLS[:2], default="delta"
+        )
+        parser.add_argument(
+            "--think-ms", type=float, default=0, help="Pause of a player between moves"
+        )
+        parser.add_argument("--timeout", type=float, default=10)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        rooms: list[tuple[str, list[list[dict]]]] = []
+        try:
+            for _ in range(options["rooms"]):
+                rooms.append(_plan_room(options, rng))
+            self.run(rooms, options)
+        finally:
+            # Moves held by the game engine are written before their game is gone
+            engine.flush_all()
+            Game.objects.filter(
+                id__in=[use_cases._convert_code_to_id(code) for code, _ in rooms]
+            ).delete()
+
+    def run(self, rooms: list[tuple[str, list[list[dict]]]], options):
+        consumer = (
+            consumers.AsyncGameConsumer
+            if options["consumer"] == "async"
+            else consumers.GameConsumer
+        )
+        application = URLRouter(
+            [re_path(r"ws/game/(?P<room_name>\w+)/$", consumer.as_asgi())]
+        )
+
+        with _QueryCounter() as queries:
+            start = time.perf_counter()
+            results = asyncio.run(_run(application, rooms, options))
+            elapsed = time.perf_counter() - start
+
+        latencies = [latency for result in results for latency in result.latencies]
+        timeouts = sum(result.timeouts for result in results)
+        moves = len(latencies)
+
+        self.stdout.write(
+            f"{options['rooms']} rooms x {options['players']} players x "
+            f"{options['moves']} moves, {options['consumer']} consumer, "
+            f"{options['protocol']} protocol"
+        )
+        self.stdout.write(f"moves:        {moves} ({timeouts} timed out)")
+        self.stdout.write(f"duration:     {elapsed:.2f}s")
+        self.stdout.write(f"throughput:   {moves / elapsed:.1f} moves/s")
+        if latencies:
+            self.stdout.write(
+                f"latency:      p50 {percentile(latencies, 50):.1f}ms, "
+                f"p95 {percentile(latencies, 95):.1f}ms, "
+                f"p99 {percentile(latencies, 99):.1f}ms, "
+                f"mean {statistics.mean(latencies):.1f}ms"
+            )
+        self.stdout.write(
+            f"queries:      {queries.count} "
+            f"({queries.count / max(moves, 1):.1f} per move)"
+        )
+
+
+class _PlayerResult:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.timeouts = 0
+
+
+def _plan_room(options, rng: random.Random) -> tuple[str, list[list[dict]]]:
+    """
+    Create a game and the moves of each of its players.
+
+    Every move is valid and changes a different cell, so the broadcast of a move
+    is the first one showing its cell changed: players flag mines and reveal
+    safe cells next to mines, which never ends the game nor cascades.
+    """
+    size = options["size"]
+    code = use_cases.create_new_game(size, size, size * size // 6)
+    game = use_cases._get_game_by_code(code)
+    board = load_board(game)
+
+    mines = [index for index in range(size * size) if board.is_mine(index)]
+    numbers = [
+        index
+        for index in range(size * size)
+        if not board.is_mine(index) and board.adjacent_mines(index)
+    ]
+    rng.shuffle(mines)
+    rng.shuffle(numbers)
+
+    players = []
+    for _ in range(options["players"]):
+        moves = []
+        for _ in range(options["moves"]):
+            flag = rng.random() < options["flags"]
+            cells = mines if flag and mines else numbers
+            if not cells:
+                break
+            row, column = board.position(cells.pop())
+            moves.append(
+                {"row": row, "column": column, "type": "flag" if flag else "reveal"}
+            )
+        players.append(moves)
+    return code, players
+
+
+async def _run(application, rooms, options) -> list[_PlayerResult]:
+    communicators = []
+    for code, players in rooms:
+        for player in range(len(players)):
+            communicator = WebsocketCommunicator(
+                application,
+                f"/ws/game/{code}/?user=player{player}&protocol={options['protocol']}",
+            )
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise RuntimeError(f"Player {player} couldn't connect to {code}")
+            communicators.append((communicator, f"player{player}", players[player]))
+
+    try:
+        return await asyncio.gather(
+            *(
+                _play(communicator, user, moves, options)
+                for communicator, user, moves in communicators
+            )
+        )
+    finally:
+        for communicator, _, _ in communicators:
+            await communicator.disconnect()
+
+
+async def _play(communicator, user: str, moves: list[dict], options) -> _PlayerResult:
+    result = _PlayerResult()
+    for move in moves:
+        start = time.perf_counter()
+        await communicator.send_to(text_data=json.dumps({**move, "user": user}))
+        try:
+            await asyncio.wait_for(
+                _wait_for_broadcast(communicator, move), options["timeout"]
+            )
+        except asyncio.TimeoutError:
+            result.timeouts += 1
+            continue
+        result.latencies.append((time.perf_counter() - start) * 1000)
+
+        if options["think_ms"]:
+            await asyncio.sleep(options["think_ms"] / 1000)
+    return result
+
+
+async def _wait_for_broadcast(communicator, move: dict):
+    key = "is_flagged" if move["type"] == "flag" else "is_revealed"
+    while True:
+        message = json.loads(await communicator.receive_from(timeout=3600))
+        if message.get("type") == "update.cells":
+            cells = message["map"]["cells"]
+        elif message.get("type") == "update.map" and message["map"]["map"]:
+            cells = [message["map"]["map"][move["row"]][move["column"]]]
+        else:
+            continue
+        if any(
+            cell["row"] == move["row"]
+            and cell["column"] == move["column"]
+            and cell[key]
+            for cell in cells
+        ):
+            return
+
+
+class _QueryCounter:
+    """Counts the queries run on every database connection, from any thread."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def _install(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        # Connections are per thread, the consumers open new ones as they run
+        connection_created.connect(self._install)
+        for connection in connections.all(initialized_only=True):
+            self._install(None, connection)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self._install)
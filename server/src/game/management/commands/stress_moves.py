@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from game import use_cases
+from game.board import GameVersionConflict
+from game.models import Game
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Play concurrent moves on a single game and report the throughput, "
+        "checking that no move was lost"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16])
+        parser.add_argument("--moves", type=int, default=50, help="Moves per thread")
+        parser.add_argument("--size", type=int, default=50, help="Board size")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'threads':>7} {'moves':>7} {'invalid':>7} {'conflict':>8} "
+            f"{'errors':>6} {'seconds':>8} {'moves/s':>8} {'lost':>5}"
+        )
+
+        for threads in options["threads"]:
+            size = options["size"]
+            # No mines, so no move ends the game
+            code = use_cases.create_new_game(size, size, 0)
+            game_id = use_cases._convert_code_to_id(code)
+            try:
+                result = _play(code, threads, options["moves"], size)
+
+                # Every applied move bumps the version exactly once
+                version = Game.objects.get(id=game_id).version
+            finally:
+                Game.objects.filter(id=game_id).delete()
+            lost = result.applied - version
+            errors = sum(result.errors.values())
+
+            self.stdout.write(
+                f"{threads:>7} {result.applied:>7} {result.invalid:>7} "
+                f"{result.conflicts:>8} {errors:>6} {result.elapsed:>8.2f} "
+                f"{result.applied / result.elapsed:>8.0f} {lost:>5}"
+            )
+            if lost:
+                self.stderr.write(f"{lost} moves were lost on game {code}")
+            for error, count in result.errors.most_common():
+                self.stderr.write(f"{count} moves failed with {error}")
+
+
+class _PlayResult:
+    def __init__(self):
+        self.applied = 0
+        self.invalid = 0  # moves the game rejected
+        self.conflicts = 0  # moves that lost every retry, see use_cases._run_move
+        self.errors: Counter[str] = Counter()  # moves that raised, by exception
+        self.elapsed = 0.0
+
+
+def _play(code: str, threads: int, moves: int, size: int) -> _PlayResult:
+    result = _PlayResult()
+    counter_lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def play(thread: int):
+        barrier.wait()
+        try:
+            for move in range(moves):
+                # Every thread toggles flags on its own cells of the same game
+                cell = (thread * moves + move) % (size * size)
+                row, column = divmod(cell, size)
+                try:
+                    game_map_state = use_cases.change_flag(
+                        code, row, column, f"user{thread}"
+                    )
+                except GameVersionConflict:
+                    with counter_lock:
+                        result.conflicts += 1
+                    continue
+                except Exception as error:
+                    logger.exception(f"Move {row}, {column} failed on game {code}")
+                    with counter_lock:
+                        result.errors[type(error).__name__] += 1
+                    continue
+
+                with counter_lock:
+                    if game_map_state is None:
+                        result.invalid += 1
+                    else:
+                        result.applied += 1
+        finally:
+            connection.close()
+
+    workers = [
+        threading.Thread(target=play, args=(thread,)) for thread in range(threads)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    result.elapsed = time.perf_counter() - start
+    return result
@@ -0,0 +1,81 @@
+"""
+Cache of the rendered game map state, so reading a game doesn't load its board
+nor render its map again until a move changes it.
+
+Cached states are keyed by the game code and version, and the current version
+of each game is cached next to them, so a cached map is read without touching
+the database. Every process that saves a move sets the new version right after
+its commit, so a state is not served once a move changed the game, whichever
+process applied the move. Writing a version drops the state of the previous one.
+
+Two moves committed at the same time can set their versions out of order, so
+the versions of ongoing games expire after GAME_MAP_CACHE_VERSION_TTL_SECONDS,
+which bounds how long such a stale version is read. Finished games never change
+again, their version is kept as long as their state.
+"""
+
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+
+from game.models import GameMapState
+
+
+def _get_cache():
+    return caches[settings.GAME_MAP_CACHE]
+
+
+def _cache_key(code: str, version: int) -> str:
+    return f"game_map:{code}:{version}"
+
+
+def _version_key(code: str) -> str:
+    return f"game_version:{code}"
+
+
+def get_cached_game_version(code: str) -> int | None:
+    return _get_cache().get(_version_key(code))
+
+
+def cache_game_version(code: str, version: int, ongoing: bool = True):
+    """Set the version of a game, once a move saving it was committed."""
+    _get_cache().set(_version_key(code), version, timeout=_version_timeout(ongoing))
+
+
+def add_game_version(code: str, version: int):
+    """
+    Cache the version of a game read from the database, unless a move set it
+    since, whose version is newer than the one read.
+    """
+    _get_cache().add(_version_key(code), version, timeout=_version_timeout(True))
+
+
+def _version_timeout(ongoing: bool) -> int:
+    if ongoing:
+        return settings.GAME_MAP_CACHE_VERSION_TTL_SECONDS
+    return settings.GAME_MAP_CACHE_TTL_SECONDS
+
+
+def get_cached_game_map(code: str, version: int) -> GameMapState | None:
+    game_map_state = _get_cache().get(_cache_key(code, version))
+    if game_map_state is None:
+        return None
+
+    if game_map_state["state"] == "ongoing":
+        delta_time = datetime.now(timezone.utc) - game_map_state["started_at"]
+        game_map_state["total_time_in_seconds"] = delta_time.total_seconds()
+    return game_map_state
+
+
+def cache_game_map(game_map_state: GameMapState):
+    cache = _get_cache()
+    code, version = game_map_state["code"], game_map_state["version"]
+
+    cache.set(
+        _cache_key(code, version),
+        GameMapState(**{**game_map_state, "changes": []}),
+        timeout=settings.GAME_MAP_CACHE_TTL_SECONDS,
+    )
+    if version:
+        cache.delete(_cache_key(code, version - 1))
@@ -0,0 +1,135 @@
+"""
+Latency, query count and payload size metrics of the game operations.
+
+Operations are measured with track(), labelled with the operation name and the
+size of the board (its number of squares, rounded up to a power of 10), and
+exposed in the Prometheus text format by the metrics view.
+
+Metrics are only recorded with GAME_METRICS_ENABLED, otherwise track() does
+nothing but read the setting. They are kept in the memory of each process, so
+every server process must be scraped.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from django.conf import settings
+from django.db import connection
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+PAYLOAD_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+BOARD_SIZES = (100, 1_000, 10_000, 100_000, 1_000_000)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # Labels -> count of each bucket (not cumulative), sum, count
+        self._series: dict[tuple[str, str], tuple[list[int], list[float]]] = {}
+
+    def observe(self, operation: str, board: str, value: float):
+        with self._lock:
+            series = self._series.get((operation, board))
+            if series is None:
+                series = self._series[(operation, board)] = (
+                    [0] * (len(self.buckets) + 1),
+                    [0.0, 0.0],
+                )
+            counts, totals = series
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = sorted(
+                (labels, list(counts), list(totals))
+                for labels, (counts, totals) in self._series.items()
+            )
+        for (operation, board), counts, (total, count) in series:
+            labels = f'operation="{operation}",board_cells="{board}"'
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+            yield f"{self.name}_sum{{{labels}}} {total}"
+            yield f"{self.name}_count{{{labels}}} {int(count)}"
+
+
+operation_seconds = Histogram(
+    "oursweeper_operation_seconds", "Duration of the game operations", LATENCY_BUCKETS
+)
+operation_queries = Histogram(
+    "oursweeper_operation_queries",
+    "Database queries run by the game operations",
+    QUERY_BUCKETS,
+)
+payload_bytes = Histogram(
+    "oursweeper_payload_bytes", "Size of the game map payloads", PAYLOAD_BUCKETS
+)
+
+
+def board_label(cells: int | None) -> str:
+    if cells is None:
+        return "unknown"
+    for size in BOARD_SIZES:
+        if cells <= size:
+            return str(size)
+    return "+Inf"
+
+
+class Tracked:
+    """Details of a tracked operation, known once it has run."""
+
+    __slots__ = ("cells", "payload")
+
+    def __init__(self):
+        self.cells: int | None = None
+        self.payload: int | None = None  # size in bytes
+
+
+@contextmanager
+def track(operation: str, cells: int | None = None) -> Iterator[Tracked]:
+    """
+    Record the duration and the queries of the operation run in the block.
+    The board size and payload size can be set on the yielded object.
+    """
+    tracked = Tracked()
+    tracked.cells = cells
+    if not settings.GAME_METRICS_ENABLED:
+        yield tracked
+        return
+
+    queries = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    with connection.execute_wrapper(count_query):
+        yield tracked
+    elapsed = time.perf_counter() - start
+
+    board = board_label(tracked.cells)
+    operation_seconds.observe(operation, board, elapsed)
+    operation_queries.observe(operation, board, queries)
+    if tracked.payload is not None:
+        payload_bytes.observe(operation, board, tracked.payload)
+
+
+def render() -> str:
+    lines: list[str] = []
+    for histogram in (operation_seconds, operation_queries, payload_bytes):
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,93 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:17
+
+from django.db import migrations, models
+
+# Packed layout of a square, kept here so the migration doesn't depend on game.board
+ADJACENT_MINES_MASK = 0x0F
+MINE = 0x10
+REVEALED = 0x20
+FLAGGED = 0x40
+
+BATCH_SIZE = 5000
+
+
+def pack_cells(apps, schema_editor):
+    Game = apps.get_model("game", "Game")
+    Cell = apps.get_model("game", "Cell")
+
+    for game in Game.objects.filter(storage="cells").iterator():
+        board = bytearray(game.rows * game.columns)
+        for cell in Cell.objects.filter(game=game).iterator(chunk_size=BATCH_SIZE):
+            board[cell.row * game.columns + cell.column] = (
+                (cell.adjacent_mines & ADJACENT_MINES_MASK)
+                | (MINE if cell.is_mine else 0)
+                | (REVEALED if cell.is_revealed else 0)
+                | (FLAGGED if cell.is_flagged else 0)
+            )
+
+        game.board = bytes(board)
+        game.storage = "packed"
+        game.save(update_fields=["board", "storage"])
+        Cell.objects.filter(game=game).delete()
+
+
+def unpack_cells(apps, schema_editor):
+    Game = apps.get_model("game", "Game")
+    Cell = apps.get_model("game", "Cell")
+
+    for game in Game.objects.filter(storage="packed").iterator():
+        board = bytes(game.board)
+        Cell.objects.bulk_create(
+            (
+                Cell(
+                    game=game,
+                    row=index // game.columns,
+                    column=index % game.columns,
+                    is_mine=bool(square & MINE),
+                    is_revealed=bool(square & REVEALED),
+                    is_flagged=bool(square & FLAGGED),
+                    adjacent_mines=square & ADJACENT_MINES_MASK,
+                )
+                for index, square in enumerate(board)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+
+        game.board = None
+        game.storage = "cells"
+        game.save(update_fields=["board", "storage"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="board",
+            field=models.BinaryField(null=True),
+        ),
+        # Existing games keep their Cell rows until they are packed below
+        migrations.AddField(
+            model_name="game",
+            name="storage",
+            field=models.CharField(
+                choices=[("cells", "Cells"), ("packed", "Packed")],
+                default="cells",
+                max_length=10,
+            ),
+        ),
+        migrations.RunPython(pack_cells, unpack_cells),
+        migrations.AlterField(
+            model_name="game",
+            name="storage",
+            field=models.CharField(
+                choices=[("cells", "Cells"), ("packed", "Packed")],
+                default="packed",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0002_packed_board_storage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="regions",
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0003_board_regions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:31
+
+from django.db import migrations, models
+
+# Packed layout of a square, see game.board
+MINE = 0x10
+REVEALED = 0x20
+
+
+def count_safe_cells_remaining(apps, schema_editor):
+    Game = apps.get_model("game", "Game")
+    Cell = apps.get_model("game", "Cell")
+
+    for game in Game.objects.iterator():
+        if game.storage == "packed":
+            game.safe_cells_remaining = sum(
+                1 for square in bytes(game.board) if not square & (MINE | REVEALED)
+            )
+        else:
+            game.safe_cells_remaining = Cell.objects.filter(
+                game=game, is_mine=False, is_revealed=False
+            ).count()
+        game.save(update_fields=["safe_cells_remaining"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0004_game_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="safe_cells_remaining",
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.RunPython(count_safe_cells_remaining, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0005_game_safe_cells_remaining"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="gameevents",
+            name="created_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name="GameEventOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("row", models.PositiveIntegerField()),
+                ("column", models.PositiveIntegerField()),
+                ("event", models.CharField(max_length=50)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("user", models.CharField(max_length=50)),
+                (
+                    "game",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="game.game",
+                    ),
+                ),
+            ],
+        ),
+    ]
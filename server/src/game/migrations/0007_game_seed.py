@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0006_game_event_outbox"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="seed",
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name="game",
+            name="storage",
+            field=models.CharField(
+                choices=[
+                    ("cells", "Cells"),
+                    ("packed", "Packed"),
+                    ("events", "Events"),
+                ],
+                default="packed",
+                max_length=10,
+            ),
+        ),
+    ]
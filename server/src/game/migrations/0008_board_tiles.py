@@ -0,0 +1,64 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0007_game_seed"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="tile_size",
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name="game",
+            name="storage",
+            field=models.CharField(
+                choices=[
+                    ("cells", "Cells"),
+                    ("packed", "Packed"),
+                    ("events", "Events"),
+                    ("tiled", "Tiled"),
+                ],
+                default="packed",
+                max_length=10,
+            ),
+        ),
+        migrations.CreateModel(
+            name="BoardTile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tile_row", models.PositiveIntegerField()),
+                ("tile_column", models.PositiveIntegerField()),
+                ("cells", models.BinaryField()),
+                (
+                    "game",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tiles",
+                        to="game.game",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="boardtile",
+            constraint=models.UniqueConstraint(
+                fields=("game", "tile_row", "tile_column"), name="unique_board_tile"
+            ),
+        ),
+    ]
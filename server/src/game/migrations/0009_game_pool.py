@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0008_board_tiles"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="pooled",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name="game",
+            index=models.Index(
+                condition=models.Q(("pooled", True)),
+                fields=["rows", "columns", "mines", "storage"],
+                name="pooled_game",
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0009_game_pool"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="game",
+            name="safe_cell",
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name="game",
+            name="storage",
+            field=models.CharField(
+                choices=[
+                    ("cells", "Cells"),
+                    ("packed", "Packed"),
+                    ("events", "Events"),
+                    ("tiled", "Tiled"),
+                    ("lazy", "Lazy"),
+                ],
+                default="packed",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0010_game_lazy_storage"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="game",
+            name="storage",
+            field=models.CharField(
+                choices=[
+                    ("cells", "Cells"),
+                    ("packed", "Packed"),
+                    ("events", "Events"),
+                    ("tiled", "Tiled"),
+                    ("lazy", "Lazy"),
+                    ("archived", "Archived"),
+                ],
+                default="packed",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0011_game_archived_storage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DifficultyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rows", models.PositiveIntegerField()),
+                ("columns", models.PositiveIntegerField()),
+                ("mines", models.PositiveIntegerField()),
+                ("games_finished", models.PositiveIntegerField(default=0)),
+                ("games_won", models.PositiveIntegerField(default=0)),
+                ("total_duration_seconds", models.FloatField(default=0)),
+                ("fastest_win_seconds", models.FloatField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="LeaderboardEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rows", models.PositiveIntegerField()),
+                ("columns", models.PositiveIntegerField()),
+                ("mines", models.PositiveIntegerField()),
+                ("duration_seconds", models.FloatField()),
+                ("users", models.JSONField(default=list)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="UserStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("user", models.CharField(max_length=50, unique=True)),
+                ("games_finished", models.PositiveIntegerField(default=0)),
+                ("games_won", models.PositiveIntegerField(default=0)),
+                ("moves", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="difficultystats",
+            constraint=models.UniqueConstraint(
+                fields=("rows", "columns", "mines"), name="unique_difficulty_stats"
+            ),
+        ),
+        migrations.AddField(
+            model_name="leaderboardentry",
+            name="game",
+            field=models.OneToOneField(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="game.game",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="leaderboardentry",
+            index=models.Index(
+                fields=["rows", "columns", "mines", "duration_seconds"],
+                name="leaderboard",
+            ),
+        ),
+    ]
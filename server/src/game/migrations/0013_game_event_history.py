@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 16:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("game", "0012_game_stats"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="gameevents",
+            index=models.Index(
+                fields=["game", "created_at", "id"], name="game_event_history"
+            ),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from sqids import Sqids
 from typing import Literal, TypedDict
 
@@ -17,6 +18,13 @@ GameEventsType = Literal[
 ]
 
 
+class GameMove(TypedDict):
+    type: Literal["reveal", "flag", "chord"]
+    row: int
+    column: int
+    user: str
+
+
 GameMapCurrentState = list[list[CellContent]]
 
 
@@ -24,17 +32,58 @@ class GameMapState(TypedDict):
     map: GameMapCurrentState
     state: str
     code: str
+    # Size of the board, including for tiled games and states without their map
+    rows: int
+    columns: int
     started_at: str
     total_time_in_seconds: float
+    version: int
+    changes: list[CellContent]  # cells changed by the last move
+    # Set for tiled games, whose map is empty and must be read tile by tile
+    tile_size: int | None
 
 
 class Game(models.Model):
+    class Storage(models.TextChoices):
+        CELLS = "cells"  # one Cell row per square
+        PACKED = "packed"  # one byte per square in Game.board, see game.board
+        EVENTS = "events"  # rebuilt from the seed and the events, see game.replay
+        TILED = "tiled"  # one BoardTile row per square tile, for large boards
+        LAZY = "lazy"  # mines placed on the first reveal, then stored packed
+        ARCHIVED = "archived"  # finished, packed and compressed, see game.compaction
+
     rows = models.PositiveIntegerField()
     columns = models.PositiveIntegerField()
     mines = models.PositiveIntegerField()
     state = models.CharField(max_length=10, default="ongoing")  # ongoing, won, lost
     created_at = models.DateTimeField(auto_now_add=True)
     ended_at = models.DateTimeField(null=True)
+    version = models.PositiveIntegerField(default=0)  # number of updates applied
+    safe_cells_remaining = models.PositiveIntegerField()  # game is won once it's 0
+    storage = models.CharField(
+        max_length=10, choices=Storage.choices, default=Storage.PACKED
+    )
+    board = models.BinaryField(null=True)
+    # Side of the BoardTile rows of tiled games
+    tile_size = models.PositiveIntegerField(null=True)
+    # Seed the board was generated with, None for games created before seeds
+    seed = models.BigIntegerField(null=True)
+    # Labels of the empty regions of the board, see game.regions
+    regions = models.BinaryField(null=True)
+    # Cell the mines of lazy games were placed around, None until their first
+    # reveal, see use_cases._place_mines
+    safe_cell = models.PositiveIntegerField(null=True)
+    # Generated ahead of time and not handed out yet, see use_cases.fill_game_pool
+    pooled = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["rows", "columns", "mines", "storage"],
+                condition=models.Q(pooled=True),
+                name="pooled_game",
+            )
+        ]
 
     @property
     def code(self):
@@ -42,6 +91,28 @@ class Game(models.Model):
         return sqids.encode([self.id])
 
 
+class BoardTile(models.Model):
+    """
+    Square tile of a tiled board, packed like Game.board (see game.board).
+
+    The tile at (tile_row, tile_column) holds the squares from row
+    tile_row * tile_size and column tile_column * tile_size, tiles on the
+    bottom and right edges are cut to the size of the board.
+    """
+
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name="tiles")
+    tile_row = models.PositiveIntegerField()
+    tile_column = models.PositiveIntegerField()
+    cells = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["game", "tile_row", "tile_column"], name="unique_board_tile"
+            )
+        ]
+
+
 class Cell(models.Model):
     game = models.ForeignKey(
         Game, on_delete=models.CASCADE, related_name="cells", related_query_name="cell"
@@ -73,5 +144,77 @@ class GameEvents(models.Model):
     event = models.CharField(
         max_length=50
     )  # reveal mine, flag cell, unflag cell, reveal cell, reveal last cell - win
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add, so events drained from the outbox keep the time of the move
+    created_at = models.DateTimeField(default=timezone.now)
     user = models.CharField(max_length=50)
+
+    class Meta:
+        indexes = [
+            # History of a game in chronological order, see replay.iter_events
+            models.Index(fields=["game", "created_at", "id"], name="game_event_history")
+        ]
+
+
+class GameEventOutbox(models.Model):
+    """
+    Events written in the transaction of their move, and moved to GameEvents in
+    batches by game.tasks.drain_game_event_outbox.
+    """
+
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name="+")
+    row = models.PositiveIntegerField()
+    column = models.PositiveIntegerField()
+    event = models.CharField(max_length=50)
+    created_at = models.DateTimeField(default=timezone.now)
+    user = models.CharField(max_length=50)
+
+
+class DifficultyStats(models.Model):
+    """
+    Totals of the finished games of a board size, updated as each game ends, see
+    game.stats.
+    """
+
+    rows = models.PositiveIntegerField()
+    columns = models.PositiveIntegerField()
+    mines = models.PositiveIntegerField()
+    games_finished = models.PositiveIntegerField(default=0)
+    games_won = models.PositiveIntegerField(default=0)
+    total_duration_seconds = models.FloatField(default=0)  # of the finished games
+    fastest_win_seconds = models.FloatField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["rows", "columns", "mines"], name="unique_difficulty_stats"
+            )
+        ]
+
+
+class UserStats(models.Model):
+    """Totals of the finished games each user made moves in, see game.stats."""
+
+    user = models.CharField(max_length=50, unique=True)
+    games_finished = models.PositiveIntegerField(default=0)
+    games_won = models.PositiveIntegerField(default=0)
+    moves = models.PositiveIntegerField(default=0)
+
+
+class LeaderboardEntry(models.Model):
+    """Duration of a won game, ranked among the wins of its board size."""
+
+    game = models.OneToOneField(Game, on_delete=models.CASCADE, related_name="+")
+    rows = models.PositiveIntegerField()
+    columns = models.PositiveIntegerField()
+    mines = models.PositiveIntegerField()
+    duration_seconds = models.FloatField()
+    # Users who made moves in the game, most moves first
+    users = models.JSONField(default=list)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["rows", "columns", "mines", "duration_seconds"],
+                name="leaderboard",
+            )
+        ]
@@ -0,0 +1,155 @@
+"""
+Users connected to each game.
+
+Every websocket connection of a game is tracked with the user it belongs to and
+an expiry time, refreshed by the heartbeats of the client. Connections that stop
+sending heartbeats, e.g. because the server handling them crashed, expire after
+GAME_PRESENCE_TTL_SECONDS and are pruned on the next update of the game.
+
+Every update is applied atomically and returns the users that joined or left
+the game with it, so only these deltas need to be broadcast. A user is connected
+as long as at least one of their connections is.
+
+The backend is selected with the GAME_PRESENCE setting:
+- LocMemPresence keeps the connections in memory, for a single server process.
+- RedisPresence keeps them in Redis, shared by every server process.
+"""
+
+import threading
+import time
+from functools import lru_cache
+from typing import TypedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class PresenceUpdate(TypedDict):
+    joined: list[str]
+    left: list[str]
+    users: list[str]  # connected users once the update is applied
+
+
+class LocMemPresence:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Game code -> connection -> (user, expires at)
+        self._games: dict[str, dict[str, tuple[str, float]]] = {}
+
+    def touch(self, code: str, connection: str, user: str) -> PresenceUpdate:
+        """Add a connection, or refresh its expiry on a heartbeat."""
+        expires_at = time.time() + settings.GAME_PRESENCE_TTL_SECONDS
+        return self._update(code, connection, (user, expires_at))
+
+    def leave(self, code: str, connection: str) -> PresenceUpdate:
+        return self._update(code, connection, None)
+
+    def _update(
+        self, code: str, connection: str, entry: tuple[str, float] | None
+    ) -> PresenceUpdate:
+        now = time.time()
+        with self._lock:
+            connections = self._games.setdefault(code, {})
+            before = {user for user, _ in connections.values()}
+
+            for expired in [
+                key for key, (_, expires_at) in connections.items() if expires_at <= now
+            ]:
+                del connections[expired]
+            if entry is None:
+                connections.pop(connection, None)
+            else:
+                connections[connection] = entry
+
+            after = {user for user, _ in connections.values()}
+            if not connections:
+                del self._games[code]
+
+        return PresenceUpdate(
+            joined=sorted(after - before),
+            left=sorted(before - after),
+            users=sorted(after),
+        )
+
+
+# Prunes the expired connections of the game, applies the update and returns the
+# users that joined, left, and are connected, all in a single atomic step.
+# KEYS: expiry of each connection (sorted set), user of each connection (hash)
+# ARGV: now, connection, "touch" or "leave", user, expires at, ttl of the keys
+_REDIS_UPDATE_SCRIPT = """
+local function users()
+    local set = {}
+    for _, user in ipairs(redis.call("HVALS", KEYS[2])) do
+        set[user] = true
+    end
+    return set
+end
+
+local before = users()
+
+local expired = redis.call("ZRANGEBYSCORE", KEYS[1], "-inf", ARGV[1])
+if #expired > 0 then
+    redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", ARGV[1])
+    redis.call("HDEL", KEYS[2], unpack(expired))
+end
+
+if ARGV[3] == "leave" then
+    redis.call("ZREM", KEYS[1], ARGV[2])
+    redis.call("HDEL", KEYS[2], ARGV[2])
+else
+    redis.call("ZADD", KEYS[1], ARGV[5], ARGV[2])
+    redis.call("HSET", KEYS[2], ARGV[2], ARGV[4])
+    redis.call("EXPIRE", KEYS[1], ARGV[6])
+    redis.call("EXPIRE", KEYS[2], ARGV[6])
+end
+
+local after = users()
+local joined, left, connected = {}, {}, {}
+for user in pairs(after) do
+    table.insert(connected, user)
+    if not before[user] then
+        table.insert(joined, user)
+    end
+end
+for user in pairs(before) do
+    if not after[user] then
+        table.insert(left, user)
+    end
+end
+return {joined, left, connected}
+"""
+
+
+class RedisPresence:
+    def __init__(self, url: str):
+        # Only required by this backend
+        import redis
+
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._update_script = self._redis.register_script(_REDIS_UPDATE_SCRIPT)
+
+    def touch(self, code: str, connection: str, user: str) -> PresenceUpdate:
+        """Add a connection, or refresh its expiry on a heartbeat."""
+        return self._update(code, connection, "touch", user)
+
+    def leave(self, code: str, connection: str) -> PresenceUpdate:
+        return self._update(code, connection, "leave", "")
+
+    def _update(
+        self, code: str, connection: str, operation: str, user: str
+    ) -> PresenceUpdate:
+        now = time.time()
+        ttl = settings.GAME_PRESENCE_TTL_SECONDS
+        joined, left, users = self._update_script(
+            keys=[f"presence:{code}:expiry", f"presence:{code}:users"],
+            args=[now, connection, operation, user, now + ttl, int(ttl) + 1],
+        )
+        return PresenceUpdate(
+            joined=sorted(joined), left=sorted(left), users=sorted(users)
+        )
+
+
+@lru_cache(maxsize=None)
+def get_presence() -> LocMemPresence | RedisPresence:
+    config = settings.GAME_PRESENCE
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
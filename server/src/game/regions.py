@@ -0,0 +1,280 @@
+"""
+Labelling of the empty regions of a board.
+
+An empty region is a set of 8-connected safe cells without adjacent mines.
+Revealing any cell of a region reveals the whole region plus its border, so the
+regions are labelled once when the board is created and a cascade reveal
+becomes a lookup of the region label and its bounding box.
+"""
+
+from collections import deque
+
+import numpy as np
+
+from game.board import (
+    ADJACENT_MINES_MASK,
+    MINE,
+    REVEALED,
+    Board,
+    TiledCells,
+    tile_height,
+    tile_of,
+    tile_width,
+)
+
+LABEL_DTYPE = np.dtype("<u4")
+
+
+class RegionIndex:
+    """
+    Region label of every cell (0 for cells outside any empty region) and the
+    bounding box (first row, last row, first column, last column) of every region.
+    """
+
+    def __init__(self, labels: np.ndarray, bounds: np.ndarray):
+        self.labels = labels
+        self.bounds = bounds
+
+    @classmethod
+    def build(cls, board: Board) -> "RegionIndex":
+        cells = _as_array(board)
+        is_empty = (cells & (MINE | ADJACENT_MINES_MASK)) == 0
+        labels, bounds = _label_regions(is_empty)
+        return cls(labels, bounds)
+
+    @classmethod
+    def from_bytes(cls, rows: int, columns: int, data: bytes) -> "RegionIndex":
+        buffer = np.frombuffer(data, dtype=LABEL_DTYPE)
+        labels = buffer[: rows * columns].reshape(rows, columns)
+        bounds = buffer[rows * columns :].reshape(-1, 4)
+        return cls(labels, bounds)
+
+    def to_bytes(self) -> bytes:
+        return (
+            self.labels.astype(LABEL_DTYPE).tobytes()
+            + self.bounds.astype(LABEL_DTYPE).tobytes()
+        )
+
+    def reveal(self, board: Board, index: int) -> list[int]:
+        """
+        Reveal the region of the given cell and its border.
+        Returns the indexes of the cells that were not revealed before.
+        """
+        row, column = board.position(index)
+        label = int(self.labels[row, column])
+        if label == 0:
+            return []
+
+        first_row, last_row, first_column, last_column = self.bounds[label - 1]
+        # The border of the region lies within one cell of its bounding box
+        top = max(int(first_row) - 1, 0)
+        bottom = min(int(last_row) + 2, board.rows)
+        left = max(int(first_column) - 1, 0)
+        right = min(int(last_column) + 2, board.columns)
+
+        region = self.labels[top:bottom, left:right] == label
+        mask = _dilate(region)
+
+        window = _as_array(board)[top:bottom, left:right]
+        hidden_rows, hidden_columns = np.nonzero(mask & ((window & REVEALED) == 0))
+        np.bitwise_or(window, REVEALED, out=window, where=mask)
+
+        revealed = (
+            (hidden_rows + top) * board.columns + hidden_columns + left
+        ).tolist()
+        board.changed.update(revealed)
+        return revealed
+
+
+def flood_reveal(board: Board, index: int) -> list[int]:
+    """
+    Iterative flood reveal from the given cell, for boards without a region index.
+    Returns the indexes of the cells that were not revealed before.
+    """
+    revealed = []
+    pending = deque([index])
+
+    while pending:
+        cell = pending.popleft()
+        if board.is_revealed(cell):
+            continue
+        board.reveal(cell)
+        revealed.append(cell)
+
+        if not board.is_mine(cell) and board.adjacent_mines(cell) == 0:
+            pending.extend(
+                neighbour
+                for neighbour in board.neighbours(cell)
+                if not board.is_revealed(neighbour)
+            )
+
+    return revealed
+
+
+def tiled_reveal(board: Board, index: int) -> list[int]:
+    """
+    Flood reveal from the given cell for tiled boards, which are too large to be
+    region indexed. The cascade goes through the tiles it reaches in waves: the
+    empty regions of a tile reached by the cascade are labelled and revealed at
+    once, and the cells they reveal past the edges of the tile carry the cascade
+    to the next wave. The tiles of a wave are read together.
+    Returns the indexes of the cells that were not revealed before.
+    """
+    cells: TiledCells = board.cells  # type: ignore[assignment]
+    game = cells.game
+    revealed: list[int] = []
+    labels: dict[tuple[int, int], np.ndarray] = {}
+    pending = {tile_of(game, index): [index]}
+
+    while pending:
+        wave, pending = pending, {}
+        cells.load_tiles(wave)
+        for key, seeds in wave.items():
+            tile = cells.get_tile(*key)
+            height, width = tile_height(game, key[0]), tile_width(game, key[1])
+            first_row, first_column = key[0] * game.tile_size, key[1] * game.tile_size
+            window = np.frombuffer(tile.cells, dtype=np.uint8).reshape(height, width)
+
+            seed_rows, seed_columns = np.divmod(np.array(seeds), game.columns)
+            seed_mask = np.zeros((height, width), dtype=bool)
+            seed_mask[seed_rows - first_row, seed_columns - first_column] = True
+            # Like the flood reveal, the cascade stops at the revealed cells
+            seed_mask &= (window & REVEALED) == 0
+            if not seed_mask.any():
+                continue
+
+            tile_labels = labels.get(key)
+            if tile_labels is None:
+                is_empty = (window & (MINE | ADJACENT_MINES_MASK)) == 0
+                tile_labels = labels[key] = _label_regions(is_empty)[0]
+            reached = np.unique(tile_labels[seed_mask])
+
+            # One cell wider than the tile, the cells past its edges are revealed
+            # by the next wave
+            region = np.zeros((height + 2, width + 2), dtype=bool)
+            region[1:-1, 1:-1] = np.isin(tile_labels, reached[reached > 0])
+            mask = _dilate(region)
+            inside = mask[1:-1, 1:-1]
+            inside |= seed_mask
+
+            hidden_rows, hidden_columns = np.nonzero(
+                inside & ((window & REVEALED) == 0)
+            )
+            np.bitwise_or(window, REVEALED, out=window, where=inside)
+            revealed.extend(
+                (
+                    (hidden_rows + first_row) * game.columns
+                    + hidden_columns
+                    + first_column
+                ).tolist()
+            )
+
+            # Only the cells past the edges are left
+            mask[1:-1, 1:-1] = False
+            edge_rows, edge_columns = np.nonzero(mask)
+            edge_rows += first_row - 1
+            edge_columns += first_column - 1
+            on_board = (
+                (edge_rows >= 0)
+                & (edge_rows < game.rows)
+                & (edge_columns >= 0)
+                & (edge_columns < game.columns)
+            )
+            for row, column in zip(
+                edge_rows[on_board].tolist(), edge_columns[on_board].tolist()
+            ):
+                next_key = (row // game.tile_size, column // game.tile_size)
+                pending.setdefault(next_key, []).append(row * game.columns + column)
+
+    board.changed.update(revealed)
+    return revealed
+
+
+def _as_array(board: Board) -> np.ndarray:
+    # Writable view over the board cells, changes are applied to the board in place
+    return np.frombuffer(board.cells, dtype=np.uint8).reshape(board.rows, board.columns)
+
+
+def _dilate(mask: np.ndarray) -> np.ndarray:
+    # 3x3 dilation, done as a vertical pass followed by a horizontal one
+    vertical = mask.copy()
+    vertical[1:] |= mask[:-1]
+    vertical[:-1] |= mask[1:]
+    dilated = vertical.copy()
+    dilated[:, 1:] |= vertical[:, :-1]
+    dilated[:, :-1] |= vertical[:, 1:]
+    return dilated
+
+
+def _label_regions(is_empty: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Label the 8-connected components of the mask.
+
+    Each row is split in runs of consecutive empty cells, the runs of adjacent
+    rows that touch (diagonals included) are merged with a union-find, so the
+    Python work is proportional to the number of runs instead of cells.
+    """
+    rows, columns = is_empty.shape
+    padded = np.zeros((rows, columns + 2), dtype=np.int8)
+    padded[:, 1:-1] = is_empty
+    edges = np.diff(padded, axis=1)
+    start_rows, starts = np.nonzero(edges == 1)
+    ends = np.nonzero(edges == -1)[1]
+
+    run_rows = start_rows.tolist()
+    run_starts = starts.tolist()
+    run_ends = ends.tolist()  # exclusive
+    parents = list(range(len(run_rows)))
+
+    def find(run: int) -> int:
+        while parents[run] != run:
+            parents[run] = parents[parents[run]]
+            run = parents[run]
+        return run
+
+    # Runs are sorted by row and then column, so the runs of two consecutive
+    # rows can be matched with a single sweep
+    previous_first = previous_last = 0
+    current = 0
+    while current < len(run_rows):
+        row = run_rows[current]
+        current_last = current
+        while current_last < len(run_rows) and run_rows[current_last] == row:
+            current_last += 1
+
+        if previous_last > previous_first and run_rows[previous_first] == row - 1:
+            above = previous_first
+            for run in range(current, current_last):
+                while above < previous_last and run_ends[above] < run_starts[run]:
+                    above += 1
+                touching = above
+                while (
+                    touching < previous_last and run_starts[touching] <= run_ends[run]
+                ):
+                    root, other = find(run), find(touching)
+                    if root != other:
+                        parents[other] = root
+                    touching += 1
+
+        previous_first, previous_last = current, current_last
+        current = current_last
+
+    labels = np.zeros((rows, columns), dtype=LABEL_DTYPE)
+    region_labels: dict[int, int] = {}
+    bounds: list[list[int]] = []
+
+    for run in range(len(run_rows)):
+        root = find(run)
+        label = region_labels.get(root)
+        row, start, end = run_rows[run], run_starts[run], run_ends[run]
+        if label is None:
+            label = region_labels[root] = len(bounds) + 1
+            bounds.append([row, row, start, end - 1])
+        else:
+            region_bounds = bounds[label - 1]
+            region_bounds[1] = row
+            region_bounds[2] = min(region_bounds[2], start)
+            region_bounds[3] = max(region_bounds[3], end - 1)
+        labels[row, start:end] = label
+
+    return labels, np.array(bounds, dtype=LABEL_DTYPE).reshape(-1, 4)
@@ -0,0 +1,140 @@
+"""
+Event-sourced reconstruction of game boards.
+
+Games store the seed their board was generated with, so the initial board can
+be generated again, and every applied move is recorded as an event. Replaying
+the events on the initial board rebuilds the current board, which lets cold
+games drop their stored board (see Game.Storage.EVENTS).
+
+The replay API serves the events one page at a time (iter_events) and the board
+after any number of them (replay_events), to replay a game move by move.
+
+Boards generated with the same seed are only identical with the same NumPy
+version, which is pinned in requirements.txt.
+"""
+
+from itertools import islice
+from typing import Iterator, TypedDict
+
+from django.db.models import Q
+
+from game.board import Board
+from game.generation import generate_board
+from game.models import Game, GameEventOutbox, GameEvents
+from game.regions import RegionIndex, flood_reveal
+
+
+class MissingSeedError(Exception):
+    """The game was created without a seed, its board can't be rebuilt."""
+
+
+class ReplayEvent(TypedDict):
+    index: int  # position of the event in the history of the game, from 1
+    id: int
+    row: int
+    column: int
+    event: str
+    user: str
+    created_at: str
+
+
+def replay_board(game: Game) -> Board:
+    """
+    Generate the initial board of the game and apply its events in order.
+    """
+    board, _, _ = replay_events(game)
+    return board
+
+
+def replay_events(game: Game, events: int | None = None) -> tuple[Board, str, int]:
+    """
+    Generate the initial board of the game and apply its first `events` events,
+    or all of them. Returns the board, the state of the game once they're
+    applied and the number of events applied.
+    """
+    if game.seed is None:
+        raise MissingSeedError(f"Game {game.id} has no seed")
+
+    board = generate_board(
+        game.rows, game.columns, game.mines, game.seed, game.safe_cell
+    )
+    regions = (
+        RegionIndex.from_bytes(game.rows, game.columns, game.regions)
+        if game.regions is not None
+        else None
+    )
+
+    state = "ongoing"
+    applied = 0
+    for row, column, event in islice(_get_events(game), events):
+        index = row * game.columns + column
+        applied += 1
+        if event == "reveal mine":
+            state = "lost"
+        elif event == "reveal last cell - win":
+            state = "won"
+
+        if event in ("flag cell", "unflag cell"):
+            if board.is_flagged(index) != (event == "flag cell"):
+                board.toggle_flag(index)
+            continue
+
+        # Every other event reveals the cell, with the same cascade as a move
+        if not board.is_mine(index) and board.adjacent_mines(index) == 0:
+            if regions is not None:
+                regions.reveal(board, index)
+            else:
+                flood_reveal(board, index)
+        if not board.is_revealed(index):
+            board.reveal(index)
+
+    board.changed.clear()
+    return board, state, applied
+
+
+def iter_events(
+    game: Game, after: tuple[int, int] | None = None, limit: int | None = None
+) -> Iterator[ReplayEvent]:
+    """
+    Stream the drained events of the game in chronological order, from the
+    event following `after`, a (index, id) pair of a previously streamed event.
+    Events are paginated on (created_at, id), which the game_event_history
+    index covers, so a page never reads the events before it.
+    """
+    events = GameEvents.objects.filter(game_id=game.id)
+    index = 0
+    if after is not None:
+        index, after_id = after
+        created_at = events.filter(id=after_id).values_list("created_at", flat=True)
+        if not created_at:
+            raise ValueError(f"Event {after_id} isn't an event of game {game.id}")
+        events = events.filter(
+            Q(created_at__gt=created_at[0])
+            | Q(created_at=created_at[0], id__gt=after_id)
+        )
+
+    for event in events.order_by("created_at", "id")[:limit].iterator(chunk_size=500):
+        index += 1
+        yield ReplayEvent(
+            index=index,
+            id=event.id,
+            row=event.row,
+            column=event.column,
+            event=event.event,
+            user=event.user,
+            created_at=event.created_at.isoformat(),
+        )
+
+
+def _get_events(game: Game) -> Iterator[tuple[int, int, str]]:
+    # Events still in the outbox are newer than the drained ones
+    for model, ordering in (
+        (GameEvents, ("created_at", "id")),
+        (GameEventOutbox, ("id",)),
+    ):
+        yield from (
+            model.objects.filter(game_id=game.id)
+            .order_by(*ordering)
+            .values_list("row", "column", "event")
+            .iterator()
+        )
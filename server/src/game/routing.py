@@ -1,7 +1,14 @@
+from django.conf import settings
 from django.urls import re_path
 
 from . import consumers
 
+game_consumer = (
+    consumers.AsyncGameConsumer
+    if settings.GAME_ASYNC_CONSUMER
+    else consumers.GameConsumer
+)
+
 websocket_urlpatterns = [
-    re_path(r"ws/game/(?P<room_name>\w+)/$", consumers.GameConsumer.as_asgi()),
+    re_path(r"ws/game/(?P<room_name>\w+)/$", game_consumer.as_asgi()),
 ]
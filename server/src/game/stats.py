@@ -0,0 +1,94 @@
+"""
+Statistics of the finished games.
+
+Aggregates are updated incrementally in the transaction of the move that ends
+a game, so the leaderboard and the statistics are read from a handful of rows
+instead of scanning the games and their events:
+
+- DifficultyStats holds the totals of each board size,
+- UserStats the totals of each user, counted from the users of the game events,
+- LeaderboardEntry the duration of every win, indexed by board size and duration.
+
+The backfill_stats command rebuilds them from the existing games.
+"""
+
+from collections import Counter
+
+from django.db.models import Count, F, Value
+from django.db.models.functions import Coalesce, Least
+
+from game.models import (
+    DifficultyStats,
+    Game,
+    GameEventOutbox,
+    GameEvents,
+    LeaderboardEntry,
+    UserStats,
+)
+
+
+def record_finished_game(game: Game):
+    """
+    Add a game that just ended to the statistics. Must run once per game, in the
+    transaction saving its end, after its last events were written.
+    """
+    won = game.state == "won"
+    duration = (game.ended_at - game.created_at).total_seconds()
+    moves = _count_moves(game)
+
+    difficulty, _ = DifficultyStats.objects.get_or_create(
+        rows=game.rows, columns=game.columns, mines=game.mines
+    )
+    updates = {
+        "games_finished": F("games_finished") + 1,
+        "total_duration_seconds": F("total_duration_seconds") + duration,
+    }
+    if won:
+        updates["games_won"] = F("games_won") + 1
+        updates["fastest_win_seconds"] = Least(
+            Coalesce(F("fastest_win_seconds"), Value(duration)), Value(duration)
+        )
+    DifficultyStats.objects.filter(id=difficulty.id).update(**updates)
+
+    for user, count in moves.items():
+        user_stats, _ = UserStats.objects.get_or_create(user=user)
+        UserStats.objects.filter(id=user_stats.id).update(
+            games_finished=F("games_finished") + 1,
+            games_won=F("games_won") + int(won),
+            moves=F("moves") + count,
+        )
+
+    if won:
+        LeaderboardEntry.objects.create(
+            game=game,
+            rows=game.rows,
+            columns=game.columns,
+            mines=game.mines,
+            duration_seconds=duration,
+            users=[user for user, _ in moves.most_common()],
+        )
+
+
+def _count_moves(game: Game) -> Counter[str]:
+    # The last events of the game may not be drained from the outbox yet
+    moves: Counter[str] = Counter()
+    for model in (GameEvents, GameEventOutbox):
+        moves.update(
+            dict(
+                model.objects.filter(game_id=game.id)
+                .exclude(user="")
+                .values_list("user")
+                .annotate(count=Count("id"))
+            )
+        )
+    return moves
+
+
+def get_leaderboard(
+    rows: int, columns: int, mines: int, limit: int
+) -> list[LeaderboardEntry]:
+    return list(
+        LeaderboardEntry.objects.filter(
+            rows=rows, columns=columns, mines=mines
+        ).order_by("duration_seconds", "id")[:limit]
+    )
@@ -1,26 +1,70 @@
+import logging
+
 from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+
+from game import compaction, use_cases
+from game.models import GameEventOutbox, GameEvents
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def drain_game_event_outbox() -> int:
+    """
+    Move the events recorded by the moves from the outbox to GameEvents, in
+    batches of GAME_EVENT_OUTBOX_BATCH_SIZE. Returns the number of events moved.
+    """
+    drained = 0
+    while True:
+        with transaction.atomic():
+            entries = list(
+                GameEventOutbox.objects.select_for_update(skip_locked=True).order_by(
+                    "id"
+                )[: settings.GAME_EVENT_OUTBOX_BATCH_SIZE]
+            )
+            if not entries:
+                return drained
+
+            GameEvents.objects.bulk_create(
+                GameEvents(
+                    game_id=entry.game_id,
+                    row=entry.row,
+                    column=entry.column,
+                    event=entry.event,
+                    created_at=entry.created_at,
+                    user=entry.user,
+                )
+                for entry in entries
+            )
+            GameEventOutbox.objects.filter(
+                id__in=[entry.id for entry in entries]
+            ).delete()
+
+        drained += len(entries)
 
-from game.models import GameEvents, Cell
+
+@shared_task
+def fill_game_pool() -> int:
+    """
+    Generate the pooled games claimed since the last run, see
+    game.use_cases.fill_game_pool. Returns the number of games generated.
+    """
+    return use_cases.fill_game_pool()
 
 
-# TODO: Investigate retrying the task if it fails, logging the error
 @shared_task
-def create_game_event(game_id: int, row: int, column: int, user: str):
-    cell = Cell.objects.select_related("game").get(
-        game_id=game_id, row=row, column=column
-    )
-    game = cell.game
-
-    event = "reveal last cell - win"
-    if cell.is_mine:
-        event = "reveal mine"
-    elif cell.is_flagged:
-        event = "flag cell"
-    elif not cell.is_flagged:
-        event = "unflag cell"
-    elif cell.is_revealed and game.state == "ongoing":
-        event = "reveal cell"
-
-    GameEvents.objects.create(
-        game_id=game_id, row=row, column=column, event=event, user=user
-    )
+def compact_finished_games() -> compaction.CompactionReport:
+    """
+    Archive finished games and delete their Cell rows, see game.compaction.
+    Returns what was reclaimed.
+    """
+    report = compaction.compact_finished_games()
+    if report["games"] or report["cell_rows"]:
+        logger.info(
+            f"Archived {report['games']} games, deleted {report['cell_rows']} "
+            f"cell rows, boards went from {report['board_bytes_before']} to "
+            f"{report['board_bytes_after']} bytes"
+        )
+    return report
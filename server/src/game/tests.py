@@ -1,3 +1,1373 @@
-from django.test import TestCase
+import asyncio
+import copy
+import io
+import json
+import random
+import time
 
-# Create your tests here.
+import numpy as np
+from itertools import product
+from unittest import mock
+from urllib.parse import urlencode
+
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import re_path
+
+from game import compaction, consumers, engine, presence, replay, use_cases
+from game.board import FLAGGED, MINE, REVEALED, Board, GameVersionConflict, load_board
+from game.encoding import (
+    COMPACT_ALPHABET,
+    decode_cell,
+    encode_cell,
+    encode_game_map_state,
+)
+from game.generation import generate_board, generate_board_bands
+from game.management.commands import drop_cold_boards
+from game.models import (
+    Cell,
+    CellContent,
+    DifficultyStats,
+    Game,
+    GameEventOutbox,
+    GameEvents,
+    GameMapCurrentState,
+    GameMapState,
+    GameMove,
+    LeaderboardEntry,
+    UserStats,
+)
+from game.presence import LocMemPresence
+from game.regions import RegionIndex, flood_reveal, tiled_reveal
+from game.tasks import drain_game_event_outbox, fill_game_pool
+
+
+def naive_reveal(board: Board, index: int) -> set[int]:
+    """Cells a cascade from the given cell reveals, by the rules of the game."""
+    revealed: set[int] = set()
+    pending = [index]
+    while pending:
+        cell = pending.pop()
+        if cell in revealed or board.is_revealed(cell):
+            continue
+        revealed.add(cell)
+        if not board.is_mine(cell) and board.adjacent_mines(cell) == 0:
+            pending.extend(board.neighbours(cell))
+    return revealed
+
+
+def clear_map_cache():
+    # Game ids, and so codes, are reused once the test transactions roll back
+    caches[settings.GAME_MAP_CACHE].clear()
+
+
+def changing_game_on_load():
+    """Patch the moves so another move changes the game as each one loads it."""
+
+    def load(game):
+        board = load_board(game)
+        Game.objects.filter(id=game.id).update(version=F("version") + 1)
+        return board
+
+    return mock.patch.object(use_cases, "load_board", side_effect=load)
+
+
+async def connect(consumer, code: str, **query) -> WebsocketCommunicator:
+    application = URLRouter(
+        [re_path(r"ws/game/(?P<room_name>\w+)/$", consumer.as_asgi())]
+    )
+    communicator = WebsocketCommunicator(
+        application, f"/ws/game/{code}/?{urlencode({'user': 'user', **query})}"
+    )
+    connected, _ = await communicator.connect()
+    assert connected
+    return communicator
+
+
+async def receive(communicator: WebsocketCommunicator) -> dict:
+    """Next message of the game, skipping the lists of connected users."""
+    while True:
+        message = await communicator.receive_json_from()
+        if message.get("type") != "user.list":
+            return message
+
+
+class PackedBoardMigrationTests(TransactionTestCase):
+    """Migration 0002 packs the Cell rows of existing games into Game.board."""
+
+    before = [("game", "0001_initial")]
+    after = [("game", "0002_packed_board_storage")]
+
+    # (row, column, is_mine, is_revealed, is_flagged, adjacent_mines)
+    squares = [
+        (0, 0, True, False, True, 0),
+        (0, 1, False, True, False, 2),
+        (0, 2, False, False, False, 1),
+        (1, 0, False, True, False, 1),
+        (1, 1, True, False, False, 1),
+        (1, 2, False, False, True, 1),
+    ]
+    packed = bytes(
+        [MINE | FLAGGED, REVEALED | 2, 1, REVEALED | 1, MINE | 1, FLAGGED | 1]
+    )
+
+    def setUp(self):
+        self.migrate(self.before)
+        apps = self.get_apps(self.before)
+        Cell = apps.get_model("game", "Cell")
+        self.game_id = (
+            apps.get_model("game", "Game").objects.create(rows=2, columns=3, mines=2).id
+        )
+        Cell.objects.bulk_create(
+            Cell(
+                game_id=self.game_id,
+                row=row,
+                column=column,
+                is_mine=is_mine,
+                is_revealed=is_revealed,
+                is_flagged=is_flagged,
+                adjacent_mines=adjacent_mines,
+            )
+            for row, column, is_mine, is_revealed, is_flagged, adjacent_mines in (
+                self.squares
+            )
+        )
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+
+    def get_apps(self, targets):
+        return MigrationExecutor(connection).loader.project_state(targets).apps
+
+    def test_cells_are_packed(self):
+        self.migrate(self.after)
+
+        apps = self.get_apps(self.after)
+        game = apps.get_model("game", "Game").objects.get(id=self.game_id)
+        self.assertEqual(game.storage, "packed")
+        self.assertEqual(bytes(game.board), self.packed)
+        self.assertFalse(apps.get_model("game", "Cell").objects.exists())
+
+    def test_reverse_restores_the_cells(self):
+        self.migrate(self.after)
+        self.migrate(self.before)
+
+        apps = self.get_apps(self.before)
+        cells = apps.get_model("game", "Cell").objects.filter(game_id=self.game_id)
+        self.assertCountEqual(
+            cells.values_list(
+                "row",
+                "column",
+                "is_mine",
+                "is_revealed",
+                "is_flagged",
+                "adjacent_mines",
+            ),
+            self.squares,
+        )
+
+
+class RegionRevealTests(SimpleTestCase):
+    """The indexed and flood reveals open the same cells as a naive cascade."""
+
+    # (rows, columns, mines)
+    boards = [(1, 1, 0), (1, 12, 2), (9, 9, 10), (16, 30, 99), (40, 25, 30)]
+
+    def test_reveals_match_a_naive_cascade(self):
+        rng = random.Random(7)
+        for rows, columns, mines in self.boards:
+            board = generate_board(rows, columns, mines, seed=rows * columns)
+            regions = RegionIndex.build(board)
+            empty = [
+                index
+                for index in range(rows * columns)
+                if not board.is_mine(index) and board.adjacent_mines(index) == 0
+            ]
+            for index in rng.sample(empty, min(len(empty), 10)):
+                with self.subTest(board=(rows, columns, mines), index=index):
+                    expected = naive_reveal(board, index)
+
+                    indexed = Board(rows, columns, board.cells)
+                    self.assertEqual(set(regions.reveal(indexed, index)), expected)
+                    self.assertEqual(indexed.changed, expected)
+
+                    flooded = Board(rows, columns, board.cells)
+                    self.assertEqual(set(flood_reveal(flooded, index)), expected)
+                    self.assertEqual(flooded.cells, indexed.cells)
+
+    def test_revealed_cells_are_not_returned_again(self):
+        board = generate_board(16, 16, 20, seed=3)
+        regions = RegionIndex.build(board)
+        index = next(
+            index
+            for index in range(16 * 16)
+            if not board.is_mine(index) and board.adjacent_mines(index) == 0
+        )
+        first = regions.reveal(board, index)
+        self.assertTrue(first)
+        self.assertEqual(regions.reveal(board, index), [])
+        self.assertEqual(flood_reveal(board, index), [])
+
+    def test_index_round_trips_through_bytes(self):
+        board = generate_board(20, 13, 25, seed=11)
+        regions = RegionIndex.build(board)
+        loaded = RegionIndex.from_bytes(20, 13, regions.to_bytes())
+        self.assertEqual(loaded.labels.tolist(), regions.labels.tolist())
+        self.assertEqual(loaded.bounds.tolist(), regions.bounds.tolist())
+
+
+class CompactEncodingTests(SimpleTestCase):
+    def test_every_cell_round_trips(self):
+        for is_mine, is_revealed, is_flagged, adjacent_mines in product(
+            (False, True), (False, True), (False, True), range(9)
+        ):
+            cell = CellContent(
+                row=2,
+                column=5,
+                is_mine=is_mine,
+                is_revealed=is_revealed,
+                is_flagged=is_flagged,
+                adjacent_mines=adjacent_mines,
+            )
+            with self.subTest(cell=cell):
+                self.assertEqual(decode_cell(2, 5, encode_cell(cell)), cell)
+
+    def test_characters_are_distinct_and_need_no_escaping(self):
+        self.assertEqual(len(set(COMPACT_ALPHABET)), len(COMPACT_ALPHABET))
+        for character in COMPACT_ALPHABET:
+            self.assertEqual(json.dumps(character), f'"{character}"')
+
+    def test_game_map_state_round_trips(self):
+        game_map = [
+            [
+                CellContent(
+                    row=row,
+                    column=column,
+                    is_mine=column == 1,
+                    is_revealed=row == 0,
+                    is_flagged=(row, column) == (1, 2),
+                    adjacent_mines=(row + column) % 9,
+                )
+                for column in range(4)
+            ]
+            for row in range(3)
+        ]
+        changes = [game_map[0][1], game_map[2][3]]
+        state = {"code": "abc", "version": 3, "map": game_map, "changes": changes}
+
+        encoded = encode_game_map_state(state)
+
+        self.assertEqual(encoded["encoding"], "compact")
+        self.assertEqual((encoded["code"], encoded["version"]), ("abc", 3))
+        self.assertEqual(
+            [
+                [
+                    decode_cell(row, column, character)
+                    for column, character in enumerate(line)
+                ]
+                for row, line in enumerate(encoded["map"])
+            ],
+            game_map,
+        )
+        self.assertEqual(
+            [decode_cell(*change) for change in encoded["changes"]], changes
+        )
+
+
+class MoveRetryTests(TestCase):
+    """Moves that lose the race for the game version are applied again."""
+
+    def setUp(self):
+        self.code = use_cases.create_new_game(9, 9, 10, seed=5)
+        self.game_id = use_cases._get_game_by_code(self.code).id
+
+    def load_board_after(self, competing_move):
+        # Runs the competing move right after the board of the first attempt is
+        # loaded, so that attempt finds the game at another version once it saves
+        attempts = []
+
+        def load(game):
+            attempts.append(game.version)
+            board = load_board(game)
+            if len(attempts) == 1:
+                competing_move()
+            return board
+
+        return mock.patch.object(use_cases, "load_board", side_effect=load), attempts
+
+    def test_move_is_applied_on_top_of_the_winning_one(self):
+        patch, attempts = self.load_board_after(
+            lambda: use_cases.change_flag(self.code, 0, 0, "other")
+        )
+        with patch:
+            game_map_state = use_cases.change_flag(self.code, 8, 8, "user")
+
+        # The competing move went through the patched load_board too
+        self.assertEqual(attempts, [0, 0, 1])
+        self.assertIsNotNone(game_map_state)
+        self.assertEqual(game_map_state["version"], 2)
+        board = load_board(use_cases._get_game_by_code(self.code))
+        self.assertTrue(board.is_flagged(0))
+        self.assertTrue(board.is_flagged(8 * 9 + 8))
+        self.assertEqual(
+            sorted(GameEventOutbox.objects.values_list("user", flat=True)),
+            ["other", "user"],
+        )
+
+    @override_settings(GAME_MOVE_MAX_RETRIES=2)
+    def test_conflict_is_raised_once_the_retries_are_exhausted(self):
+        with changing_game_on_load() as patched:
+            with self.assertRaises(GameVersionConflict):
+                use_cases.change_flag(self.code, 8, 8, "user")
+
+        self.assertEqual(patched.call_count, 3)
+        board = load_board(use_cases._get_game_by_code(self.code))
+        self.assertFalse(board.is_flagged(8 * 9 + 8))
+        self.assertFalse(GameEventOutbox.objects.exists())
+
+    @override_settings(GAME_MOVE_MAX_RETRIES=0)
+    def test_conflicts_are_answered_with_409(self):
+        for view in ("move", "flip_flag"):
+            with self.subTest(view=view), changing_game_on_load():
+                response = self.client.post(
+                    f"/game/{self.code}/{view}",
+                    {"row": 8, "column": 8, "user": "user"},
+                    content_type="application/json",
+                )
+                self.assertEqual(response.status_code, 409)
+
+
+class MoveConflictConsumerTests(TransactionTestCase):
+    @override_settings(GAME_MOVE_MAX_RETRIES=0)
+    async def test_conflict_is_reported_to_the_sender(self):
+        code = await database_sync_to_async(use_cases.create_new_game)(9, 9, 10, 5)
+        communicator = await connect(consumers.GameConsumer, code)
+
+        with changing_game_on_load():
+            await communicator.send_json_to(
+                {"type": "flag", "row": 8, "column": 8, "user": "user"}
+            )
+            self.assertEqual(await receive(communicator), consumers.GAME_BUSY_ERROR)
+        await communicator.disconnect()
+
+
+class ReplayTests(TestCase):
+    """Replaying the events of a game rebuilds the map of its stored board."""
+
+    def play(self, code: str, moves: int) -> list[tuple[str, GameMapCurrentState]]:
+        # State and map of the game after each move, of flags, unflags and reveals
+        rng = random.Random(code)
+        maps: list[tuple[str, GameMapCurrentState]] = []
+        while len(maps) < moves:
+            game = use_cases._get_game_by_code(code)
+            if game.state != "ongoing":
+                break
+            row, column = rng.randrange(game.rows), rng.randrange(game.columns)
+            move = use_cases.change_flag if rng.random() < 0.3 else use_cases.play_move
+            if move(code, row, column, "user") is not None:
+                maps.append(self.stored_map(code))
+        return maps
+
+    def stored_map(self, code: str) -> tuple[str, GameMapCurrentState]:
+        game = use_cases._get_game_by_code(code)
+        return game.state, use_cases._create_game_map_from_existing_game(
+            game, load_board(game)
+        )
+
+    def replayed_map(
+        self, code: str, events: int | None = None
+    ) -> tuple[str, GameMapCurrentState]:
+        game = use_cases._get_game_by_code(code)
+        board, state, _ = replay.replay_events(game, events)
+        game = copy.copy(game)
+        game.state = state
+        return state, use_cases._create_game_map_from_existing_game(game, board)
+
+    def assert_replays(self, code: str, moves: int):
+        maps = self.play(code, moves)
+        self.assertGreater(len(maps), 1)
+
+        # From the outbox, then from the drained events
+        self.assertEqual(self.replayed_map(code), self.stored_map(code))
+        drain_game_event_outbox()
+        self.assertEqual(self.replayed_map(code), self.stored_map(code))
+
+        # Every move of these games records a single event
+        for events, expected in enumerate(maps, start=1):
+            with self.subTest(events=events):
+                self.assertEqual(self.replayed_map(code, events), expected)
+
+    def test_packed_games_replay(self):
+        for seed in range(3):
+            with self.subTest(seed=seed):
+                self.assert_replays(
+                    use_cases.create_new_game(12, 10, 15, seed=seed), 25
+                )
+
+    @override_settings(GAME_BOARD_STORAGE="lazy")
+    def test_lazy_games_replay(self):
+        # Lazy games place their mines around the first revealed cell
+        for seed in range(3):
+            with self.subTest(seed=seed):
+                self.assert_replays(
+                    use_cases.create_new_game(12, 10, 15, seed=seed), 25
+                )
+
+    def test_cell_games_replay(self):
+        with override_settings(GAME_BOARD_STORAGE="cells"):
+            code = use_cases.create_new_game(8, 8, 10, seed=9)
+        self.assert_replays(code, 15)
+
+
+class TiledBoardTests(TestCase):
+    """Tiled boards are generated in bands and revealed tile by tile."""
+
+    def test_bands_hold_the_mines_and_their_counts(self):
+        for rows, columns, mines, band_rows in [(10, 7, 20, 3), (130, 77, 900, 64)]:
+            with self.subTest(board=(rows, columns, mines, band_rows)):
+                bands = list(generate_board_bands(rows, columns, mines, band_rows, 1))
+                cells = np.vstack(bands)
+                self.assertEqual(cells.shape, (rows, columns))
+
+                is_mine = (cells & MINE) != 0
+                self.assertEqual(int(is_mine.sum()), mines)
+                padded = np.pad(is_mine, 1).astype(np.uint8)
+                counts = (
+                    sum(
+                        padded[row : row + rows, column : column + columns]
+                        for row in range(3)
+                        for column in range(3)
+                    )
+                    - is_mine
+                )
+                self.assertEqual((cells & 0x0F).tolist(), counts.tolist())
+
+                again = np.vstack(
+                    list(generate_board_bands(rows, columns, mines, band_rows, 1))
+                )
+                self.assertEqual(again.tolist(), cells.tolist())
+
+    @override_settings(GAME_TILED_BOARD_MIN_CELLS=1, GAME_BOARD_TILE_SIZE=4)
+    def test_reveal_matches_a_naive_cascade(self):
+        rng = random.Random(3)
+        for rows, columns, mines in [(9, 14, 6), (23, 17, 30)]:
+            code = use_cases.create_new_game(rows, columns, mines, seed=rows)
+            game = use_cases._get_game_by_code(code)
+            self.assertEqual(game.storage, Game.Storage.TILED)
+
+            tiled = load_board(game)
+            plain = Board(
+                rows, columns, bytes(tiled.values(list(range(rows * columns))))
+            )
+            empty = [
+                index
+                for index in range(rows * columns)
+                if not plain.is_mine(index) and plain.adjacent_mines(index) == 0
+            ]
+            for index in rng.sample(empty, min(len(empty), 5)):
+                with self.subTest(board=(rows, columns, mines), index=index):
+                    expected = naive_reveal(plain, index)
+                    self.assertEqual(set(tiled_reveal(tiled, index)), expected)
+                    for cell in expected:
+                        plain.reveal(cell)
+                    self.assertEqual(
+                        tiled.values(list(range(rows * columns))), list(plain.cells)
+                    )
+
+
+class CompactionTests(TestCase):
+    """Finished games are archived, and load the board they had before."""
+
+    def finish(self, code: str):
+        game = use_cases._get_game_by_code(code)
+        board = load_board(game)
+        use_cases.play_move(code, 0, 0, "user")
+        mine = next(index for index in range(9 * 9) if board.is_mine(index))
+        use_cases.play_move(code, *board.position(mine), "user")
+        self.assertEqual(use_cases._get_game_by_code(code).state, "lost")
+
+    def stored_cells(self, code: str) -> bytes:
+        return bytes(load_board(use_cases._get_game_by_code(code)).cells)
+
+    def test_finished_games_are_archived(self):
+        codes = {}
+        for storage in (Game.Storage.PACKED, Game.Storage.CELLS):
+            with override_settings(GAME_BOARD_STORAGE=storage):
+                codes[storage] = use_cases.create_new_game(9, 9, 10, seed=4)
+            self.finish(codes[storage])
+        ongoing = use_cases.create_new_game(9, 9, 10, seed=4)
+        before = {code: self.stored_cells(code) for code in codes.values()}
+
+        report = compaction.compact_finished_games()
+
+        self.assertEqual(report["games"], 2)
+        self.assertEqual(report["cell_rows"], 9 * 9)
+        self.assertLess(report["board_bytes_after"], report["board_bytes_before"])
+        self.assertFalse(Cell.objects.exists())
+        for code, cells in before.items():
+            with self.subTest(code=code):
+                game = use_cases._get_game_by_code(code)
+                self.assertEqual(game.storage, Game.Storage.ARCHIVED)
+                self.assertEqual(self.stored_cells(code), cells)
+        self.assertEqual(
+            use_cases._get_game_by_code(ongoing).storage, Game.Storage.PACKED
+        )
+
+    def test_games_changed_while_archived_are_skipped(self):
+        code = use_cases.create_new_game(9, 9, 10, seed=4)
+        self.finish(code)
+
+        def load(game):
+            # E.g. drop_cold_boards dropped the board in the meantime
+            Game.objects.filter(id=game.id).update(storage=Game.Storage.EVENTS)
+            return load_board(game)
+
+        with mock.patch.object(compaction, "load_board", side_effect=load):
+            report = compaction.compact_finished_games()
+
+        self.assertEqual(report["games"], 0)
+        self.assertEqual(use_cases._get_game_by_code(code).storage, Game.Storage.EVENTS)
+
+    def test_dropped_boards_are_rebuilt_from_the_events(self):
+        code = use_cases.create_new_game(9, 9, 10, seed=4)
+        self.finish(code)
+        cells = self.stored_cells(code)
+
+        call_command("drop_cold_boards", stdout=io.StringIO())
+
+        game = use_cases._get_game_by_code(code)
+        self.assertEqual(game.storage, Game.Storage.EVENTS)
+        self.assertIsNone(game.board)
+        self.assertEqual(self.stored_cells(code), cells)
+
+    def test_archived_games_are_not_dropped(self):
+        code = use_cases.create_new_game(9, 9, 10, seed=4)
+        self.finish(code)
+        # Loaded before a compaction archives it at the same version
+        game = use_cases._get_game_by_code(code)
+        compaction.compact_finished_games()
+
+        self.assertFalse(drop_cold_boards._drop_board(game))
+        self.assertEqual(
+            use_cases._get_game_by_code(code).storage, Game.Storage.ARCHIVED
+        )
+
+
+class ChordTests(TestCase):
+    """Chords reveal the neighbours of a number once its flags are placed."""
+
+    def setUp(self):
+        self.code = use_cases.create_new_game(9, 9, 12, seed=8)
+        self.board = load_board(use_cases._get_game_by_code(self.code))
+        # A number with a single mine and safe hidden neighbours, found away from
+        # the empty regions so revealing it doesn't reveal its neighbours
+        self.number = next(
+            index
+            for index in range(9 * 9)
+            if not self.board.is_mine(index)
+            and self.board.adjacent_mines(index) == 1
+            and all(self.board.adjacent_mines(cell) for cell in self.neighbours(index))
+        )
+        use_cases.play_move(self.code, *self.board.position(self.number), "user")
+        self.mine = next(
+            c for c in self.neighbours(self.number) if self.board.is_mine(c)
+        )
+        self.safe = next(
+            c for c in self.neighbours(self.number) if not self.board.is_mine(c)
+        )
+
+    def neighbours(self, index: int) -> list[int]:
+        return [cell for cell in self.board.neighbours(index) if cell != index]
+
+    def flag(self, index: int):
+        use_cases.change_flag(self.code, *self.board.position(index), "user")
+
+    def chord(self):
+        return use_cases.chord(self.code, *self.board.position(self.number), "user")
+
+    def game(self) -> Game:
+        return use_cases._get_game_by_code(self.code)
+
+    def test_satisfied_number_reveals_its_neighbours(self):
+        self.flag(self.mine)
+
+        game_map_state = self.chord()
+
+        self.assertIsNotNone(game_map_state)
+        board = load_board(self.game())
+        for cell in self.neighbours(self.number):
+            with self.subTest(cell=cell):
+                self.assertEqual(board.is_revealed(cell), cell != self.mine)
+        self.assertEqual(
+            {(change["row"], change["column"]) for change in game_map_state["changes"]},
+            {self.board.position(c) for c in self.neighbours(self.number)}
+            - {self.board.position(self.mine)},
+        )
+
+    def test_wrong_flag_count_is_ignored(self):
+        version = self.game().version
+
+        self.assertIsNone(self.chord())
+
+        self.assertEqual(self.game().version, version)
+        board = load_board(self.game())
+        self.assertFalse(
+            any(board.is_revealed(c) for c in self.neighbours(self.number))
+        )
+
+    def test_unflagged_mine_loses_the_game(self):
+        self.flag(self.safe)
+
+        game_map_state = self.chord()
+
+        self.assertIsNotNone(game_map_state)
+        self.assertEqual(game_map_state["state"], "lost")
+        self.assertEqual(self.game().state, "lost")
+
+    def test_chord_is_a_single_update_that_replays(self):
+        self.flag(self.mine)
+        version = self.game().version
+        events = GameEventOutbox.objects.count()
+
+        self.chord()
+
+        game = self.game()
+        self.assertEqual(game.version, version + 1)
+        hidden = len(self.neighbours(self.number)) - 1
+        self.assertEqual(GameEventOutbox.objects.count(), events + hidden)
+        self.assertEqual(replay.replay_board(game).cells, load_board(game).cells)
+
+
+class StatsTests(TestCase):
+    """Finished games are added to the statistics once, as they end."""
+
+    def setUp(self):
+        self.code = use_cases.create_new_game(5, 5, 2, seed=6)
+        self.board = load_board(use_cases._get_game_by_code(self.code))
+
+    def difficulty(self) -> DifficultyStats:
+        return DifficultyStats.objects.get(rows=5, columns=5, mines=2)
+
+    def play(self, index: int, user: str = "user"):
+        return use_cases.play_move(self.code, *self.board.position(index), user)
+
+    def test_won_game_is_counted_once(self):
+        for index in range(5 * 5):
+            if not self.board.is_mine(index):
+                self.play(index, user=f"user{index % 2}")
+        self.assertEqual(use_cases._get_game_by_code(self.code).state, "won")
+        mine = next(index for index in range(5 * 5) if self.board.is_mine(index))
+        self.assertIsNone(self.play(mine))
+
+        difficulty = self.difficulty()
+        self.assertEqual((difficulty.games_finished, difficulty.games_won), (1, 1))
+        self.assertIsNotNone(difficulty.fastest_win_seconds)
+        self.assertEqual(LeaderboardEntry.objects.count(), 1)
+        self.assertEqual(
+            sorted(UserStats.objects.values_list("user", "games_won")),
+            [("user0", 1), ("user1", 1)],
+        )
+
+    def test_lost_game_is_counted_once(self):
+        mines = [index for index in range(5 * 5) if self.board.is_mine(index)]
+        self.assertIsNotNone(self.play(mines[0]))
+        self.assertIsNone(self.play(mines[1]))
+
+        difficulty = self.difficulty()
+        self.assertEqual((difficulty.games_finished, difficulty.games_won), (1, 0))
+        self.assertIsNone(difficulty.fastest_win_seconds)
+        self.assertFalse(LeaderboardEntry.objects.exists())
+        self.assertEqual(UserStats.objects.get(user="user").games_finished, 1)
+
+    def test_leaderboard_lists_the_fastest_wins_first(self):
+        durations = [30.0, 10.0, 20.0, 5.0]
+        games = []
+        for duration in durations:
+            game = Game.objects.create(
+                rows=5, columns=5, mines=2, safe_cells_remaining=0
+            )
+            # Wins of another board size are left out
+            mines = 2 if duration != 5.0 else 3
+            LeaderboardEntry.objects.create(
+                game=game,
+                rows=5,
+                columns=5,
+                mines=mines,
+                duration_seconds=duration,
+                users=["user"],
+            )
+            games.append(game)
+
+        response = self.client.get(
+            "/game/leaderboard", {"rows": 5, "columns": 5, "mines": 2, "limit": 2}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["wins"],
+            [
+                {"code": games[1].code, "duration_seconds": 10.0, "users": ["user"]},
+                {"code": games[2].code, "duration_seconds": 20.0, "users": ["user"]},
+            ],
+        )
+
+    def test_leaderboard_needs_a_board_size(self):
+        response = self.client.get("/game/leaderboard", {"rows": 5, "columns": 5})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            "/game/leaderboard", {"rows": 5, "columns": 5, "mines": 2, "limit": "x"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(GAME_POOL_PRESETS=[(5, 5, 3)], GAME_POOL_SIZE=2)
+class GamePoolTests(TestCase):
+    """Games of the presets are generated ahead of time and claimed once."""
+
+    def setUp(self):
+        clear_map_cache()
+
+    def pooled(self) -> list[int]:
+        return list(Game.objects.filter(pooled=True).values_list("id", flat=True))
+
+    def test_fill_tops_up_the_pool(self):
+        self.assertEqual(fill_game_pool(), 2)
+        self.assertEqual(fill_game_pool(), 0)
+
+        use_cases.create_new_game(5, 5, 3)
+        self.assertEqual(fill_game_pool(), 1)
+        self.assertEqual(len(self.pooled()), 2)
+
+    def test_pooled_game_is_claimed_once(self):
+        fill_game_pool()
+        pooled = self.pooled()
+
+        codes = [use_cases.create_new_game(5, 5, 3) for _ in range(3)]
+
+        claimed = [use_cases._convert_code_to_id(code) for code in codes[:2]]
+        self.assertCountEqual(claimed, pooled)
+        self.assertNotIn(use_cases._convert_code_to_id(codes[2]), pooled)
+        self.assertEqual(self.pooled(), [])
+        self.assertEqual(Game.objects.count(), 3)
+
+    def test_empty_pool_generates_a_game(self):
+        with mock.patch.object(
+            use_cases, "_generate_game", wraps=use_cases._generate_game
+        ) as generate:
+            code = use_cases.create_new_game(5, 5, 3)
+
+        generate.assert_called_once_with(5, 5, 3, None)
+        self.assertFalse(use_cases._get_game_by_code(code).pooled)
+
+    def test_other_boards_are_not_claimed(self):
+        fill_game_pool()
+
+        # Other sizes, and games created with a seed, are generated
+        use_cases.create_new_game(5, 5, 4)
+        use_cases.create_new_game(5, 5, 3, seed=1)
+
+        self.assertEqual(len(self.pooled()), 2)
+
+    def test_pooled_games_are_not_found(self):
+        fill_game_pool()
+        code = Game(id=self.pooled()[0]).code
+
+        with self.assertRaises(Game.DoesNotExist):
+            use_cases._get_game_by_code(code)
+        with self.assertRaises(Game.DoesNotExist):
+            use_cases.get_game_map_by_code(code)
+
+
+class NewGameTests(TestCase):
+    def post(self, **data):
+        return self.client.post("/game/new", data, content_type="application/json")
+
+    def test_board_needs_a_cell_without_a_mine(self):
+        for rows, columns, mines in [(3, 3, 9), (3, 3, 10), (3, 3, -1), (0, 3, 0)]:
+            with self.subTest(board=(rows, columns, mines)):
+                response = self.post(rows=rows, columns=columns, mines=mines)
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post(rows=3, columns="x", mines=1).status_code, 400)
+        self.assertFalse(Game.objects.exists())
+
+        response = self.post(rows=3, columns=3, mines=8)
+        self.assertEqual(response.status_code, 200)
+        use_cases._get_game_by_code(response.json()["code"])
+
+    @override_settings(GAME_BOARD_STORAGE="lazy")
+    def test_first_reveal_of_lazy_games_is_safe(self):
+        # Down to boards with a single cell without a mine
+        for rows, columns, mines in [(9, 9, 10), (4, 4, 12), (3, 3, 8), (1, 2, 1)]:
+            for seed in range(5):
+                code = use_cases.create_new_game(rows, columns, mines, seed=seed)
+                row, column = seed % rows, (seed * 7) % columns
+                with self.subTest(board=(rows, columns, mines), cell=(row, column)):
+                    game_map_state = use_cases.play_move(code, row, column, "user")
+                    self.assertIsNotNone(game_map_state)
+                    self.assertNotEqual(game_map_state["state"], "lost")
+                    board = load_board(use_cases._get_game_by_code(code))
+                    self.assertFalse(board.is_mine(row * columns + column))
+
+
+class MapCacheTests(TestCase):
+    """Cached maps are read without the database, until a move changes them."""
+
+    def setUp(self):
+        clear_map_cache()
+        self.code = use_cases.create_new_game(9, 9, 10, seed=2)
+
+    def test_cache_hit_does_not_query_the_database(self):
+        first = use_cases.get_game_map_by_code(self.code)
+
+        with self.assertNumQueries(0):
+            cached = use_cases.get_game_map_by_code(self.code)
+
+        self.assertEqual(cached["version"], 0)
+        self.assertEqual(cached["map"], first["map"])
+
+    def test_move_makes_the_cached_map_stale(self):
+        use_cases.get_game_map_by_code(self.code)
+
+        # As the consumers play, without rendering nor caching the map
+        use_cases.change_flag(self.code, 0, 0, "user", with_map=False)
+
+        game_map_state = use_cases.get_game_map_by_code(self.code)
+        self.assertEqual(game_map_state["version"], 1)
+        self.assertTrue(game_map_state["map"][0][0]["is_flagged"])
+        with self.assertNumQueries(0):
+            self.assertEqual(use_cases.get_game_map_by_code(self.code)["version"], 1)
+
+        # Moves rendering the map cache it for the next reads
+        use_cases.change_flag(self.code, 0, 0, "user")
+        with self.assertNumQueries(0):
+            game_map_state = use_cases.get_game_map_by_code(self.code)
+        self.assertEqual(game_map_state["version"], 2)
+        self.assertFalse(game_map_state["map"][0][0]["is_flagged"])
+
+    def test_expired_version_is_read_again(self):
+        use_cases.get_game_map_by_code(self.code)
+        # E.g. a move of another process whose version was set out of order
+        Game.objects.filter(id=use_cases._convert_code_to_id(self.code)).update(
+            version=5
+        )
+        caches[settings.GAME_MAP_CACHE].delete(f"game_version:{self.code}")
+
+        self.assertEqual(use_cases.get_game_map_by_code(self.code)["version"], 5)
+
+
+class MoveQueueTests(SimpleTestCase):
+    """The move workers of the async consumer stop once their game is idle."""
+
+    async def test_move_queued_as_the_worker_times_out_is_applied(self):
+        move = GameMove(type="flag", row=0, column=0, user="user")
+        queue: asyncio.Queue = asyncio.Queue()
+        consumers._move_queues["code"] = queue
+        wait_for = asyncio.wait_for
+        waits = 0
+
+        async def time_out_once(awaitable, timeout):
+            # The move arrives as the first wait times out
+            nonlocal waits
+            waits += 1
+            if waits == 1:
+                awaitable.close()
+                queue.put_nowait(move)
+                raise asyncio.TimeoutError()
+            return await wait_for(awaitable, 0.01)
+
+        with mock.patch.object(
+            consumers, "_apply_move_message", return_value=None
+        ) as apply_move, mock.patch.object(asyncio, "wait_for", time_out_once):
+            await consumers._process_moves("code", queue)
+
+        apply_move.assert_called_once_with("code", move)
+        self.assertNotIn("code", consumers._move_queues)
+
+
+class EngineTests(TestCase):
+    """Games held by the engine are written behind, and reload as written."""
+
+    def setUp(self):
+        # The flusher thread is run by hand, on the connection of the test
+        patch = mock.patch.object(engine, "_start_flusher")
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.addCleanup(engine._engines.clear)
+
+        self.code = use_cases.create_new_game(12, 10, 15, seed=1)
+        self.board = load_board(use_cases._get_game_by_code(self.code))
+
+    def play(self, cells: int) -> int:
+        """
+        Flag safe cells through the engine, unflagging and revealing half of
+        them. Returns the number of moves applied.
+        """
+        safe = [index for index in range(12 * 10) if not self.board.is_mine(index)]
+        applied = 0
+        for index in random.Random(cells).sample(safe, cells):
+            row, column = self.board.position(index)
+            moves = [engine.change_flag]
+            if index % 2:
+                moves += [engine.change_flag, engine.play_move]
+            for move in moves:
+                # Cells revealed by a cascade can't be flagged nor revealed again
+                applied += move(self.code, row, column, "user") is not None
+        return applied
+
+    def test_idle_games_are_flushed_evicted_and_reloaded(self):
+        events = self.play(8)
+        held = engine._engines[self.code]
+        self.assertEqual(use_cases._get_game_by_code(self.code).version, 0)
+
+        idle = settings.GAME_ENGINE_EVICT_IDLE_SECONDS
+        engine._flush_and_evict(time.monotonic() + idle)
+
+        self.assertNotIn(self.code, engine._engines)
+        self.assertTrue(held.evicted)
+        game = use_cases._get_game_by_code(self.code)
+        self.assertEqual(game.version, events)
+        self.assertEqual(GameEvents.objects.filter(game=game).count(), events)
+        self.assertEqual(load_board(game).cells, held.board.cells)
+        self.assertEqual(replay.replay_board(game).cells, held.board.cells)
+
+        # Played again from the written state
+        more = self.play(3)
+        self.assertEqual(engine.get_engine(self.code).game.version, events + more)
+
+    def test_engine_loaded_by_another_thread_wins(self):
+        other = engine.GameEngine.load(self.code)
+
+        def load(code):
+            engine._engines[code] = other
+            return engine.GameEngine(*self.load_game(code))
+
+        with mock.patch.object(engine.GameEngine, "load", side_effect=load):
+            self.assertIs(engine.get_engine(self.code), other)
+
+    def test_load_overlapping_an_eviction_is_loaded_again(self):
+        loads: list[str] = []
+
+        def load(code):
+            if not loads:
+                engine._evictions += 1
+            loads.append(code)
+            return engine.GameEngine(*self.load_game(code))
+
+        with mock.patch.object(engine.GameEngine, "load", side_effect=load):
+            engine.get_engine(self.code)
+
+        self.assertEqual(loads, [self.code, self.code])
+
+    def load_game(self, code: str) -> tuple[Game, Board]:
+        game = use_cases._get_game_by_code(code)
+        return game, load_board(game)
+
+
+@override_settings(GAME_PRESENCE_TTL_SECONDS=30)
+class PresenceTests(SimpleTestCase):
+    """Users are connected while one of their connections sends heartbeats."""
+
+    def setUp(self):
+        self.presence = LocMemPresence()
+        self.now = 1000.0
+        patch = mock.patch.object(presence.time, "time", side_effect=lambda: self.now)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def assert_update(self, update, joined=(), left=(), users=()):
+        self.assertEqual(
+            update, {"joined": list(joined), "left": list(left), "users": list(users)}
+        )
+
+    def test_users_join_with_their_first_connection(self):
+        self.assert_update(
+            self.presence.touch("game", "a1", "alice"),
+            joined=["alice"],
+            users=["alice"],
+        )
+        self.assert_update(self.presence.touch("game", "a2", "alice"), users=["alice"])
+        self.assert_update(
+            self.presence.touch("game", "b1", "bob"),
+            joined=["bob"],
+            users=["alice", "bob"],
+        )
+        # Games are tracked apart
+        self.assert_update(
+            self.presence.touch("other", "c1", "carol"),
+            joined=["carol"],
+            users=["carol"],
+        )
+
+    def test_users_leave_with_their_last_connection(self):
+        self.presence.touch("game", "a1", "alice")
+        self.presence.touch("game", "a2", "alice")
+        self.presence.touch("game", "b1", "bob")
+
+        self.assert_update(self.presence.leave("game", "a1"), users=["alice", "bob"])
+        self.assert_update(
+            self.presence.leave("game", "a2"), left=["alice"], users=["bob"]
+        )
+        self.assert_update(self.presence.leave("game", "b1"), left=["bob"])
+        self.assertEqual(self.presence._games, {})
+
+    def test_heartbeats_keep_connections_alive(self):
+        self.presence.touch("game", "a1", "alice")
+        self.presence.touch("game", "b1", "bob")
+
+        self.now += 20
+        self.assert_update(
+            self.presence.touch("game", "a1", "alice"), users=["alice", "bob"]
+        )
+
+        # Bob's connection stopped sending heartbeats, it's pruned on the next update
+        self.now += 20
+        self.assert_update(
+            self.presence.touch("game", "a1", "alice"), left=["bob"], users=["alice"]
+        )
+
+        self.now += 31
+        self.assert_update(
+            self.presence.touch("game", "b2", "bob"),
+            joined=["bob"],
+            left=["alice"],
+            users=["bob"],
+        )
+
+    def test_only_deltas_are_broadcast(self):
+        update = self.presence.touch("game", "a1", "alice")
+        self.assertEqual(
+            consumers._get_presence_message(update),
+            {"type": "user.list", "joined": ["alice"], "left": []},
+        )
+        self.assertIsNone(
+            consumers._get_presence_message(self.presence.touch("game", "a1", "alice"))
+        )
+
+
+class AsyncConsumerTests(TransactionTestCase):
+    """The async consumer sends the map on connect and broadcasts the moves."""
+
+    def setUp(self):
+        clear_map_cache()
+        self.code = use_cases.create_new_game(9, 9, 10, seed=5)
+        self.board = load_board(use_cases._get_game_by_code(self.code))
+
+    async def test_connect_sends_the_map(self):
+        communicator = await connect(
+            consumers.AsyncGameConsumer, self.code, protocol="delta"
+        )
+
+        message = await communicator.receive_json_from()
+        self.assertEqual(message["type"], "update.map")
+        self.assertEqual(
+            (message["map"]["code"], message["map"]["version"]), (self.code, 0)
+        )
+        self.assertEqual(len(message["map"]["map"]), 9)
+        self.assertFalse(
+            any(cell["is_revealed"] for row in message["map"]["map"] for cell in row)
+        )
+        self.assertEqual(
+            await communicator.receive_json_from(),
+            {"type": "user.list", "users": ["user"]},
+        )
+        await communicator.disconnect()
+
+    async def test_move_is_broadcast(self):
+        full = await connect(consumers.AsyncGameConsumer, self.code)
+        delta = await connect(consumers.AsyncGameConsumer, self.code, protocol="delta")
+        await receive(delta)  # the map sent on connect
+
+        mine = next(index for index in range(9 * 9) if self.board.is_mine(index))
+        row, column = self.board.position(mine)
+        await full.send_json_to(
+            {"type": "flag", "row": row, "column": column, "user": "user"}
+        )
+
+        cells = await receive(delta)
+        self.assertEqual(cells["type"], "update.cells")
+        self.assertEqual(cells["map"]["version"], 1)
+        self.assertEqual(
+            [
+                (cell["row"], cell["column"], cell["is_flagged"])
+                for cell in cells["map"]["cells"]
+            ],
+            [(row, column, True)],
+        )
+
+        # Full protocol clients get the whole map, with the changed cells applied
+        game_map = await receive(full)
+        self.assertEqual(game_map["type"], "update.map")
+        self.assertEqual(game_map["map"]["version"], 1)
+        self.assertTrue(game_map["map"]["map"][row][column]["is_flagged"])
+        self.assertEqual(
+            sum(cell["is_flagged"] for line in game_map["map"]["map"] for cell in line),
+            1,
+        )
+
+        await full.disconnect()
+        await delta.disconnect()
+        # The move worker of the game outlives its connections
+        for worker in list(consumers._move_workers):
+            worker.cancel()
+        consumers._move_queues.clear()
+
+
+class MapProtocolTests(TransactionTestCase):
+    """Each map protocol gets the messages its clients expect."""
+
+    snapshot_keys = {
+        "code",
+        "state",
+        "version",
+        "map",
+        "rows",
+        "columns",
+        "started_at",
+        "total_time_in_seconds",
+        "tile_size",
+    }
+
+    def setUp(self):
+        clear_map_cache()
+
+    def create_game(self) -> tuple[str, Board]:
+        code = use_cases.create_new_game(9, 9, 10, seed=5)
+        return code, load_board(use_cases._get_game_by_code(code))
+
+    async def flag(self, communicator, row: int, column: int):
+        await communicator.send_json_to(
+            {"type": "flag", "row": row, "column": column, "user": "user"}
+        )
+
+    async def test_delta_clients_get_the_map_then_the_changed_cells(self):
+        code, _ = await database_sync_to_async(self.create_game)()
+        communicator = await connect(consumers.GameConsumer, code, protocol="delta")
+
+        snapshot = await receive(communicator)
+        self.assertEqual(snapshot["type"], "update.map")
+        self.assertEqual(set(snapshot["map"]), self.snapshot_keys)
+        self.assertEqual([len(line) for line in snapshot["map"]["map"]], [9] * 9)
+
+        await self.flag(communicator, 2, 3)
+        update = await receive(communicator)
+        self.assertEqual(update["type"], "update.cells")
+        self.assertEqual(set(update["map"]), self.snapshot_keys - {"map"} | {"cells"})
+        self.assertEqual(update["map"]["version"], 1)
+        self.assertEqual(
+            update["map"]["cells"],
+            [
+                {
+                    "row": 2,
+                    "column": 3,
+                    "is_mine": False,
+                    "is_revealed": False,
+                    "is_flagged": True,
+                    "adjacent_mines": 0,
+                }
+            ],
+        )
+
+        # A client that missed an update reads the whole map again
+        await communicator.send_json_to({"type": "sync"})
+        snapshot = await receive(communicator)
+        self.assertEqual(snapshot["type"], "update.map")
+        self.assertEqual(snapshot["map"]["version"], 1)
+        self.assertTrue(snapshot["map"]["map"][2][3]["is_flagged"])
+        await communicator.disconnect()
+
+    async def test_compact_clients_get_encoded_cells(self):
+        code, _ = await database_sync_to_async(self.create_game)()
+        communicator = await connect(
+            consumers.GameConsumer, code, protocol="delta", encoding="compact"
+        )
+
+        snapshot = await receive(communicator)
+        self.assertEqual(snapshot["map"]["encoding"], "compact")
+        self.assertEqual(snapshot["map"]["map"], ["0" * 9] * 9)
+
+        await self.flag(communicator, 2, 3)
+        update = await receive(communicator)
+        self.assertEqual(update["type"], "update.cells")
+        self.assertEqual(update["map"]["cells"], [[2, 3, "A"]])
+        await communicator.disconnect()
+
+    @override_settings(GAME_TILED_BOARD_MIN_CELLS=1, GAME_BOARD_TILE_SIZE=4)
+    async def test_tiles_clients_get_the_cells_of_their_viewport(self):
+        code, _ = await database_sync_to_async(self.create_game)()
+        communicator = await connect(consumers.GameConsumer, code, protocol="tiles")
+
+        # Tiled games have no map, clients read the tiles they show
+        snapshot = await receive(communicator)
+        self.assertEqual(snapshot["type"], "update.map")
+        self.assertEqual(snapshot["map"]["map"], [])
+        self.assertEqual(snapshot["map"]["tile_size"], 4)
+
+        await communicator.send_json_to({"type": "viewport", "tiles": "all"})
+        self.assertEqual(await receive(communicator), {"error": "Invalid viewport"})
+
+        await communicator.send_json_to({"type": "viewport", "tiles": [[0, 1]]})
+        # Outside the viewport, then inside it
+        await self.flag(communicator, 8, 8)
+        await self.flag(communicator, 2, 5)
+        update = await receive(communicator)
+        self.assertEqual(update["type"], "update.cells")
+        self.assertEqual(update["map"]["version"], 2)
+        self.assertEqual(
+            [(cell["row"], cell["column"]) for cell in update["map"]["cells"]],
+            [(2, 5)],
+        )
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+
+class MapMessageTests(SimpleTestCase):
+    def test_changed_cells_are_sent_to_the_delta_and_tile_groups(self):
+        cells = [
+            CellContent(
+                row=row,
+                column=column,
+                is_mine=False,
+                is_revealed=True,
+                is_flagged=False,
+                adjacent_mines=1,
+            )
+            for row, column in [(0, 1), (5, 0), (5, 6)]
+        ]
+        game_map_state = GameMapState(
+            map=[],
+            state="ongoing",
+            code="abc",
+            rows=9,
+            columns=9,
+            started_at="2024-06-10T00:00:00+00:00",
+            total_time_in_seconds=1.0,
+            version=3,
+            changes=cells,
+            tile_size=4,
+        )
+        state = {
+            key: value
+            for key, value in game_map_state.items()
+            if key not in ("map", "changes")
+        }
+
+        messages = consumers._get_map_messages("game_abc", game_map_state)
+
+        self.assertEqual(
+            messages,
+            [
+                (
+                    "game_abc_delta",
+                    {"type": "update.cells", "map": {**state, "cells": cells}},
+                ),
+                (
+                    "game_abc_tile_0_0",
+                    {"type": "update.cells", "map": {**state, "cells": cells[:1]}},
+                ),
+                (
+                    "game_abc_tile_1_0",
+                    {"type": "update.cells", "map": {**state, "cells": cells[1:2]}},
+                ),
+                (
+                    "game_abc_tile_1_1",
+                    {"type": "update.cells", "map": {**state, "cells": cells[2:]}},
+                ),
+            ],
+        )
+
+
+@override_settings(GAME_REPLAY_MAX_PAGE_SIZE=4)
+class ReplayViewTests(TestCase):
+    """The events of a game are served a page at a time, and replayed."""
+
+    def setUp(self):
+        self.code = use_cases.create_new_game(9, 9, 10, seed=5)
+        for column in range(9):
+            use_cases.change_flag(self.code, 0, column, f"user{column}")
+        drain_game_event_outbox()
+
+    def get_events(self, **params):
+        response = self.client.get(f"/game/{self.code}/events", params)
+        if response.streaming:
+            return response.status_code, json.loads(
+                b"".join(response.streaming_content)
+            )
+        return response.status_code, response.json()
+
+    def test_pages_continue_from_their_cursor(self):
+        pages, after = [], None
+        while True:
+            status, page = self.get_events(
+                limit=3, **({"after": after} if after else {})
+            )
+            self.assertEqual(status, 200)
+            pages.append(page["events"])
+            after = page["next"]
+            if after is None:
+                break
+
+        self.assertEqual([len(events) for events in pages], [3, 3, 3, 0])
+        events = [event for page in pages for event in page]
+        self.assertEqual([event["index"] for event in events], list(range(1, 10)))
+        self.assertEqual(
+            [event["user"] for event in events],
+            [f"user{column}" for column in range(9)],
+        )
+
+    def test_limit_is_clamped_to_the_page_size(self):
+        for params in ({}, {"limit": 100}):
+            with self.subTest(params=params):
+                status, page = self.get_events(**params)
+                self.assertEqual(status, 200)
+                self.assertEqual(len(page["events"]), 4)
+                self.assertIsNotNone(page["next"])
+
+    def test_invalid_parameters_are_rejected(self):
+        for params in (
+            {"limit": 0},
+            {"limit": -1},
+            {"limit": "x"},
+            {"after": "x"},
+            {"after": "1:x"},
+            {"after": "1:99999"},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.get_events(**params)[0], 400)
+
+        response = self.client.get(f"/game/{Game(id=99999).code}/events")
+        self.assertEqual(response.status_code, 404)
+
+    def test_snapshot_replays_the_first_events(self):
+        response = self.client.get(f"/game/{self.code}/events/4/snapshot")
+
+        self.assertEqual(response.status_code, 200)
+        snapshot = response.json()
+        self.assertEqual((snapshot["events"], snapshot["state"]), (4, "ongoing"))
+        self.assertEqual(
+            [cell["is_flagged"] for cell in snapshot["map"][0]],
+            [True] * 4 + [False] * 5,
+        )
+
+    def test_snapshot_needs_a_replayable_game(self):
+        Game.objects.filter(id=use_cases._convert_code_to_id(self.code)).update(
+            seed=None
+        )
+        response = self.client.get(f"/game/{self.code}/events/4/snapshot")
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(f"/game/{Game(id=99999).code}/events/4/snapshot")
+        self.assertEqual(response.status_code, 404)
@@ -4,7 +4,21 @@ from . import views
 
 urlpatterns = [
     path("new", views.new_game, name="new_game"),
+    path("leaderboard", views.leaderboard, name="leaderboard"),
+    path("stats", views.difficulty_stats, name="difficulty_stats"),
+    path("stats/users/<str:user>", views.user_stats, name="user_stats"),
     path("<str:game_code>", views.game, name="game"),
+    path(
+        "<str:game_code>/tiles/<int:tile_row>/<int:tile_column>",
+        views.game_tile,
+        name="game_tile",
+    ),
+    path("<str:game_code>/events", views.game_events, name="game_events"),
+    path(
+        "<str:game_code>/events/<int:events>/snapshot",
+        views.game_snapshot,
+        name="game_snapshot",
+    ),
     path("<str:game_code>/move", views.move, name="move"),
     path("<str:game_code>/flip_flag", views.flip_flag, name="flip_flag"),
 ]
@@ -1,21 +1,60 @@
 from datetime import datetime, timezone
 from functools import lru_cache
-import random
+import copy
+import secrets
+from typing import Callable, Iterable, Iterator
+from django.conf import settings
 from django.db import transaction
 
+import numpy as np
+
 from sqids import Sqids
 
-from game.models import Cell, CellContent, Game, GameMapCurrentState, GameMapState
+from game import metrics, replay, stats
+from game.board import (
+    ADJACENT_MINES_MASK,
+    FLAGGED,
+    MINE,
+    REVEALED,
+    Board,
+    GameVersionConflict,
+    load_board,
+    save_board,
+    split_into_tiles,
+    tile_height,
+    tile_width,
+)
+from game.generation import generate_board, generate_board_bands, generate_mines
+from game.map_cache import (
+    add_game_version,
+    cache_game_map,
+    cache_game_version,
+    get_cached_game_map,
+    get_cached_game_version,
+)
+from game.regions import RegionIndex, flood_reveal, tiled_reveal
+from game.models import (
+    BoardTile,
+    Cell,
+    CellContent,
+    Game,
+    GameEventOutbox,
+    GameEventsType,
+    GameMapCurrentState,
+    GameMapState,
+    GameMove,
+)
 
 import logging
 import sys
 
-from game.tasks import create_game_event
-
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 
 logger = logging.getLogger(__name__)
 
+# Game fields that a move can change
+GAME_MOVE_FIELDS = ["state", "ended_at", "version", "safe_cells_remaining"]
+
 
 @lru_cache(maxsize=100)
 def _convert_code_to_id(code: str) -> int:
@@ -23,16 +62,22 @@ def _convert_code_to_id(code: str) -> int:
     return int(sqids.decode(code)[0])
 
 
-def _create_empty_map(rows: int, cols: int) -> GameMapCurrentState:
+def _create_initial_game_map(
+    rows: int, cols: int, num_mines: int, seed: int | None = None
+) -> GameMapCurrentState:
+    is_mine, adjacent_mines = generate_mines(rows, cols, num_mines, seed)
+    is_mine_rows = is_mine.tolist()
+    adjacent_mines_rows = adjacent_mines.tolist()
+
     return [
         [
             CellContent(
                 row=row,
                 column=col,
-                is_mine=False,
+                is_mine=is_mine_rows[row][col],
                 is_revealed=False,
                 is_flagged=False,
-                adjacent_mines=0,
+                adjacent_mines=adjacent_mines_rows[row][col],
             )
             for col in range(cols)
         ]
@@ -40,120 +85,246 @@ def _create_empty_map(rows: int, cols: int) -> GameMapCurrentState:
     ]
 
 
-def _create_initial_game_map(
-    rows: int, cols: int, num_mines: int
-) -> GameMapCurrentState:
-    map = _create_empty_map(rows, cols)
-
-    # Place mines randomly
-    for _ in range(num_mines):
-        row = random.randint(0, rows - 1)
-        col = random.randint(0, cols - 1)
-        while map[row][col]["is_mine"]:  # If already a mine, re-pick
-            row = random.randint(0, rows - 1)
-            col = random.randint(0, cols - 1)
-        map[row][col]["is_mine"] = True
-
-        # Increment adjacent cells
-        for r in range(row - 1, row + 2):
-            for c in range(col - 1, col + 2):
-                if 0 <= r < rows and 0 <= c < cols and map[r][c]["is_mine"] is False:
-                    map[r][c]["adjacent_mines"] += 1
-
-    return map
-
-
-def _create_game_map_from_existing_game(game: Game) -> GameMapCurrentState:
+def _get_cell_contents(
+    game: Game, board: Board, indexes: Iterable[int]
+) -> list[CellContent]:
+    # The squares are read at once, tiled boards read them tile by tile
     ongoing = game.state == "ongoing"
-    cells = game.cells.all()
-
-    map = _create_empty_map(game.rows, game.columns)
-
-    for cell in cells:
-        map[cell.row][cell.column]["is_revealed"] = cell.is_revealed
-        map[cell.row][cell.column]["is_flagged"] = cell.is_flagged
-
-        if ongoing and cell.is_revealed and not cell.is_flagged:
-            map[cell.row][cell.column]["is_mine"] = cell.is_mine
-            map[cell.row][cell.column]["adjacent_mines"] = cell.adjacent_mines
+    indexes = list(indexes)
+    contents = []
+    for index, value in zip(indexes, board.values(indexes)):
+        row, column = board.position(index)
+        is_revealed = bool(value & REVEALED)
+        is_flagged = bool(value & FLAGGED)
+
+        # Mines are only shown once revealed, or for everyone when the game is over
+        shows_mine = not ongoing or (is_revealed and not is_flagged)
+        shows_adjacent_mines = is_revealed and (not ongoing or not is_flagged)
+
+        contents.append(
+            CellContent(
+                row=row,
+                column=column,
+                is_mine=bool(value & MINE) if shows_mine else False,
+                is_revealed=is_revealed,
+                is_flagged=is_flagged,
+                adjacent_mines=(
+                    value & ADJACENT_MINES_MASK if shows_adjacent_mines else 0
+                ),
+            )
+        )
+    return contents
 
-        if not ongoing:
-            map[cell.row][cell.column]["is_mine"] = cell.is_mine
-            if cell.is_revealed:
-                map[cell.row][cell.column]["adjacent_mines"] = cell.adjacent_mines
 
-    return map
+def _create_game_map_from_existing_game(
+    game: Game, board: Board
+) -> GameMapCurrentState:
+    return [
+        _get_cell_contents(
+            game, board, range(row * game.columns, (row + 1) * game.columns)
+        )
+        for row in range(game.rows)
+    ]
 
 
 def _get_game_by_code(code: str) -> Game:
     game_id = _convert_code_to_id(code)
-    return Game.objects.prefetch_related("cells").get(id=game_id)
-
-
-def _get_game_map(game: Game) -> GameMapState:
-    game_map = _create_game_map_from_existing_game(game)
+    return Game.objects.defer("regions").get(id=game_id, pooled=False)
+
+
+def _get_game_map(
+    game: Game, board: Board, changed: Iterable[int] = (), with_map: bool = True
+) -> GameMapState:
+    """
+    State of the game with the changed cells. Without with_map, the map of
+    every square isn't rendered and is left empty.
+    """
+    with metrics.track("render_map", game.rows * game.columns):
+        return _render_game_map(game, board, changed, with_map)
+
+
+def _render_game_map(
+    game: Game, board: Board, changed: Iterable[int], with_map: bool
+) -> GameMapState:
+    if game.storage == Game.Storage.TILED:
+        # Too large for a single payload, clients read the tiles they show and
+        # read them again once the game is over
+        game_map = []
+    else:
+        game_map = _create_game_map_from_existing_game(game, board) if with_map else []
+
+        # Once the game is over every cell shows its content
+        if game.state != "ongoing" and changed:
+            changed = range(game.rows * game.columns)
 
     delta_time = (game.ended_at or datetime.now(timezone.utc)) - game.created_at
     return GameMapState(
         map=game_map,
         state=game.state,
         code=game.code,
+        rows=game.rows,
+        columns=game.columns,
         started_at=game.created_at,
         total_time_in_seconds=delta_time.total_seconds(),
+        version=game.version,
+        changes=_get_cell_contents(game, board, sorted(changed)),
+        tile_size=game.tile_size,
     )
 
 
-def _ensure_win_condition(game: Game, row: int, column: int) -> bool:
-    cells = game.cells.all()
-    for cell in cells:
-        if not cell.is_revealed and not cell.is_mine:
-            return False
-    return True
+def _get_tile_map(
+    game: Game, board: Board, tile_row: int, tile_column: int
+) -> GameMapCurrentState:
+    first_row = tile_row * game.tile_size
+    first_column = tile_column * game.tile_size
+    width = tile_width(game, tile_column)
+    return [
+        _get_cell_contents(
+            game,
+            board,
+            range(
+                row * game.columns + first_column,
+                row * game.columns + first_column + width,
+            ),
+        )
+        for row in range(first_row, first_row + tile_height(game, tile_row))
+    ]
 
 
-def _find_cell_by_position(game: Game, row: int, column: int) -> Cell | None:
-    cells = game.cells.all()
-    for cell in cells:
-        if cell.row == row and cell.column == column:
-            return cell
-    return None
+def _ensure_win_condition(game: Game, board: Board, row: int, column: int) -> bool:
+    return game.safe_cells_remaining == 0
+
+
+def _find_cell_by_position(board: Board, row: int, column: int) -> int | None:
+    return board.index(row, column)
+
 
+def _reveal_all_empty_cells(game: Game, board: Board, row: int, column: int):
+    index = row * board.columns + column
 
-def _reveal_all_empty_cells(game: Game, row: int, column: int):
-    cells_matrix = [[None] * game.columns for _ in range(game.rows)]
-    cells = game.cells.all()
-    for cell in cells:
-        cells_matrix[cell.row][cell.column] = cell
+    if game.storage == Game.Storage.TILED:
+        return tiled_reveal(board, index)
 
-    cells_to_update = []
+    # The region index is deferred when loading the game, it's only read here
+    if game.regions is None:
+        return flood_reveal(board, index)
 
-    def reveal_empty_cell(cells_matrix, row, column):
-        if cells_matrix[row][column].is_revealed:
-            return
-        cells_matrix[row][column].is_revealed = True
-        cells_to_update.append(cells_matrix[row][column])
+    regions = RegionIndex.from_bytes(game.rows, game.columns, game.regions)
+    return regions.reveal(board, index)
 
-        if cells_matrix[row][column].adjacent_mines == 0:
-            for r in range(row - 1, row + 2):
-                for c in range(column - 1, column + 2):
-                    if 0 <= r < game.rows and 0 <= c < game.columns:
-                        reveal_empty_cell(cells_matrix, r, c)
 
-    reveal_empty_cell(cells_matrix, row, column)
-    return cells_to_update
+def create_new_game(
+    rows: int, columns: int, mines: int, seed: int | None = None
+) -> str:
+    if seed is None and (rows, columns, mines) in settings.GAME_POOL_PRESETS:
+        code = _claim_pooled_game(rows, columns, mines)
+        if code is not None:
+            return code
+    return _generate_game(rows, columns, mines, seed)
 
 
-def create_new_game(rows: int, columns: int, mines: int) -> str:
+def _claim_pooled_game(rows: int, columns: int, mines: int) -> str | None:
+    candidates = list(
+        Game.objects.filter(
+            pooled=True,
+            rows=rows,
+            columns=columns,
+            mines=mines,
+            storage=settings.GAME_BOARD_STORAGE,
+        ).values_list("id", flat=True)[: settings.GAME_POOL_CLAIM_CANDIDATES]
+    )
+    # Concurrent requests can pick the same games, each game is claimed by the
+    # single update that still finds it pooled
+    secrets.SystemRandom().shuffle(candidates)
+    for game_id in candidates:
+        claimed = Game.objects.filter(id=game_id, pooled=True).update(
+            pooled=False, created_at=datetime.now(timezone.utc)
+        )
+        if claimed:
+            return Game(id=game_id).code
+    return None
+
+
+def fill_game_pool() -> int:
+    """
+    Generate the games missing from the pool of each of GAME_POOL_PRESETS, up to
+    GAME_POOL_SIZE games per preset. Returns the number of games generated.
+    """
+    generated = 0
+    for rows, columns, mines in settings.GAME_POOL_PRESETS:
+        pooled = Game.objects.filter(
+            pooled=True,
+            rows=rows,
+            columns=columns,
+            mines=mines,
+            storage=settings.GAME_BOARD_STORAGE,
+        ).count()
+        for _ in range(settings.GAME_POOL_SIZE - pooled):
+            _generate_game(rows, columns, mines, pooled=True)
+            generated += 1
+    return generated
+
+
+def _generate_game(
+    rows: int, columns: int, mines: int, seed: int | None = None, pooled=False
+) -> str:
+    # The seed lets the board be rebuilt from the game events, see game.replay
+    if seed is None:
+        seed = secrets.randbits(63)
+    storage = settings.GAME_BOARD_STORAGE
+    tiled = rows * columns >= settings.GAME_TILED_BOARD_MIN_CELLS
+
+    if storage == Game.Storage.LAZY and not tiled:
+        # Only the game row, the board is generated on the first reveal
+        game = Game.objects.create(
+            rows=rows,
+            columns=columns,
+            mines=mines,
+            safe_cells_remaining=rows * columns - mines,
+            seed=seed,
+            storage=storage,
+            pooled=pooled,
+        )
+        return game.code
+
+    if tiled:
+        return _create_tiled_game(rows, columns, mines, seed)
+
+    board = generate_board(rows, columns, mines, seed)
+    regions = RegionIndex.build(board).to_bytes()
+
+    if storage == Game.Storage.PACKED:
+        game = Game.objects.create(
+            rows=rows,
+            columns=columns,
+            mines=mines,
+            safe_cells_remaining=rows * columns - mines,
+            seed=seed,
+            storage=storage,
+            board=board.to_bytes(),
+            regions=regions,
+            pooled=pooled,
+        )
+        return game.code
+
     with transaction.atomic():
-        game = Game.objects.create(rows=rows, columns=columns, mines=mines)
-        game_map = _create_initial_game_map(rows, columns, mines)
+        game = Game.objects.create(
+            rows=rows,
+            columns=columns,
+            mines=mines,
+            safe_cells_remaining=rows * columns - mines,
+            seed=seed,
+            storage=storage,
+            regions=regions,
+            pooled=pooled,
+        )
         cells = [
             Cell(
                 game=game,
                 row=row,
                 column=column,
-                is_mine=game_map[row][column]["is_mine"],
-                adjacent_mines=game_map[row][column]["adjacent_mines"],
+                is_mine=board.is_mine(row * columns + column),
+                adjacent_mines=board.adjacent_mines(row * columns + column),
             )
             for row in range(rows)
             for column in range(columns)
@@ -163,60 +334,419 @@ def create_new_game(rows: int, columns: int, mines: int) -> str:
     return game.code
 
 
-def get_game_map_by_code(code: str) -> GameMapState:
-    game = _get_game_by_code(code)
-    return _get_game_map(game)
+def _create_tiled_game(rows: int, columns: int, mines: int, seed: int) -> str:
+    # Large boards are generated and written a row of tiles at a time, so the
+    # whole board is never in memory. They aren't region indexed, their
+    # cascades are revealed tile by tile, see regions.tiled_reveal
+    tile_size = settings.GAME_BOARD_TILE_SIZE
+    with transaction.atomic():
+        game = Game.objects.create(
+            rows=rows,
+            columns=columns,
+            mines=mines,
+            safe_cells_remaining=rows * columns - mines,
+            seed=seed,
+            storage=Game.Storage.TILED,
+            tile_size=tile_size,
+        )
+        bands = generate_board_bands(rows, columns, mines, tile_size, seed)
+        for tile_row, band in enumerate(bands):
+            BoardTile.objects.bulk_create(split_into_tiles(game, tile_row, band))
+
+    return game.code
 
 
-def play_move(code: str, row: int, column: int, user: str):
-    game = _get_game_by_code(code)
+def _get_game_version(code: str) -> int:
+    game_id = _convert_code_to_id(code)
+    return Game.objects.values_list("version", flat=True).get(id=game_id, pooled=False)
+
+
+def get_game_map_by_code(code: str) -> GameMapState:
+    with metrics.track("get_game_map_by_code") as tracked:
+        # The version is only read from the database if it isn't cached, the
+        # map is rendered if it isn't cached yet
+        version = get_cached_game_version(code)
+        if version is None:
+            version = _get_game_version(code)
+            add_game_version(code, version)
+        game_map_state = get_cached_game_map(code, version)
+        if game_map_state is None:
+            game = _get_game_by_code(code)
+            game_map_state = _get_game_map(game, load_board(game))
+            cache_game_map(game_map_state)
+        tracked.cells = game_map_state["rows"] * game_map_state["columns"]
+    return game_map_state
+
+
+def _apply_move(game: Game, board: Board, row: int, column: int) -> list[int] | None:
+    """
+    Reveal a cell on the board, ending the game when a mine or the last safe cell
+    is revealed. Returns the cells that changed, or None if the move is invalid.
+    """
     if game.state != "ongoing":
         return None
 
-    cell = _find_cell_by_position(game, row, column)
+    cell = _find_cell_by_position(board, row, column)
 
-    if not cell or cell.is_revealed or cell.is_flagged:
+    if cell is None or board.is_revealed(cell) or board.is_flagged(cell):
         return None
 
-    cells_to_update = []
+    if game.storage == Game.Storage.LAZY and game.safe_cell is None:
+        _place_mines(game, board, cell)
 
-    with transaction.atomic():
-        if cell.is_mine:
-            game.state = "lost"
-            game.ended_at = datetime.now(timezone.utc)
-            game.save()
+    changed = []
 
-        if cell.adjacent_mines == 0:
-            cells_to_update = _reveal_all_empty_cells(game, row, column)
+    if board.is_mine(cell):
+        game.state = "lost"
+        game.ended_at = datetime.now(timezone.utc)
 
-        cell.is_revealed = True
-        cells_to_update.append(cell)
+    if not board.is_mine(cell) and board.adjacent_mines(cell) == 0:
+        changed = _reveal_all_empty_cells(game, board, row, column)
 
-        Cell.objects.bulk_update(cells_to_update, ["is_revealed"])
+    if not board.is_revealed(cell):
+        board.reveal(cell)
+        changed.append(cell)
 
-        if _ensure_win_condition(game, row, column):
-            game.state = "won"
-            game.ended_at = datetime.now(timezone.utc)
-            game.save()
+    game.safe_cells_remaining -= sum(
+        1 for value in board.values(changed) if not value & MINE
+    )
 
-    create_game_event.delay(game.id, row, column, user)
+    if _ensure_win_condition(game, board, row, column):
+        game.state = "won"
+        game.ended_at = datetime.now(timezone.utc)
 
-    return _get_game_map(game)
+    game.version += 1
+    return changed
 
 
-def change_flag(code: str, row: int, column: int, user: str):
-    game = _get_game_by_code(code)
+def _apply_chord(
+    game: Game, board: Board, row: int, column: int, user: str
+) -> tuple[list[int], list[dict]] | None:
+    """
+    Reveal the neighbours of a revealed number once all its flags are placed,
+    with their cascades, as a single update of the game. Returns the cells that
+    changed and the events of the revealed neighbours, or None if the chord is
+    invalid or reveals nothing.
+    """
     if game.state != "ongoing":
         return None
 
-    cell = _find_cell_by_position(game, row, column)
+    cell = _find_cell_by_position(board, row, column)
 
-    if not cell or cell.is_revealed:
+    if cell is None or not board.is_revealed(cell) or board.is_mine(cell):
         return None
 
-    cell.is_flagged = not cell.is_flagged
-    cell.save()
+    neighbours = [index for index in board.neighbours(cell) if index != cell]
+    flags = sum(1 for index in neighbours if board.is_flagged(index))
+    if flags != board.adjacent_mines(cell):
+        return None
+
+    version = game.version
+    changed: list[int] = []
+    events = []
+    for index in neighbours:
+        neighbour_row, neighbour_column = board.position(index)
+        # Skips the revealed and flagged neighbours, and stops once a wrong flag
+        # made it reveal a mine
+        neighbour_changed = _apply_move(game, board, neighbour_row, neighbour_column)
+        if neighbour_changed is None:
+            continue
+        changed.extend(neighbour_changed)
+        events.append(
+            _create_move_event(game, board, neighbour_row, neighbour_column, user)
+        )
+
+    if not events:
+        return None
+    game.version = version + 1
+    return changed, events
+
+
+def _place_mines(game: Game, board: Board, safe_cell: int):
+    """
+    Generate the board of a lazy game around its first revealed cell, keeping
+    the flags placed so far. The game is stored packed once saved.
+    """
+    generated = generate_board(
+        game.rows, game.columns, game.mines, game.seed, safe_cell
+    )
+    flags = np.frombuffer(board.cells, dtype=np.uint8) & FLAGGED
+    board.cells[:] = (np.frombuffer(generated.cells, dtype=np.uint8) | flags).tobytes()
+    board.changed.update(range(game.rows * game.columns))
+
+    game.safe_cell = safe_cell
+    game.regions = RegionIndex.build(board).to_bytes()
+
+
+def _apply_flag(game: Game, board: Board, row: int, column: int) -> list[int] | None:
+    if game.state != "ongoing":
+        return None
+
+    cell = _find_cell_by_position(board, row, column)
+
+    if cell is None or board.is_revealed(cell):
+        return None
+
+    board.toggle_flag(cell)
+
+    game.version += 1
+    return [cell]
+
+
+def _get_move_event(game: Game, board: Board, row: int, column: int) -> GameEventsType:
+    cell = row * board.columns + column
+
+    if board.is_revealed(cell):
+        if board.is_mine(cell):
+            return "reveal mine"
+        if game.state == "won":
+            return "reveal last cell - win"
+        return "reveal cell"
+
+    return "flag cell" if board.is_flagged(cell) else "unflag cell"
+
+
+def _create_move_event(
+    game: Game, board: Board, row: int, column: int, user: str
+) -> dict:
+    # Fields of the GameEvents row of a move, right after the move was applied
+    return {
+        "row": row,
+        "column": column,
+        "event": _get_move_event(game, board, row, column),
+        "user": user,
+    }
+
+
+def _apply_moves(
+    game: Game, board: Board, moves: Iterable[GameMove]
+) -> tuple[set[int], list[dict]]:
+    """
+    Apply a batch of moves in order, skipping the invalid ones.
+    Returns the cells that changed and the events of the applied moves.
+
+    The whole batch counts as a single update of the game version, so clients
+    following the versions see one update per broadcast.
+    """
+    version = game.version
+    changed: set[int] = set()
+    events = []
+
+    for move in moves:
+        row, column = move["row"], move["column"]
+        if move["type"] == "chord":
+            chord = _apply_chord(game, board, row, column, move["user"])
+            if chord is not None:
+                changed.update(chord[0])
+                events.extend(chord[1])
+            continue
+
+        if move["type"] == "flag":
+            move_changed = _apply_flag(game, board, row, column)
+        else:
+            move_changed = _apply_move(game, board, row, column)
+        if move_changed is None:
+            continue
+
+        changed.update(move_changed)
+        events.append(_create_move_event(game, board, row, column, move["user"]))
+
+    if events:
+        game.version = version + 1
+    return changed, events
+
+
+def _run_move(
+    code: str,
+    apply_move: Callable[[Game, Board], tuple[Iterable[int], list[dict]] | None],
+    tracked: metrics.Tracked,
+) -> tuple[Game, Board, Iterable[int]] | None:
+    """
+    Apply a move to the latest state of the game and save it, together with the
+    events of the move in the event outbox. The board size is set on the tracked
+    operation once the game is loaded, invalid moves included.
+
+    No lock is held while the move is computed: the game row is only updated if
+    its version didn't change in between, otherwise another move won the race
+    and this one is applied again on top of it, up to GAME_MOVE_MAX_RETRIES times.
+    Once committed, the new version is cached, see game.map_cache.
+    """
+    for attempt in range(settings.GAME_MOVE_MAX_RETRIES + 1):
+        game = _get_game_by_code(code)
+        tracked.cells = game.rows * game.columns
+        if game.state != "ongoing":
+            return None
+
+        board = load_board(game)
+        version = game.version
+
+        try:
+            with transaction.atomic():
+                result = apply_move(game, board)
+                if result is None:
+                    return None
+
+                changed, events = result
+                save_board(game, board, GAME_MOVE_FIELDS, expected_version=version)
+                GameEventOutbox.objects.bulk_create(
+                    GameEventOutbox(game=game, **event) for event in events
+                )
+                # The game was ongoing when loaded, so this move ended it
+                if game.state != "ongoing":
+                    stats.record_finished_game(game)
+        except GameVersionConflict:
+            if attempt == settings.GAME_MOVE_MAX_RETRIES:
+                raise
+            logger.debug(f"Retrying move on game {code} after a version conflict")
+            continue
+
+        cache_game_version(code, game.version, game.state == "ongoing")
+        return game, board, changed
+
+    return None
+
+
+def play_move(code: str, row: int, column: int, user: str, with_map: bool = True):
+    def apply_move(game: Game, board: Board):
+        changed = _apply_move(game, board, row, column)
+        if changed is None:
+            return None
+        return changed, [_create_move_event(game, board, row, column, user)]
+
+    with metrics.track("play_move") as tracked:
+        applied = _run_move(code, apply_move, tracked)
+        if applied is None:
+            return None
+
+        game_map_state = _get_game_map(*applied, with_map=with_map)
+        _update_cached_game_map(game_map_state)
+    return game_map_state
+
+
+def change_flag(code: str, row: int, column: int, user: str, with_map: bool = True):
+    def apply_flag(game: Game, board: Board):
+        changed = _apply_flag(game, board, row, column)
+        if changed is None:
+            return None
+        return changed, [_create_move_event(game, board, row, column, user)]
+
+    with metrics.track("change_flag") as tracked:
+        applied = _run_move(code, apply_flag, tracked)
+        if applied is None:
+            return None
+
+        game_map_state = _get_game_map(*applied, with_map=with_map)
+        _update_cached_game_map(game_map_state)
+    return game_map_state
 
-    create_game_event.delay(game.id, row, column, user)
 
-    return _get_game_map(game)
+def chord(code: str, row: int, column: int, user: str, with_map: bool = True):
+    """
+    Reveal the neighbours of a number with all its flags placed, in a single
+    transaction with a single batch of events and a single map update.
+    """
+
+    def apply_chord(game: Game, board: Board):
+        return _apply_chord(game, board, row, column, user)
+
+    with metrics.track("chord") as tracked:
+        applied = _run_move(code, apply_chord, tracked)
+        if applied is None:
+            return None
+
+        game_map_state = _get_game_map(*applied, with_map=with_map)
+        _update_cached_game_map(game_map_state)
+    return game_map_state
+
+
+def play_moves(code: str, moves: list[GameMove], with_map: bool = True):
+    """
+    Apply the moves received for a game within a tick in a single transaction,
+    with a single batch of events and a single map update.
+    """
+
+    def apply_moves(game: Game, board: Board):
+        changed, events = _apply_moves(game, board, moves)
+        return (changed, events) if events else None
+
+    with metrics.track("play_moves") as tracked:
+        applied = _run_move(code, apply_moves, tracked)
+        if applied is None:
+            return None
+
+        game_map_state = _get_game_map(*applied, with_map=with_map)
+        _update_cached_game_map(game_map_state)
+    return game_map_state
+
+
+def _update_cached_game_map(game_map_state: GameMapState):
+    # States without their map aren't cached, the next read renders the map of
+    # the new version
+    if game_map_state["map"] or game_map_state["tile_size"]:
+        cache_game_map(game_map_state)
+
+
+def get_game_tile(code: str, tile_row: int, tile_column: int) -> dict | None:
+    """
+    Map of a single tile of a tiled game, None if the game isn't tiled or the
+    tile is outside the board.
+    """
+    game = _get_game_by_code(code)
+    if game.storage != Game.Storage.TILED:
+        return None
+    if not (0 <= tile_row * game.tile_size < game.rows) or not (
+        0 <= tile_column * game.tile_size < game.columns
+    ):
+        return None
+
+    return {
+        "code": game.code,
+        "state": game.state,
+        "version": game.version,
+        "tile_size": game.tile_size,
+        "tile_row": tile_row,
+        "tile_column": tile_column,
+        "map": _get_tile_map(game, load_board(game), tile_row, tile_column),
+    }
+
+
+def get_game_events(
+    code: str, after: str | None, limit: int
+) -> Iterator[replay.ReplayEvent]:
+    """
+    Stream a page of the events of a game, after the event of the `after`
+    cursor, formatted as "index:id" by _get_event_cursor.
+    Raises ValueError for an invalid cursor.
+    """
+    game = _get_game_by_code(code)
+    cursor = None
+    if after:
+        index, event_id = after.split(":")
+        cursor = int(index), int(event_id)
+    return replay.iter_events(game, cursor, limit)
+
+
+def get_event_cursor(event: replay.ReplayEvent) -> str:
+    return f"{event['index']}:{event['id']}"
+
+
+def get_game_snapshot(code: str, events: int) -> dict | None:
+    """
+    Map of a game once its first `events` events are applied, None for tiled
+    games, which are too large to be replayed on demand.
+    Raises replay.MissingSeedError for games created without a seed.
+    """
+    game = _get_game_by_code(code)
+    if game.storage == Game.Storage.TILED:
+        return None
+
+    board, state, applied = replay.replay_events(game, events)
+    # Mines are shown as they were at that point of the game
+    game = copy.copy(game)
+    game.state = state
+    return {
+        "code": game.code,
+        "state": state,
+        "events": applied,
+        "map": _create_game_map_from_existing_game(game, board),
+    }
@@ -1,11 +1,22 @@
 import json
+from django.conf import settings
 from django.views.decorators.http import require_POST
-from django.http import JsonResponse
-
-from game.use_cases import create_new_game, get_game_map_by_code, play_move, change_flag
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+
+from game import engine, metrics, stats, use_cases
+from game.board import GameVersionConflict
+from game.encoding import encode_game_map_state, get_encoding
+from game.models import DifficultyStats, Game, UserStats
+from game.replay import MissingSeedError
+from game.use_cases import create_new_game
 from game.utils import deprecated_view
 
 
+def _get_moves_module():
+    # Games held by the in-process engine must be read and played through it
+    return engine if settings.GAME_ENGINE_ENABLED else use_cases
+
+
 @require_POST
 def new_game(request):
     """
@@ -16,6 +27,7 @@ def new_game(request):
 
     Raises:
         JsonResponse: If the request body contains invalid JSON or missing required parameters.
+        JsonResponse(status=400): If the board has no rows or columns, or no cell without a mine.
 
     Payload Body Params:
         - rows (int): The number of rows in the game grid.
@@ -43,9 +55,16 @@ def new_game(request):
     if not all(key in data for key in ("rows", "columns", "mines")):
         return JsonResponse({"error": "Missing required parameters"}, status=400)
 
-    rows = int(data["rows"])
-    columns = int(data["columns"])
-    mines = int(data["mines"])
+    try:
+        rows = int(data["rows"])
+        columns = int(data["columns"])
+        mines = int(data["mines"])
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "Invalid parameters"}, status=400)
+
+    # The first reveal needs a safe cell, lazy games place the mines around it
+    if rows < 1 or columns < 1 or not 0 <= mines < rows * columns:
+        return JsonResponse({"error": "Invalid board size"}, status=400)
 
     game_code = create_new_game(rows, columns, mines)
     return JsonResponse({"code": game_code})
@@ -58,13 +77,48 @@ def game(request, game_code):
     Args:
         game_code (str): The code of the game to retrieve.
 
+    Query Params:
+        - encoding (str): "compact" to encode each cell as one character, see game.encoding.
+
     Returns:
         JsonResponse: The JSON response containing the game map state.
     """
-    game_map_state = get_game_map_by_code(game_code)
+    game_map_state = _get_moves_module().get_game_map_by_code(game_code)
+
+    if get_encoding(request.GET.get("encoding")) == "compact":
+        return JsonResponse(encode_game_map_state(dict(game_map_state)))
     return JsonResponse(game_map_state)
 
 
+def game_tile(request, game_code, tile_row, tile_column):
+    """
+    Retrieve a single tile of a tiled game, used for boards too large to be sent
+    as a whole.
+
+    Args:
+        game_code (str): The code of the game.
+        tile_row (int): The row of the tile, counted in tiles.
+        tile_column (int): The column of the tile, counted in tiles.
+
+    Query Params:
+        - encoding (str): "compact" to encode each cell as one character, see game.encoding.
+
+    Returns:
+        JsonResponse: The game state and version, with the map of the tile.
+
+    Raises:
+        JsonResponse(status=404): If the game isn't tiled or the tile is outside the board.
+    """
+    tile = use_cases.get_game_tile(game_code, tile_row, tile_column)
+
+    if tile is None:
+        return JsonResponse({"error": "Tile not found"}, status=404)
+
+    if get_encoding(request.GET.get("encoding")) == "compact":
+        return JsonResponse(encode_game_map_state(tile))
+    return JsonResponse(tile)
+
+
 @deprecated_view
 @require_POST
 def move(request, game_code):
@@ -81,6 +135,7 @@ def move(request, game_code):
         JsonResponse(status=400): If the request body contains invalid JSON.
         JsonResponse(status=400): If the required parameters (row and column) are missing.
         JsonResponse(status=400): If the move is invalid.
+        JsonResponse(status=409): If other moves kept changing the game while it was applied.
 
     Deprecated: This view is deprecated in favor of the WebSocket consumer.
     """
@@ -96,7 +151,10 @@ def move(request, game_code):
     column = int(data["column"])
     user = data["user"]
 
-    game_map_state = play_move(game_code, row, column, user)
+    try:
+        game_map_state = _get_moves_module().play_move(game_code, row, column, user)
+    except GameVersionConflict:
+        return JsonResponse({"error": "Game is busy, try again"}, status=409)
 
     if game_map_state is None:
         return JsonResponse({"error": "Invalid move"}, status=400)
@@ -120,6 +178,7 @@ def flip_flag(request, game_code):
         JsonResponse(status=400): If the request body contains invalid JSON.
         JsonResponse(status=400): If the required parameters (row and column) are missing.
         JsonResponse(status=400): If it can't flip the flag value.
+        JsonResponse(status=409): If other moves kept changing the game while it was applied.
 
     Deprecated: This view is deprecated in favor of the WebSocket consumer.
     """
@@ -135,8 +194,209 @@ def flip_flag(request, game_code):
     column = int(data["column"])
     user = data["user"]
 
-    game_map_state = change_flag(game_code, row, column, user)
+    try:
+        game_map_state = _get_moves_module().change_flag(game_code, row, column, user)
+    except GameVersionConflict:
+        return JsonResponse({"error": "Game is busy, try again"}, status=409)
 
     if game_map_state is None:
         return JsonResponse({"error": "Cannot flip flag value"}, status=400)
     return JsonResponse(game_map_state)
+
+
+def game_events(request, game_code):
+    """
+    Stream the events of a game in chronological order, a page at a time.
+
+    Args:
+        game_code (str): The code of the game.
+
+    Query Params:
+        - after (str): The "next" cursor of the previous page, omitted for the first page.
+        - limit (int): The number of events of the page, from 1 to at most GAME_REPLAY_MAX_PAGE_SIZE.
+
+    Returns:
+        StreamingHttpResponse: The events, each with its index in the game
+        history, and the cursor of the next page, null on the last page.
+
+    Raises:
+        JsonResponse(status=400): If the cursor or the limit is invalid.
+        JsonResponse(status=404): If the game doesn't exist.
+    """
+    try:
+        limit = min(
+            int(request.GET.get("limit", settings.GAME_REPLAY_MAX_PAGE_SIZE)),
+            settings.GAME_REPLAY_MAX_PAGE_SIZE,
+        )
+        if limit < 1:
+            raise ValueError(f"Invalid limit {limit}")
+        events = use_cases.get_game_events(game_code, request.GET.get("after"), limit)
+        first = next(events, None)
+    except Game.DoesNotExist:
+        return JsonResponse({"error": "Game not found"}, status=404)
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor or limit"}, status=400)
+
+    def stream():
+        yield '{"events": ['
+        last, count = first, 0
+        if first is not None:
+            yield json.dumps(first)
+            count = 1
+            for event in events:
+                yield "," + json.dumps(event)
+                last, count = event, count + 1
+        cursor = use_cases.get_event_cursor(last) if last and count == limit else None
+        yield f'], "next": {json.dumps(cursor)}}}'
+
+    return StreamingHttpResponse(stream(), content_type="application/json")
+
+
+def game_snapshot(request, game_code, events):
+    """
+    Retrieve the map of a game as it was after a number of events, to replay
+    the game move by move.
+
+    Args:
+        game_code (str): The code of the game.
+        events (int): The number of events applied, the index of the last one.
+
+    Returns:
+        JsonResponse: The state and the map of the game, and the number of events applied.
+
+    Raises:
+        JsonResponse(status=400): If the game is tiled or has no seed to be replayed from.
+        JsonResponse(status=404): If the game doesn't exist.
+    """
+    try:
+        snapshot = use_cases.get_game_snapshot(game_code, events)
+    except Game.DoesNotExist:
+        return JsonResponse({"error": "Game not found"}, status=404)
+    except MissingSeedError:
+        snapshot = None
+
+    if snapshot is None:
+        return JsonResponse({"error": "Game can't be replayed"}, status=400)
+    return JsonResponse(snapshot)
+
+
+def _parse_difficulty(params) -> tuple[int, int, int] | None:
+    try:
+        return int(params["rows"]), int(params["columns"]), int(params["mines"])
+    except (KeyError, ValueError):
+        return None
+
+
+def leaderboard(request):
+    """
+    Retrieve the fastest wins of a board size.
+
+    Query Params:
+        - rows (int), columns (int), mines (int): The board size.
+        - limit (int): The number of wins, 10 by default and at most 100.
+
+    Returns:
+        JsonResponse: The wins, fastest first, with the users who made moves in them.
+
+    Raises:
+        JsonResponse(status=400): If the board size is missing or invalid.
+    """
+    difficulty = _parse_difficulty(request.GET)
+    if difficulty is None:
+        return JsonResponse({"error": "Missing required parameters"}, status=400)
+    try:
+        limit = min(int(request.GET.get("limit", 10)), 100)
+    except ValueError:
+        return JsonResponse({"error": "Invalid limit"}, status=400)
+
+    entries = stats.get_leaderboard(*difficulty, limit)
+    return JsonResponse(
+        {
+            "wins": [
+                {
+                    "code": Game(id=entry.game_id).code,
+                    "duration_seconds": entry.duration_seconds,
+                    "users": entry.users,
+                }
+                for entry in entries
+            ]
+        }
+    )
+
+
+def difficulty_stats(request):
+    """
+    Retrieve the statistics of the finished games of a board size.
+
+    Query Params:
+        - rows (int), columns (int), mines (int): The board size.
+
+    Returns:
+        JsonResponse: The games finished and won, the win rate, the average
+        duration and the fastest win, in seconds.
+
+    Raises:
+        JsonResponse(status=400): If the board size is missing or invalid.
+    """
+    difficulty = _parse_difficulty(request.GET)
+    if difficulty is None:
+        return JsonResponse({"error": "Missing required parameters"}, status=400)
+
+    rows, columns, mines = difficulty
+    totals = DifficultyStats.objects.filter(
+        rows=rows, columns=columns, mines=mines
+    ).first() or DifficultyStats(rows=rows, columns=columns, mines=mines)
+    finished = totals.games_finished
+    return JsonResponse(
+        {
+            "rows": rows,
+            "columns": columns,
+            "mines": mines,
+            "games_finished": finished,
+            "games_won": totals.games_won,
+            "win_rate": totals.games_won / finished if finished else None,
+            "average_duration_seconds": (
+                totals.total_duration_seconds / finished if finished else None
+            ),
+            "fastest_win_seconds": totals.fastest_win_seconds,
+        }
+    )
+
+
+def user_stats(request, user):
+    """
+    Retrieve the statistics of the finished games a user made moves in.
+
+    Args:
+        user (str): The name of the user.
+
+    Returns:
+        JsonResponse: The games finished and won, the win rate and the moves.
+    """
+    totals = UserStats.objects.filter(user=user).first() or UserStats(user=user)
+    finished = totals.games_finished
+    return JsonResponse(
+        {
+            "user": user,
+            "games_finished": finished,
+            "games_won": totals.games_won,
+            "win_rate": totals.games_won / finished if finished else None,
+            "moves": totals.moves,
+        }
+    )
+
+
+def metrics_view(request):
+    """
+    Serve the metrics of the game operations recorded by this process, in the
+    Prometheus text format.
+
+    Returns:
+        HttpResponse: The metrics, as text.
+
+    Raises:
+        JsonResponse(status=404): If GAME_METRICS_ENABLED is off.
+    """
+    if not settings.GAME_METRICS_ENABLED:
+        return JsonResponse({"error": "Metrics are disabled"}, status=404)
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4")